@@ -0,0 +1,9 @@
+"""
+Benchmarks of the two-wheeler pipeline, run with `airspeed velocity <https://asv.readthedocs.io>`__:
+
+    asv run                  # benchmark the latest commit of `master`
+    asv continuous master HEAD   # compare two commits
+    asv publish && asv preview   # browse the results of all commits benchmarked
+
+Results are stored per commit in `.asv/results`.
+"""
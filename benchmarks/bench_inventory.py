@@ -0,0 +1,73 @@
+"""
+Benchmarks of the inventory: building and filling in the A matrix,
+calculating the impacts and exporting the inventories.
+"""
+
+from carculator_two_wheeler import InventoryTwoWheeler, TwoWheelerModel
+
+from .common import N_SIZES, get_array
+
+# the dense A matrix takes about 150 MB per iteration
+ITERATIONS = [1, 5]
+
+
+class Inventory:
+    params = (N_SIZES, ITERATIONS)
+    param_names = ["sizes", "iterations"]
+
+    def setup(self, n_sizes, iterations):
+        self.model = TwoWheelerModel(get_array(n_sizes, iterations))
+        self.model.set_all()
+
+        self.dense = InventoryTwoWheeler(self.model, sparse=False)
+        self.inventory = InventoryTwoWheeler(self.model)
+
+    def time_build(self, n_sizes, iterations):
+        InventoryTwoWheeler(self.model)
+
+    def peakmem_build(self, n_sizes, iterations):
+        InventoryTwoWheeler(self.model)
+
+    def time_calculate_impacts(self, n_sizes, iterations):
+        self.inventory.calculate_impacts()
+
+    def peakmem_calculate_impacts(self, n_sizes, iterations):
+        self.inventory.calculate_impacts()
+
+    def time_calculate_impacts_dense(self, n_sizes, iterations):
+        self.dense.calculate_impacts()
+
+
+class FillInAMatrix:
+    params = (N_SIZES, ITERATIONS)
+    param_names = ["sizes", "iterations"]
+
+    # `setup` runs before each sample: the A matrix of a new inventory
+    # is filled in once per sample, without copying it in the timed call
+    number = 1
+    warmup_time = 0
+
+    def setup(self, n_sizes, iterations):
+        model = TwoWheelerModel(get_array(n_sizes, iterations))
+        model.set_all()
+
+        self.inventory = InventoryTwoWheeler(model, sparse=False)
+
+    def time_fill_in_A_matrix(self, n_sizes, iterations):
+        self.inventory.fill_in_A_matrix()
+
+
+class Export:
+    params = ["brightway2", "simapro"]
+    param_names = ["software"]
+
+    def setup(self, software):
+        model = TwoWheelerModel(get_array(1, 1))
+        model.set_all()
+        self.inventory = InventoryTwoWheeler(model)
+
+    def time_export_lci(self, software):
+        self.inventory.export_lci(software=software, format="string")
+
+    def peakmem_export_lci(self, software):
+        self.inventory.export_lci(software=software, format="string")
@@ -0,0 +1,42 @@
+"""
+Benchmarks of the two-wheeler model.
+"""
+
+from carculator_two_wheeler import TwoWheelerModel
+from carculator_two_wheeler.model import ENERGY_MODELS, ENERGY_RESULTS
+
+from .common import ITERATIONS, MAX_SIZES_ITERATIONS, N_SIZES, get_array
+
+
+class Model:
+    params = (N_SIZES, ITERATIONS)
+    param_names = ["sizes", "iterations"]
+
+    # `setup` runs before each sample, so that each call to `set_all` is timed
+    # with empty energy caches: no warmup, one call per sample
+    number = 1
+    warmup_time = 0
+
+    def setup(self, n_sizes, iterations):
+        if n_sizes * iterations > MAX_SIZES_ITERATIONS:
+            raise NotImplementedError("too large to be held in memory")
+
+        self.array = get_array(n_sizes, iterations)
+
+        self.model = TwoWheelerModel(self.array.copy())
+        self.model.set_all()
+
+        ENERGY_MODELS.clear()
+        ENERGY_RESULTS.clear()
+
+    def time_set_all(self, n_sizes, iterations):
+        TwoWheelerModel(self.array.copy()).set_all()
+
+    def peakmem_set_all(self, n_sizes, iterations):
+        TwoWheelerModel(self.array.copy()).set_all()
+
+    def track_mass_loop_passes(self, n_sizes, iterations):
+        return self.model.mass_loop_report.n_iterations
+
+    def time_calculate_cost_impacts(self, n_sizes, iterations):
+        self.model.calculate_cost_impacts()
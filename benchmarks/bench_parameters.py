@@ -0,0 +1,46 @@
+"""
+Benchmarks of the input parameters and of the model array.
+"""
+
+from carculator_two_wheeler import (
+    TwoWheelerInputParameters,
+    fill_xarray_from_input_parameters,
+)
+
+from .common import ITERATIONS, N_SIZES, SEED, get_input_parameters
+
+
+class InputParameters:
+    def time_construction(self):
+        TwoWheelerInputParameters()
+
+    def peakmem_construction(self):
+        TwoWheelerInputParameters()
+
+
+class Sampling:
+    params = [1, 10, 100, 1000]
+    param_names = ["iterations"]
+
+    def setup(self, iterations):
+        self.tip = TwoWheelerInputParameters()
+
+    def time_sampling(self, iterations):
+        if iterations == 1:
+            self.tip.static()
+        else:
+            self.tip.stochastic(iterations, seed=SEED)
+
+
+class FillArray:
+    params = (N_SIZES, ITERATIONS)
+    param_names = ["sizes", "iterations"]
+
+    def setup(self, n_sizes, iterations):
+        self.tip = get_input_parameters(n_sizes, iterations)
+
+    def time_fill_xarray_from_input_parameters(self, n_sizes, iterations):
+        fill_xarray_from_input_parameters(self.tip)
+
+    def peakmem_fill_xarray_from_input_parameters(self, n_sizes, iterations):
+        fill_xarray_from_input_parameters(self.tip)
@@ -0,0 +1,44 @@
+"""
+common.py contains the helpers shared by the benchmarks.
+"""
+
+from carculator_two_wheeler import (
+    TwoWheelerInputParameters,
+    fill_xarray_from_input_parameters,
+)
+
+SEED = 42
+
+# number of iterations of the input parameters (1: static run)
+ITERATIONS = [1, 10, 100]
+
+# number of sizes of two-wheelers, i.e., 3 powertrains and 6 years for each
+N_SIZES = [1, 3, 10]
+
+# largest number of sizes times iterations run through the model: the hot emissions
+# are calculated for each second of the driving cycle, which takes about 10 GB
+# for 10 sizes and 100 iterations
+MAX_SIZES_ITERATIONS = 300
+
+
+def get_scope(n_sizes: int) -> dict:
+    """Return a scope with the first `n_sizes` sizes of two-wheelers."""
+    return {"size": TwoWheelerInputParameters().sizes[:n_sizes]}
+
+
+def get_input_parameters(n_sizes: int, iterations: int) -> TwoWheelerInputParameters:
+    """Return input parameters for `n_sizes` sizes, drawn `iterations` times."""
+    tip = TwoWheelerInputParameters(scope=get_scope(n_sizes))
+    if iterations == 1:
+        tip.static()
+    else:
+        tip.stochastic(iterations, seed=SEED)
+    return tip
+
+
+def get_array(n_sizes: int, iterations: int):
+    """Return the model array for `n_sizes` sizes, with `iterations` values."""
+    _, array = fill_xarray_from_input_parameters(
+        get_input_parameters(n_sizes, iterations)
+    )
+    return array
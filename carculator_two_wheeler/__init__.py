@@ -17,13 +17,28 @@ __all__ = (
 )
 __version__ = (0, 1, 0, "dev0")
 
+from importlib import import_module
 from pathlib import Path
 
 DATA_DIR = Path(__file__).resolve().parent / "data"
 
+# public objects are only imported when first accessed,
+# so that `import carculator_two_wheeler` stays cheap
+_LAZY_IMPORTS = {
+    "fill_xarray_from_input_parameters": ".array",
+    "InventoryTwoWheeler": ".inventory",
+    "TwoWheelerModel": ".model",
+    "TwoWheelerInputParameters": ".two_wheelers_input_parameters",
+}
 
-from carculator_utils.array import fill_xarray_from_input_parameters
 
-from .inventory import InventoryTwoWheeler
-from .model import TwoWheelerModel
-from .two_wheelers_input_parameters import TwoWheelerInputParameters
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
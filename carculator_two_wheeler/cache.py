@@ -0,0 +1,584 @@
+"""
+cache.py contains the location of the on-disk cache, the compiled,
+binary form of the input parameter files, a content-addressed memo cache
+and the process-wide cache of the data files.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+# bump when the layout of compiled files changes
+COMPILED_FORMAT_VERSION = 1
+
+# keys kept as data by `klausen`, the others being metadata
+KLAUSEN_KEYS = {"kind", "uncertainty_type", "amount", "loc", "minimum", "maximum"}
+
+_compiled = {}
+
+
+def get_cache_dir() -> Path:
+    """
+    Return the directory of the on-disk cache, which can be set with
+    the environment variable `CARCULATOR_TWO_WHEELER_CACHE_DIR`.
+    Defaults to `~/.cache/carculator_two_wheeler`.
+    """
+    return Path(
+        os.environ.get(
+            "CARCULATOR_TWO_WHEELER_CACHE_DIR",
+            Path.home() / ".cache" / "carculator_two_wheeler",
+        )
+    )
+
+
+def _column_type(values) -> str:
+    """
+    Return the storage type of a column: "i" (integers), "f" (floats),
+    "s" (interned strings) or "j" (any other value, stored as interned JSON).
+    """
+    values = [v for v in values if v is not None]
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return "i"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return "f"
+    if all(isinstance(v, str) for v in values):
+        return "s"
+    return "j"
+
+
+class CompiledParameters:
+    """
+    Columnar form of a parameter file: one array per field, plus a table of unique strings.
+    Strings (and lists, stored as JSON strings) are interned: each record points
+    to an index in :attr:`strings`, so that repeated sources, comments, etc. are stored once.
+
+    On disk, a compiled file holds a JSON header (keys, strings and layout of the columns)
+    followed by the raw buffers of the columns, which are loaded without copy.
+
+    :ivar keys: keys of the parameters
+    :ivar columns: dictionary of field name: (type, values, mask of records holding the field)
+    :ivar strings: table of unique strings
+    :ivar extra: names of the extra parameters
+    :ivar summary: sorted sizes, powertrains, years, parameters and input parameters
+    """
+
+    MAGIC = b"C2WPARAM"
+
+    def __init__(self, keys, columns, strings, extra, summary):
+        self.keys = keys
+        self.columns = columns
+        self.strings = strings
+        self.extra = extra
+        self.summary = summary
+
+    @classmethod
+    def from_parameters(cls, parameters: dict, extra: list) -> "CompiledParameters":
+        keys = list(parameters)
+        fields = sorted({f for v in parameters.values() for f in v})
+
+        strings, index = [], {}
+
+        def intern(s):
+            if s not in index:
+                index[s] = len(strings)
+                strings.append(s)
+            return index[s]
+
+        columns = {}
+        for field in fields:
+            values = [parameters[k].get(field) for k in keys]
+            mask = np.array([field in parameters[k] for k in keys])
+            kind = _column_type(values)
+
+            if kind == "i":
+                data = np.array(
+                    [v if v is not None else 0 for v in values], dtype=np.int64
+                )
+            elif kind == "f":
+                data = np.array(
+                    [v if v is not None else np.nan for v in values], dtype=np.float64
+                )
+            else:
+                encode = (lambda v: v) if kind == "s" else json.dumps
+                data = np.array(
+                    [intern(encode(v)) if m else -1 for v, m in zip(values, mask)],
+                    dtype=np.int32,
+                )
+            columns[field] = (kind, data, mask)
+
+        # same as in `VehicleInputParameters.__init__()`
+        summary = {
+            "sizes": sorted(
+                {size for o in parameters.values() for size in o.get("sizes", [])}
+            ),
+            "powertrains": sorted(
+                {pt for o in parameters.values() for pt in o.get("powertrain", [])}
+            ),
+            "parameters": sorted(
+                {o["name"] for o in parameters.values()}.union(set(extra))
+            ),
+            "input_parameters": sorted({o["name"] for o in parameters.values()}),
+            "years": sorted({o["year"] for o in parameters.values()}),
+        }
+
+        return cls(keys, columns, strings, list(extra), summary)
+
+    def save(self, filepath: Path) -> None:
+        layout, buffers, offset = [], [], 0
+        for field, (kind, data, mask) in self.columns.items():
+            for array in (data, mask):
+                layout.append([field, kind, array.dtype.str, offset, len(array)])
+                buffers.append(array.tobytes())
+                offset += array.nbytes
+
+        header = json.dumps(
+            {
+                "version": COMPILED_FORMAT_VERSION,
+                "keys": self.keys,
+                "strings": self.strings,
+                "extra": self.extra,
+                "summary": self.summary,
+                "layout": layout,
+            }
+        ).encode("utf-8")
+
+        tmp = filepath.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            f.write(b"".join(buffers))
+        os.replace(tmp, filepath)
+
+    @classmethod
+    def load(cls, filepath: Path) -> "CompiledParameters":
+        content = Path(filepath).read_bytes()
+
+        if not content.startswith(cls.MAGIC):
+            raise ValueError(f"{filepath} is not a compiled parameter file.")
+
+        size = int.from_bytes(content[8:16], "little")
+        header = json.loads(content[16 : 16 + size])
+
+        if header["version"] != COMPILED_FORMAT_VERSION:
+            raise ValueError(f"{filepath} was compiled with another format version.")
+
+        start = 16 + size
+        arrays = {}
+        for field, kind, dtype, offset, count in header["layout"]:
+            arrays.setdefault(field, [kind]).append(
+                np.frombuffer(
+                    content, dtype=np.dtype(dtype), count=count, offset=start + offset
+                )
+            )
+
+        return cls(
+            header["keys"],
+            {field: tuple(v) for field, v in arrays.items()},
+            header["strings"],
+            header["extra"],
+            header["summary"],
+        )
+
+    def numbers(self, field: str, rows=None) -> np.ndarray:
+        """
+        Return the values of the numeric `field` for the records at positions `rows`
+        (all by default), as floats, NaN for the records without it.
+        """
+        kind, data, mask = self.columns[field]
+        if kind not in ("i", "f"):
+            raise TypeError(f"{field} is not a numeric field.")
+        if rows is not None:
+            data, mask = data[rows], mask[rows]
+        return np.where(mask, data, np.nan)
+
+    def decode(self, field: str, rows=None) -> list:
+        """
+        Return the values of `field` for the records at positions `rows` (all by default),
+        None for the records without it. Each interned string is decoded once,
+        hence lists are shared between records and must not be modified.
+        """
+        kind, data, mask = self.columns[field]
+        if rows is not None:
+            data, mask = data[rows], mask[rows]
+
+        if kind in ("i", "f"):
+            return [v if m else None for v, m in zip(data.tolist(), mask.tolist())]
+
+        decode = (lambda v: v) if kind == "s" else json.loads
+        cache = {i: decode(self.strings[i]) for i in np.unique(data[mask]).tolist()}
+        return [cache[i] if m else None for i, m in zip(data.tolist(), mask.tolist())]
+
+    def records(self, rows=None) -> dict:
+        """
+        Return the parameters in the form expected by `klausen`:
+        a dictionary of key: {data fields, "metadata": {other fields}}.
+
+        :param rows: positions of the records returned. All by default.
+        """
+        rows = np.arange(len(self.keys)) if rows is None else np.asarray(rows)
+        keys = [self.keys[i] for i in rows.tolist()]
+
+        decoded = {}
+        for field, (kind, data, mask) in self.columns.items():
+            data, mask = data[rows], mask[rows]
+            if kind in ("i", "f"):
+                values = data.tolist()
+            elif kind == "s":
+                values = [self.strings[i] if i >= 0 else None for i in data.tolist()]
+            else:
+                cache = {-1: None}
+                for i in set(data.tolist()) - {-1}:
+                    cache[i] = json.loads(self.strings[i])
+                values = [
+                    list(cache[i]) if isinstance(cache[i], list) else cache[i]
+                    for i in data.tolist()
+                ]
+            decoded[field] = (values, mask.tolist())
+
+        data_fields = [f for f in decoded if f in KLAUSEN_KEYS]
+        meta_fields = [f for f in decoded if f not in KLAUSEN_KEYS]
+
+        records = {}
+        for n, key in enumerate(keys):
+            record = {f: decoded[f][0][n] for f in data_fields if decoded[f][1][n]}
+            record["metadata"] = {
+                f: decoded[f][0][n] for f in meta_fields if decoded[f][1][n]
+            }
+            records[key] = record
+
+        return records
+
+
+def _content_hash(*filepaths) -> str:
+    digest = hashlib.sha256(str(COMPILED_FORMAT_VERSION).encode())
+    for filepath in filepaths:
+        digest.update(Path(filepath).read_bytes())
+    return digest.hexdigest()
+
+
+def load_compiled_parameters(parameters: Path, extra: Path) -> CompiledParameters:
+    """
+    Return the compiled form of the parameter files `parameters` and `extra`.
+
+    The compiled file is written in the cache directory (see :func:`get_cache_dir`)
+    on first use, under a name derived from a hash of the content of both files,
+    so that any change to them invalidates it. It is also kept in memory for the
+    lifetime of the process, as long as the modification times of the files do not change.
+    If the cache directory cannot be written to, the files are compiled in memory only.
+
+    :param parameters: path to a parameter file, e.g., `default_parameters.json`
+    :param extra: path to an extra parameter file, e.g., `extra_parameters.json`
+    :return: a :class:`CompiledParameters`
+    """
+    parameters, extra = Path(parameters), Path(extra)
+    stamp = tuple(
+        (str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in (parameters, extra)
+    )
+
+    if stamp in _compiled:
+        return _compiled[stamp]
+
+    filepath = get_cache_dir() / f"parameters-{_content_hash(parameters, extra)}.bin"
+
+    compiled = None
+    if filepath.exists():
+        try:
+            compiled = CompiledParameters.load(filepath)
+        except (OSError, ValueError, KeyError, TypeError):
+            compiled = None
+
+    if compiled is None:
+        with open(parameters, encoding="utf-8") as f:
+            params = json.load(f)
+        with open(extra, encoding="utf-8") as f:
+            extra_params = json.load(f)
+
+        compiled = CompiledParameters.from_parameters(params, extra_params)
+
+        try:
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            compiled.save(filepath)
+        except OSError:
+            pass
+
+    _compiled[stamp] = compiled
+
+    return compiled
+
+
+def package_versions() -> dict:
+    """
+    Return the versions of this package and of `carculator_utils`,
+    to be included in the keys of values cached on disk.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    from . import __version__
+
+    try:
+        utils_version = version("carculator_utils")
+    except PackageNotFoundError:
+        utils_version = "unknown"
+
+    return {
+        "carculator_two_wheeler": ".".join(map(str, __version__)),
+        "carculator_utils": utils_version,
+    }
+
+
+def hash_inputs(*items) -> str:
+    """
+    Return a hash of `items`, which can be arrays (numpy or xarray),
+    strings, numbers, None, or lists, tuples and dictionaries of those.
+    Arrays are hashed on their content, dtype, shape and, for xarray, coordinates.
+
+    :return: hexadecimal digest
+    """
+    digest = hashlib.blake2b(digest_size=20)
+
+    def update(item):
+        if hasattr(item, "dims") and hasattr(item, "values"):
+            update(item.dims)
+            update({d: item.coords[d].values for d in item.dims if d in item.coords})
+            update(item.values)
+        elif isinstance(item, np.ndarray):
+            digest.update(f"array{item.dtype.str}{item.shape}".encode())
+            if item.dtype == object:
+                update(item.tolist())
+            else:
+                digest.update(np.ascontiguousarray(item).tobytes())
+        elif isinstance(item, dict):
+            digest.update(b"dict")
+            for k in sorted(item, key=repr):
+                update(k)
+                update(item[k])
+        elif isinstance(item, (list, tuple)):
+            digest.update(f"{type(item).__name__}{len(item)}".encode())
+            for i in item:
+                update(i)
+        else:
+            digest.update(f"{type(item).__name__}:{item!r};".encode())
+
+    for item in items:
+        update(item)
+
+    return digest.hexdigest()
+
+
+def get_nbytes(value) -> int:
+    """
+    Return the size of the arrays (numpy or xarray) held by `value`,
+    directly or in tuples, lists and dictionaries.
+    """
+    if isinstance(value, dict):
+        return sum(get_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(get_nbytes(v) for v in value)
+    return getattr(value, "nbytes", 0)
+
+
+class MemoCache:
+    """
+    Content-addressed memo cache: values are stored under a hash of the inputs they were computed from
+    (see :func:`hash_inputs`). The most recently used values are kept in memory. If :attr:`directory`
+    is set, values are also pickled there and read back on a miss in memory.
+
+    :ivar maxsize: number of values kept in memory
+    :ivar max_bytes: size of the arrays held by the values kept in memory (see :func:`get_nbytes`),
+        or None for no limit. A value larger than that is not kept in memory.
+    :ivar directory: directory of the on-disk copy, or None to keep values in memory only
+    :ivar hits: number of values found in memory or on disk
+    :ivar misses: number of values not found
+    """
+
+    def __init__(
+        self, maxsize: int = 32, directory: Path = None, max_bytes: int = None
+    ):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._nbytes = {}
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the arrays held by the values kept in memory."""
+        return sum(self._nbytes.values())
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values or (
+            self.directory is not None and self._filepath(key).exists()
+        )
+
+    def _filepath(self, key) -> Path:
+        return Path(self.directory) / f"{key}.pkl"
+
+    def get(self, key, default=None):
+        if key in self._values:
+            self._values.move_to_end(key)
+            self.hits += 1
+            return self._values[key]
+
+        if self.directory is not None:
+            try:
+                with open(self._filepath(key), "rb") as f:
+                    value = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+            else:
+                self.hits += 1
+                self._remember(key, value)
+                return value
+
+        self.misses += 1
+        return default
+
+    def set(self, key, value, persist: bool = True) -> None:
+        """
+        Store `value` under `key`.
+
+        :param persist: if False, the value is only kept in memory
+        """
+        self._remember(key, value)
+
+        if persist and self.directory is not None:
+            filepath = self._filepath(key)
+            try:
+                filepath.parent.mkdir(parents=True, exist_ok=True)
+                tmp = filepath.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmp, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, filepath)
+            except OSError:
+                pass
+
+    def _remember(self, key, value):
+        nbytes = get_nbytes(value)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+
+        self._values[key] = value
+        self._nbytes[key] = nbytes
+        self._values.move_to_end(key)
+
+        while len(self._values) > self.maxsize or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        ):
+            evicted, _ = self._values.popitem(last=False)
+            del self._nbytes[evicted]
+
+    def clear(self, disk: bool = False) -> None:
+        """
+        Empty the cache in memory and, if `disk` is True, on disk.
+        """
+        self._values.clear()
+        self._nbytes.clear()
+        if disk and self.directory is not None:
+            for filepath in Path(self.directory).glob("*.pkl"):
+                filepath.unlink(missing_ok=True)
+
+
+class FrozenDict(dict):
+    """
+    Dictionary which cannot be modified, as returned by :class:`DataFileCache`.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(
+            "Data files are shared by the whole process and cannot be modified. "
+            "Copy them first."
+        )
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+def freeze(value):
+    """
+    Return `value` with its dictionaries turned into :class:`FrozenDict` and its lists into tuples.
+    """
+    if isinstance(value, dict):
+        return FrozenDict({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class DataFileCache:
+    """
+    Process-wide cache of parsed YAML and JSON data files, e.g., those of :data:`DATA_DIR`
+    or of the data directory of `carculator_utils`. Each file is parsed once, and parsed again
+    only if its modification time or size changes. Parsed contents are frozen (see :func:`freeze`),
+    since they are shared by all callers.
+
+    :ivar hits: number of files served from memory
+    :ivar misses: number of files parsed
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._contents = {}
+
+    def __len__(self):
+        return len(self._contents)
+
+    def load(self, filepath):
+        """
+        Return the parsed, frozen content of the YAML or JSON file `filepath`.
+
+        :param filepath: path to a `.yaml`, `.yml` or `.json` file
+        """
+        filepath = Path(filepath).resolve()
+        stat = filepath.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self._contents.get(filepath)
+        if cached is not None and cached[0] == stamp:
+            self.hits += 1
+            return cached[1]
+
+        with open(filepath, "r", encoding="utf-8") as stream:
+            if filepath.suffix == ".json":
+                content = json.load(stream)
+            else:
+                content = yaml.safe_load(stream)
+
+        self.misses += 1
+        content = freeze(content)
+        self._contents[filepath] = (stamp, content)
+
+        return content
+
+    def clear(self) -> None:
+        self._contents.clear()
+
+
+# data files parsed by the package
+DATA_FILES = DataFileCache()
+
+
+def load_data_file(filepath):
+    """
+    Return the parsed content of a YAML or JSON data file, from :data:`DATA_FILES`.
+    The content cannot be modified.
+    """
+    return DATA_FILES.load(filepath)
@@ -0,0 +1,453 @@
+"""
+export.py contains the functions to stream the exchanges of an inventory, one batch at a time,
+to columnar files, with the values of each iteration written to memory-mapped presample files,
+or to a SQLite database.
+"""
+
+import json
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from .sparse_matrix import StackedSparseMatrix
+
+# number of exchanges per batch, i.e., per row group of the Parquet file
+EXPORT_BATCH_SIZE = 2**16
+
+# number of iterations per presample file
+PRESAMPLES_CHUNK_SIZE = 100
+
+EXCHANGE_TYPES = ("production", "technosphere", "biosphere")
+
+# tables of the SQLite export, see `export_to_sqlite`
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flows (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    location TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    reference_product TEXT NOT NULL,
+    biosphere INTEGER NOT NULL,
+    UNIQUE (name, location, unit, reference_product)
+);
+CREATE TABLE IF NOT EXISTS exchanges (
+    database TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    activity INTEGER NOT NULL REFERENCES flows (id),
+    flow INTEGER NOT NULL REFERENCES flows (id),
+    type TEXT NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (database, year, activity, flow)
+);
+CREATE TABLE IF NOT EXISTS presamples (
+    database TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    activity INTEGER NOT NULL,
+    flow INTEGER NOT NULL,
+    dtype TEXT NOT NULL,
+    amounts BLOB NOT NULL,
+    PRIMARY KEY (database, year, activity, flow)
+);
+"""
+
+# created once the exchanges are loaded
+SQLITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS exchanges_flow ON exchanges (flow);
+CREATE INDEX IF NOT EXISTS exchanges_activity ON exchanges (activity);
+"""
+
+
+def flow_table(inventory) -> dict:
+    """
+    Return the products and biosphere flows of `inventory`, i.e., the rows of its A matrix,
+    as a dictionary of columns: "flow" (row index), "name", "location" (or, for biosphere flows,
+    the categories, joined by "::"), "unit", "reference product" (empty for biosphere flows)
+    and "biosphere".
+    """
+    labels = [inventory.rev_inputs[i] for i in range(len(inventory.rev_inputs))]
+    biosphere = [isinstance(label[1], tuple) for label in labels]
+
+    return {
+        "flow": np.arange(len(labels), dtype=np.int32),
+        "name": [label[0] for label in labels],
+        "location": [
+            "::".join(label[1]) if bio else label[1]
+            for label, bio in zip(labels, biosphere)
+        ],
+        "unit": [label[2] for label in labels],
+        "reference product": [
+            "" if bio else label[3] for label, bio in zip(labels, biosphere)
+        ],
+        "biosphere": np.array(biosphere),
+    }
+
+
+def _stacked(A) -> StackedSparseMatrix:
+    return (
+        A if isinstance(A, StackedSparseMatrix) else StackedSparseMatrix.from_dense(A)
+    )
+
+
+def exchange_positions(inventory, year: int) -> np.ndarray:
+    """
+    Return the positions, among the entries of the (sparse) A matrix of `inventory`,
+    of the exchanges exported for `year`: those which are not zero for at least one iteration,
+    of the activities with other exchanges than their reference product, as in
+    :meth:`carculator_utils.export.ExportInventory.write_lci`. Sorted by activity.
+    """
+    return _exchange_positions(
+        _stacked(inventory.A), inventory.scope["year"].index(year)
+    )
+
+
+def _exchange_positions(A: StackedSparseMatrix, y: int) -> np.ndarray:
+    nonzero = np.zeros(A.nnz, dtype=bool)
+    for start in range(0, A.nnz, EXPORT_BATCH_SIZE):
+        block = slice(start, start + EXPORT_BATCH_SIZE)
+        nonzero[block] = (A.data[block, :, y] != 0).any(axis=1)
+
+    columns = np.repeat(np.arange(A.shape[2]), np.diff(A.indptr))
+    counts = np.bincount(columns[nonzero], minlength=A.shape[2])
+
+    return np.flatnonzero(nonzero & (counts[columns] > 1))
+
+
+def iter_exchanges(inventory, years: list = None, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yield the exchanges of `inventory`, `batch_size` at a time, as dictionaries of columns:
+    "year", "activity" (column of the A matrix), "flow" (row of the A matrix, see :func:`flow_table`),
+    "type" (position in :data:`EXCHANGE_TYPES`), "amount" and "values".
+    Amounts are positive for inputs and for the production of the reference product,
+    as in :meth:`carculator_utils.export.ExportInventory.write_lci`. "values" holds
+    the amount of each iteration, of shape (exchanges, iterations), and "amount" their median.
+
+    :param years: years to export, all those of the inventory by default
+    :param batch_size: number of exchanges per batch
+    """
+    A = _stacked(inventory.A)
+    columns = np.repeat(np.arange(A.shape[2]), np.diff(A.indptr))
+    biosphere = flow_table(inventory)["biosphere"]
+
+    for year in years or inventory.scope["year"]:
+        y = inventory.scope["year"].index(year)
+        positions = _exchange_positions(A, y)
+
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start : start + batch_size]
+            flow, activity = A.indices[batch], columns[batch]
+
+            types = np.where(
+                flow == activity, 0, np.where(biosphere[flow], 2, 1)
+            ).astype(np.int8)
+            values = A.data[batch, :, y] * np.where(types == 0, 1, -1)[:, None]
+
+            yield {
+                "year": np.full(len(batch), year, dtype=np.int32),
+                "activity": activity.astype(np.int32),
+                "flow": flow.astype(np.int32),
+                "type": types,
+                "amount": np.median(values, axis=1),
+                "values": values,
+            }
+
+
+def export_to_parquet(
+    inventory,
+    directory,
+    years: list = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    presamples_chunk_size: int = PRESAMPLES_CHUNK_SIZE,
+) -> dict:
+    """
+    Export the exchanges of `inventory` to `directory`, streamed one batch at a time:
+
+    * "flows.parquet", the table of the products and biosphere flows (see :func:`flow_table`),
+    * "exchanges.parquet", one row group per batch of exchanges (see :func:`iter_exchanges`),
+    * in stochastic mode, "presamples", the amounts of each exchange (rows, in the order
+      of "exchanges.parquet") and iteration (columns), in memory-mapped `.npy` files
+      of `presamples_chunk_size` iterations (see :class:`Presamples`).
+
+    Requires `pyarrow`.
+
+    :param years: years to export, all those of the inventory by default
+    :param batch_size: number of exchanges per row group
+    :param presamples_chunk_size: number of iterations per presample file
+    :return: a dictionary with the paths of the "flows", "exchanges" and, if any, "presamples"
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as err:
+        raise ImportError(
+            "Exporting to Parquet requires `pyarrow`, e.g., `pip install pyarrow`."
+        ) from err
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    years = years or inventory.scope["year"]
+    paths = {
+        "flows": directory / "flows.parquet",
+        "exchanges": directory / "exchanges.parquet",
+    }
+
+    pq.write_table(pa.table(flow_table(inventory)), paths["flows"])
+
+    presamples = None
+    if inventory.iterations > 1:
+        A = _stacked(inventory.A)
+        n_exchanges = sum(
+            len(_exchange_positions(A, inventory.scope["year"].index(y))) for y in years
+        )
+        paths["presamples"] = directory / "presamples"
+        presamples = Presamples.allocate(
+            paths["presamples"],
+            n_exchanges,
+            inventory.iterations,
+            presamples_chunk_size,
+            A.dtype,
+        )
+
+    types = pa.array(EXCHANGE_TYPES)
+    schema = pa.schema(
+        [
+            ("year", pa.int32()),
+            ("activity", pa.int32()),
+            ("flow", pa.int32()),
+            ("type", pa.dictionary(pa.int8(), pa.string())),
+            ("amount", pa.float64()),
+        ]
+    )
+
+    row = 0
+    with pq.ParquetWriter(paths["exchanges"], schema) as writer:
+        for batch in iter_exchanges(inventory, years, batch_size):
+            values = batch.pop("values")
+            batch["type"] = pa.DictionaryArray.from_arrays(batch["type"], types)
+            writer.write_table(pa.table(batch, schema=schema))
+
+            if presamples is not None:
+                presamples.write(values, row)
+            row += len(values)
+
+    if presamples is not None:
+        presamples.flush()
+
+    return paths
+
+
+class Presamples:
+    """
+    Amounts of exchanges (rows) for each iteration (columns), stored in memory-mapped `.npy`
+    files of a fixed number of iterations, listed in "presamples.json". Files are only read
+    from disk as they are used.
+
+    .. code-block:: python
+
+        presamples = Presamples(directory / "presamples")
+        presamples[:, 42]  # amounts of all exchanges in the 43rd iteration
+        for start, chunk in presamples.chunks():
+            ...
+
+    :ivar directory: directory of the files
+    :ivar shape: (exchanges, iterations)
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        metadata = json.loads((self.directory / "presamples.json").read_text())
+        self.shape = tuple(metadata["shape"])
+        self.starts = [f["start"] for f in metadata["files"]]
+        self._files = [self.directory / f["file"] for f in metadata["files"]]
+        self._chunks = {}
+
+    @classmethod
+    def allocate(
+        cls, directory, n_exchanges, iterations, chunk_size, dtype
+    ) -> "Presamples":
+        """
+        Create the files of `n_exchanges` exchanges and `iterations` iterations,
+        `chunk_size` iterations per file, and return them open for writing.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        files = []
+        for start in range(0, iterations, chunk_size):
+            stop = min(start + chunk_size, iterations)
+            files.append({"file": f"{start}.npy", "start": start, "stop": stop})
+            np.lib.format.open_memmap(
+                directory / f"{start}.npy",
+                mode="w+",
+                dtype=dtype,
+                shape=(n_exchanges, stop - start),
+            ).flush()
+
+        (directory / "presamples.json").write_text(
+            json.dumps({"shape": [n_exchanges, iterations], "files": files})
+        )
+
+        presamples = cls(directory)
+        presamples._chunks = {
+            i: np.load(f, mmap_mode="r+") for i, f in enumerate(presamples._files)
+        }
+        return presamples
+
+    def _chunk(self, i) -> np.ndarray:
+        if i not in self._chunks:
+            self._chunks[i] = np.load(self._files[i], mmap_mode="r")
+        return self._chunks[i]
+
+    def write(self, values: np.ndarray, row: int) -> None:
+        """
+        Write the amounts of all iterations, of shape (exchanges, iterations),
+        of the exchanges from `row` on.
+        """
+        for i, start in enumerate(self.starts):
+            chunk = self._chunk(i)
+            chunk[row : row + len(values)] = values[:, start : start + chunk.shape[1]]
+
+    def flush(self) -> None:
+        for chunk in self._chunks.values():
+            if isinstance(chunk, np.memmap):
+                chunk.flush()
+
+    def chunks(self):
+        """
+        Yield the first iteration and the amounts, of shape (exchanges, iterations), of each file.
+        """
+        for i, start in enumerate(self.starts):
+            yield start, self._chunk(i)
+
+    def __getitem__(self, key) -> np.ndarray:
+        rows, iterations = key if isinstance(key, tuple) else (key, slice(None))
+        iterations = np.arange(self.shape[1])[iterations]
+        files = np.searchsorted(self.starts, iterations, side="right") - 1
+
+        if np.ndim(iterations) == 0:
+            return self._chunk(int(files))[rows, iterations - self.starts[files]]
+
+        return np.stack(
+            [
+                self._chunk(f)[rows, i - self.starts[f]]
+                for f, i in zip(files.tolist(), iterations.tolist())
+            ],
+            axis=-1,
+        )
+
+
+def export_to_sqlite(
+    inventory,
+    filepath,
+    database: str = "carculator_two_wheeler",
+    years: list = None,
+    presamples: bool = False,
+    replace: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+):
+    """
+    Export the exchanges of `inventory` to the SQLite file `filepath` (see :data:`SQLITE_SCHEMA`),
+    under the name `database`, in one transaction:
+
+    * "flows", the products, i.e., the activities, and biosphere flows, shared by all databases,
+      identified by their name, location (or categories), unit and reference product,
+    * "exchanges", the exchanges of each activity (see :func:`iter_exchanges`) for each year,
+    * if `presamples` is True, "presamples", the amount of each exchange in each iteration,
+      stored as the bytes of an array of type "dtype".
+
+    Exchanges are inserted in bulk, one batch at a time, and the indexes created once loaded.
+    Exchanges already stored under the same database, year, activity and flow
+    are updated, so that inventories can be exported again to the same file.
+
+    :param database: name of the database the exchanges belong to, e.g., one per vehicle variant
+    :param years: years to export, all those of the inventory by default
+    :param presamples: if True, the amounts of each iteration are exported too
+    :param replace: if True, the exchanges already stored under `database` for these years
+        are deleted first, instead of being updated
+    :param batch_size: number of exchanges inserted at once
+    :return: the path of the SQLite file
+    """
+    years = years or inventory.scope["year"]
+    flows = flow_table(inventory)
+
+    connection = sqlite3.connect(filepath)
+    try:
+        with connection:
+            connection.executescript(SQLITE_SCHEMA)
+
+            connection.executemany(
+                "INSERT INTO flows (name, location, unit, reference_product, biosphere) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (name, location, unit, reference_product) DO NOTHING",
+                zip(
+                    flows["name"],
+                    flows["location"],
+                    flows["unit"],
+                    flows["reference product"],
+                    flows["biosphere"].tolist(),
+                ),
+            )
+            ids = {
+                tuple(label): i
+                for i, *label in connection.execute(
+                    "SELECT id, name, location, unit, reference_product FROM flows"
+                )
+            }
+            # id of each row of the A matrix
+            flow_ids = np.array(
+                [
+                    ids[label]
+                    for label in zip(
+                        flows["name"],
+                        flows["location"],
+                        flows["unit"],
+                        flows["reference product"],
+                    )
+                ]
+            )
+
+            if replace:
+                for table in ("exchanges", "presamples"):
+                    connection.executemany(
+                        f"DELETE FROM {table} WHERE database = ? AND year = ?",
+                        [(database, int(year)) for year in years],
+                    )
+
+            for batch in iter_exchanges(inventory, years, batch_size):
+                keys = list(
+                    zip(
+                        [database] * len(batch["year"]),
+                        batch["year"].tolist(),
+                        flow_ids[batch["activity"]].tolist(),
+                        flow_ids[batch["flow"]].tolist(),
+                    )
+                )
+                connection.executemany(
+                    "INSERT INTO exchanges VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (database, year, activity, flow) "
+                    "DO UPDATE SET type = excluded.type, amount = excluded.amount",
+                    [
+                        key + (EXCHANGE_TYPES[t], a)
+                        for key, t, a in zip(
+                            keys, batch["type"].tolist(), batch["amount"].tolist()
+                        )
+                    ],
+                )
+
+                if presamples:
+                    values = batch["values"]
+                    connection.executemany(
+                        "INSERT INTO presamples VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (database, year, activity, flow) "
+                        "DO UPDATE SET dtype = excluded.dtype, amounts = excluded.amounts",
+                        [
+                            key + (values.dtype.str, row.tobytes())
+                            for key, row in zip(keys, values)
+                        ],
+                    )
+
+            connection.executescript(SQLITE_INDEXES)
+    finally:
+        connection.close()
+
+    return Path(filepath)
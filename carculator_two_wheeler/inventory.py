@@ -3,550 +3,972 @@ inventory.py contains Inventory which provides all methods to solve inventories.
 """
 
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import numpy as np
-from carculator_utils.inventory import Inventory
+import xarray as xr
+from carculator_utils import DATA_DIR as UTILS_DATA_DIR
+from carculator_utils.inventory import (
+    Inventory,
+    check_scenario,
+    format_array,
+    get_dict_impact_categories,
+)
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
 
 from . import DATA_DIR
+from .cache import load_data_file
+from .label_index import LabelIndex
+from .profiling import Profiler, logger, profile_stage
+from .sparse_matrix import StackedSparseBuilder, StackedSparseMatrix
 
-warnings.filterwarnings("ignore", category=np.VisibleDeprecationWarning)
+# only silence warnings raised by carculator packages
+warnings.filterwarnings(
+    "ignore", category=np.VisibleDeprecationWarning, module="carculator"
+)
 
 IAM_FILES_DIR = DATA_DIR / "IAM"
 
+# exchanges between the vehicles and their components, see `fill_in_components`
+COMPONENTS_FILE = DATA_DIR / "A_matrix_components.yaml"
+
+# battery production activity of each chemistry, see `add_battery`
+BATTERY_ACTIVITIES = {
+    "NMC-111": "market for battery, Li-ion, NMC111, rechargeable, prismatic",
+    "NMC-523": "market for battery, Li-ion, NMC523",
+    "NMC-622": "market for battery, Li-ion, NMC622",
+    "NMC-811": "market for battery, Li-ion, NMC811, rechargeable, prismatic",
+    "NMC-955": "market for battery, Li-ion, NMC955",
+    "LFP": "market for battery, Li-ion, LFP, rechargeable, prismatic",
+    "NCA": "market for battery, Li-ion, NCA, rechargeable, prismatic",
+    "LTO": "market for battery, Li-ion, LTO",
+    "Li-O2": "market for battery, Li-oxygen, Li-O2",
+    "Li-S": "market for battery, Li-sulfur, Li-S",
+    "SiB": "market for battery, Sodium-ion, SiB",
+}
+
+# number of right-hand sides solved at once in `calculate_impacts`
+SOLVE_BLOCK_SIZE = 256
+
 
 class InventoryTwoWheeler(Inventory):
     """
     Build and solve the inventory for results
     characterization and inventory export
 
-    """
+    :param sparse: if True (default), the entries of the A matrix are collected as coordinates
+        in a :class:`StackedSparseBuilder`, from the A matrix of the background inventories
+        and each block of :meth:`fill_in_A_matrix`, and assembled, once filled in,
+        into a :class:`StackedSparseMatrix`, without the dense A matrix ever being allocated.
+        :meth:`calculate_impacts` solves it through a single sparse LU factorization.
+        If False, the A matrix is dense.
+    :param profiler: a :class:`carculator_two_wheeler.profiling.Profiler` recording the wall time
+        and memory of each block of :meth:`fill_in_A_matrix` and of the solve in :meth:`calculate_impacts`.
+        By default, that of the vehicle model, if any.
 
-    def fill_in_A_matrix(self):
-        """
-        Fill-in the A matrix. Does not return anything. Modifies in place.
-        Shape of the A matrix (values, products, activities).
+    The A matrix is stored in the dtype of the array of the vehicle model (see :attr:`dtype`),
+    and solved in float64.
 
-        :param array: :attr:`array` from :class:`CarModel` class
-        """
+    Sizes and powertrains which are not available in any year (see
+    :attr:`carculator_two_wheeler.model.TwoWheelerModel.available`) have no activities
+    in the A matrix, and are left out of :attr:`array`. Their impacts are zero.
 
-        # Glider/Frame
-        idx = self.find_input_indices(
-            ("two-wheeler, ", "Bicycle <25", "Human"), excludes=("transport",)
-        )
+    """
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("bicycle production",), excludes=("battery",)
-            ),
-            idx,
-        ] = (
-            self.array.sel(
-                parameter="glider base mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(x in d for x in ["Bicycle <25", "Human"])
-                ],
-            )
-            * 1
-            / 17
-            * -1
-        )
+    def __init__(self, *args, sparse: bool = True, profiler: Profiler = None, **kwargs):
+        # kept to rebuild the inventory, see `update`
+        self._init_arguments = (args, dict(kwargs, sparse=sparse, profiler=profiler))
 
-        idx = self.find_input_indices(
-            ("two-wheeler, ", "Kick-scooter", "BEV"), excludes=("transport",)
+        vm = args[0] if args else kwargs.get("vm")
+        self.profiler = (
+            profiler if profiler is not None else getattr(vm, "profiler", None)
         )
+        self.dtype = vm.array.dtype
+        self.sparse = sparse
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("bicycle production",), excludes=("battery",)
-            ),
-            idx,
-        ] = (
-            self.array.sel(
-                parameter="glider base mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(x in d for x in ["Kick-scooter", "BEV"])
-                ],
+        with profile_stage(self.profiler, "build inventory"):
+            super().__init__(*args, **kwargs)
+
+    def add_additional_activities(self):
+        """
+        Add the fuel and electricity markets and the activities of the vehicles,
+        as :meth:`carculator_utils.inventory.Inventory.add_additional_activities` does,
+        but only for the sizes and powertrains available in at least one year.
+        Their selection of :attr:`array` is kept, in the same order as their activities.
+        """
+        super().add_additional_activities()
+
+        available = self.vm.available.any(dim="year")
+        unavailable = [
+            (size, powertrain)
+            for size in self.scope["size"]
+            for powertrain in self.scope["powertrain"]
+            if not available.sel(size=size, powertrain=powertrain)
+        ]
+
+        if not unavailable:
+            return
+
+        names = {
+            name
+            for size, powertrain in unavailable
+            for name in (
+                f"transport, {self.vm.vehicle_type}, {powertrain}, {size}",
+                f"{self.vm.vehicle_type}, {powertrain}, {size}",
             )
-            * 1
-            / 17
-            * -1
-        )
+        }
+        self.inputs = {
+            key: i
+            for i, key in enumerate(
+                k for k in sorted(self.inputs, key=self.inputs.get) if k[0] not in names
+            )
+        }
+        self._input_index = None
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Bicycle", "BEV"),
-            excludes=("cargo", "transport"),
+        self.array = self.array.sel(
+            combined_dim=[
+                f"{size} - {powertrain}"
+                for size in self.scope["size"]
+                for powertrain in self.scope["powertrain"]
+                if (size, powertrain) not in unavailable
+            ]
         )
 
-        self.A[
-            :,
-            self.find_input_indices(
-                ("electric bicycle production, without battery and motor",)
-            ),
-            idx,
-        ] = (
-            self.array.sel(
-                parameter="glider base mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(x in d for x in ["Bicycle", "BEV"]) and "cargo" not in d
-                ],
-            )
-            * 1
-            / 17
-            * -1
-        )
+    def get_load_factor(self):
+        """
+        Return the number of passengers (functional unit "pkm") or the cargo mass in tons
+        ("tkm") of the vehicles of :attr:`array`, of the first value, of shape
+        (1, combined_dim, year), or 1 (functional unit "vkm").
+        """
+        if self.func_unit == "vkm":
+            return 1
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Bicycle", "BEV", "cargo"),
-            excludes=("transport",),
-        )
+        if self.func_unit == "pkm":
+            load_factor = self.array.sel(parameter="average passengers")
+        else:
+            load_factor = self.array.sel(parameter="cargo mass") / 1000
 
-        self.A[
-            :,
-            self.find_input_indices(
-                ("electric cargo bicycle production, without battery and motor",)
-            ),
-            idx,
-        ] = (
-            self.array.sel(
-                parameter="glider base mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(x in d for x in ["Bicycle", "BEV", "cargo"])
-                ],
-            )
-            * 1
-            / 50
-            * -1
-        )
+        return load_factor.isel(value=[0]).values
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Moped", "ICEV"), excludes=("transport",)
-        )
-        idx.extend(
-            self.find_input_indices(
-                contains=("two-wheeler, ", "Scooter", "ICEV"), excludes=("transport",)
+    def get_A_matrix(self):
+        """
+        Load the A matrix, of shape (values, products, activities, years),
+        in :attr:`dtype`, from the A matrix of the background inventories.
+        With :attr:`sparse`, a :class:`StackedSparseBuilder` holding its entries
+        is returned instead, to which the following blocks add theirs.
+        """
+        filepath = UTILS_DATA_DIR / "IAM" / "A_matrix.npz"
+        if not filepath.is_file():
+            raise FileNotFoundError("The IAM files could not be found.")
+
+        initial_A = sparse.load_npz(filepath).tocoo()
+        initial_A.sum_duplicates()
+        n_inputs, n_initial = len(self.inputs), initial_A.shape[0]
+        shape = (self.iterations, n_inputs, n_inputs, len(self.scope["year"]))
+
+        if self.sparse:
+            # activities added to the background inventories supply their own product
+            added = np.arange(n_initial, n_inputs)
+            A = StackedSparseBuilder(shape, self.dtype)
+            A.add(
+                np.concatenate([initial_A.row, added]),
+                np.concatenate([initial_A.col, added]),
+                np.concatenate([initial_A.data, np.ones(len(added))])[None, :, None],
             )
-        )
-        idx.extend(
-            self.find_input_indices(
-                contains=("two-wheeler, ", "Motorcycle", "ICEV"),
-                excludes=("transport",),
+            return A
+
+        A = np.zeros(shape, dtype=self.dtype)
+        A[:, np.arange(n_inputs), np.arange(n_inputs)] = 1
+        A[:, :n_initial, :n_initial] = initial_A.toarray()[None, ..., None]
+
+        return A
+
+    def find_input_requirement(
+        self,
+        value_in,
+        value_out,
+        find_input_by="name",
+        zero_out_input=False,
+        filter_activities=None,
+        replace_by=None,
+    ):
+        """
+        Move the inputs of `value_in` to the supply chain of `value_out`
+        to `replace_by`, as :meth:`carculator_utils.inventory.Inventory.find_input_requirement` does,
+        the supply chain being solved from the first matrix of the stack only,
+        which is read from the entries of a :class:`StackedSparseBuilder`.
+        """
+        if not isinstance(self.A, StackedSparseBuilder):
+            return super().find_input_requirement(
+                value_in,
+                value_out,
+                find_input_by=find_input_by,
+                zero_out_input=zero_out_input,
+                filter_activities=filter_activities,
+                replace_by=replace_by,
             )
-        )
 
-        self.A[
-            :,
-            self.find_input_indices(("motor scooter production",)),
-            idx,
-        ] = (
-            self.array.sel(
-                parameter="glider base mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if any(x in d for x in ["Scooter", "Moped", "Motorcycle"])
-                    and "ICEV-p" in d
-                ],
-            )
-            * 1
-            / 90
-            * -1
-        )
+        if isinstance(value_out, str):
+            value_out = (value_out,)
+
+        if find_input_by not in ("name", "unit"):
+            raise ValueError("find_input_by must be 'name' or 'unit'")
+
+        f_vector = np.zeros(self.A.shape[1])
+        f_vector[self.find_input_indices(value_out)] = 1
+
+        X = spsolve(self.A.matrix(0, 0).tocsr(), f_vector)
+        ind_inputs = np.nonzero(X)[0]
+
+        field = 0 if find_input_by == "name" else 2
+        ins = [
+            i
+            for i in ind_inputs
+            if value_in.lower() in self.rev_inputs[i][field].lower()
+        ]
+        outs = [i for i in ind_inputs if i not in ins]
+
+        if filter_activities:
+            outs = [
+                i
+                for e in filter_activities
+                for i in outs
+                if e.lower() in self.rev_inputs[i][0].lower()
+            ]
+
+        values = np.arange(self.A.shape[0])
+        ins = [i for i in ins if self.A[np.ix_(values, [i], outs)].sum() != 0]
+
+        # replace the inputs by `replace_by`
+        if replace_by:
+            for i in ins:
+                if i != replace_by:
+                    amount = self.A[np.ix_(values, [i], outs)]
+                    self.A[np.ix_(values, [i], outs)] = 0
+                    self.A[np.ix_(values, replace_by, outs)] += amount
+
+    @property
+    def input_index(self) -> LabelIndex:
+        """
+        Index of the labels of :attr:`inputs`, rebuilt when activities are added.
+        """
+        if getattr(self, "_input_index", None) is None or len(self._input_index) != len(
+            self.inputs
+        ):
+            self._input_index = LabelIndex(self.inputs)
+        return self._input_index
+
+    def find_input_indices(
+        self, contains: [tuple, str], excludes: tuple = (), excludes_in: int = 0
+    ) -> list:
+        """
+        This function finds the indices of the inputs in the A matrix
+        that contain the strings in the contains list, and do not
+        contain the strings in the excludes list. Looked up in :attr:`input_index`.
+
+        :param contains: list of strings
+        :param excludes: list of strings
+        :param excludes_in: integer of item position to apply excludes filter
+        :return: list of indices
+        """
+        if excludes_in != 0:
+            return super().find_input_indices(contains, excludes, excludes_in)
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Scooter", "BEV"), excludes=("transport",)
-        )
-        idx.extend(
-            self.find_input_indices(
-                contains=("two-wheeler, ", "Motorcycle", "BEV"), excludes=("transport",)
-            )
-        )
+        if not isinstance(contains, tuple):
+            contains = tuple(contains)
 
-        self.A[
-            :,
-            self.find_input_indices(("market for glider, for electric scooter",)),
-            idx,
-        ] = (
-            self.array.sel(
-                parameter="glider base mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if any(x in d for x in ["Scooter", "Motorcycle"]) and "BEV" in d
-                ],
+        if not isinstance(excludes, tuple):
+            excludes = tuple(excludes)
+
+        indices = self.input_index.find(contains, excludes)
+
+        if len(indices) == 0:
+            logger.info(
+                "No input found for %s and exclude %s in the A matrix.",
+                contains,
+                excludes,
             )
-            * -1
-        )
 
-        self.A[
-            :,
-            self.find_input_indices(contains=("glider lightweighting",)),
-            self.find_input_indices(
-                contains=("two-wheeler, ",), excludes=("transport",)
-            ),
-        ] = (
-            self.array.sel(parameter="lightweighting")
-            * self.array.sel(parameter="glider base mass")
-        ) * -1
+        return indices
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("electric motor production, for electric scooter",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="electric engine mass") * -1
-        )
+    def select_combined_dim(self, contains=(), excludes=(), any_of=()) -> list:
+        """
+        Return the labels of the `combined_dim` coordinate of :attr:`array` (i.e., "size - powertrain")
+        matching the query. See :meth:`LabelIndex.mask` for the arguments.
+        """
+        if getattr(self, "_combined_dim_index", None) is None:
+            self._combined_dim_index = LabelIndex(
+                self.array.coords["combined_dim"].values.tolist()
+            )
+        return self._combined_dim_index.select(contains, excludes, any_of)
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("market for internal combustion engine, passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="combustion engine mass") * -1
-        )
+    def calculate_impacts(self, sensitivity=False):
+        """
+        Calculate the impacts of the vehicles, per impact category and source category.
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("powertrain production, for electric scooter",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="electrical powertrain mass") * -1
-        )
+        The supply chain of all the activities supplying the vehicles is solved at once,
+        with several right-hand sides, from one factorization of the A matrix
+        (made sparse if it is not), and the contribution of each vehicle is calculated
+        from the entries of its columns only. Results are those of the dense calculation.
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("market for internal combustion engine, passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="mechanical powertrain mass") * -1
-        )
+        :param sensitivity: if True, results are normalized by those of the `reference` value
+        :return: an array with dimensions ``impact_category``, ``size``, ``powertrain``, ``year``,
+            ``impact`` and ``value``
+        """
 
-        # Powertrain components
-        self.A[
-            :,
-            self.find_input_indices(("charger production, for electric scooter",)),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="charger mass") * -1
-        )
+        A = self.A
+        if not isinstance(A, StackedSparseMatrix):
+            A = StackedSparseMatrix.from_dense(A)
 
-        self.A[
-            :,
-            self.find_input_indices(
-                ("market for converter, for electric passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="converter mass") * -1
-        )
+        setup = (self.get_B_matrix_per_year(), self.get_results_table(sensitivity))
 
-        self.A[
-            :,
-            self.find_input_indices(
-                ("market for inverter, for electric passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="inverter mass") * -1
-        )
+        return self._solve_and_characterize(A, [setup], sensitivity)[0]
 
-        self.A[
-            :,
-            self.find_input_indices(
-                ("market for power distribution unit, for electric passenger car",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="power distribution unit mass") * -1
-        )
+    def calculate_impacts_for_methods(
+        self, methods: list, sensitivity=False, threads: int = None
+    ) -> xr.DataArray:
+        """
+        Calculate the impacts of the vehicles for several impact assessment methods
+        and background scenarios at once (see :meth:`calculate_impacts`).
+        The A matrix, which does not depend on them, is factorized once per year,
+        the supply chains solved once, and the characterization of each method and scenario
+        runs in a pool of `threads` threads.
 
-        # Maintenance
+        .. code-block:: python
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Scooter", "ICEV"), excludes=("transport",)
-        )
-        idx.extend(
-            self.find_input_indices(
-                contains=("two-wheeler, ", "Motorcycle", "ICEV"),
-                excludes=("transport",),
+            ic.calculate_impacts_for_methods(
+                [("recipe", "midpoint"), ("ef", "midpoint", "SSP2-PkBudg650")]
             )
-        )
 
-        self.A[:, self.find_input_indices(("maintenance, motor scooter",)), idx] = (
-            self.array.sel(
-                parameter="lifetime kilometers",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if any(x in d for x in ["Scooter", "Motorcycle"]) and "ICEV-p" in d
-                ],
+        :param methods: list of (method, indicator, scenario) tuples, e.g., ``("recipe", "endpoint", "static")``.
+            The indicator defaults to "midpoint" and the scenario to that of the inventory.
+        :param sensitivity: if True, results are normalized by those of the `reference` value
+        :param threads: number of threads characterizing the results. Defaults to one per method.
+        :return: an array with the dimensions of :meth:`calculate_impacts` and ``method``,
+            labelled "method, indicator, scenario". Impact categories which do not belong
+            to a method are NaN. Select methods with a dictionary, e.g.,
+            ``results.sel({"method": "ef, midpoint, SSP2-PkBudg650"})``,
+            since ``method`` is also an argument of :meth:`xarray.DataArray.sel`.
+        """
+        A = self.A
+        if not isinstance(A, StackedSparseMatrix):
+            A = StackedSparseMatrix.from_dense(A)
+
+        labels, setups = [], []
+        for setup in methods:
+            if isinstance(setup, str):
+                setup = (setup,)
+            method, indicator, scenario = (
+                tuple(setup) + ("midpoint", self.scenario)[len(setup) - 1 :]
             )
-            / 25000
-            * -1
-        )
+            with self._characterization(method, indicator, scenario):
+                labels.append(f"{self.method}, {self.indicator}, {self.scenario}")
+                setups.append(
+                    (self.get_B_matrix_per_year(), self.get_results_table(sensitivity))
+                )
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Bicycle <25", "Human"), excludes=("transport",)
-        )
-
-        self.A[:, self.find_input_indices(("maintenance, bicycle",)), idx] = (
-            self.array.sel(
-                parameter="lifetime kilometers",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(
-                        x in d
-                        for x in [
-                            "Bicycle <25",
-                            "Human",
-                        ]
-                    )
-                ],
-            )
-            / 25000
-            * -1
-        )
+        results = self._solve_and_characterize(A, setups, sensitivity, threads)
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Bicycle", "BEV"), excludes=("transport",)
+        return xr.concat(results, dim="method", join="outer").assign_coords(
+            method=labels
         )
 
-        self.A[
-            :,
-            self.find_input_indices(
-                ("maintenance, electric bicycle, without battery",)
-            ),
-            idx,
-        ] = (
-            self.array.sel(
-                parameter="lifetime kilometers",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(
-                        x in d
-                        for x in [
-                            "Bicycle",
-                            "BEV",
-                        ]
-                    )
-                ],
+    @contextmanager
+    def _characterization(self, method: str, indicator: str, scenario: str):
+        """
+        Set the impact assessment method, indicator and background scenario of the inventory,
+        and the B matrix and impact categories which depend on them, for the duration of the context.
+        """
+        attributes = ("method", "indicator", "scenario", "impact_categories", "B")
+        saved = {a: getattr(self, a) for a in attributes}
+
+        try:
+            self.scenario = check_scenario(scenario)
+            self.method = method
+            self.indicator = indicator if method == "recipe" else "midpoint"
+            self.impact_categories = get_dict_impact_categories(
+                method=self.method, indicator=self.indicator
             )
-            / 25000
-            * -1
-        )
+            self.B = self.get_B_matrix()
+            yield
+        finally:
+            for a, value in saved.items():
+                setattr(self, a, value)
+
+    def _solve_and_characterize(
+        self,
+        A: StackedSparseMatrix,
+        setups: list,
+        sensitivity: bool,
+        threads: int = None,
+    ) -> list:
+        """
+        Solve the supply chain of the activities supplying the vehicles in `A`, once,
+        and characterize it with each (B matrix per year, results table) of `setups`,
+        in a pool of `threads` threads (BLAS releasing the GIL), by default one per setup.
 
-        idx = self.find_input_indices(
-            ("two-wheeler, ", "Kick-scooter", "BEV"), excludes=("transport",)
-        )
-        self.A[:, self.find_input_indices(("treatment of used bicycle",)), idx] = (
-            self.array.sel(
-                parameter="curb mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(
-                        x in d
-                        for x in [
-                            "Kick-scooter",
-                            "BEV",
-                        ]
-                    )
-                ],
+        :return: the results of each setup
+        """
+        n_sizes, n_powertrains, n_years = (
+            len(self.scope["size"]),
+            len(self.scope["powertrain"]),
+            len(self.scope["year"]),
+        )
+
+        # Collect indices of activities contributing to the first level
+        idx_car_trspt = [
+            x
+            for x, y in self.rev_inputs.items()
+            if y[0].startswith(f"transport, {self.vm.vehicle_type}, ")
+        ]
+        idx_cars = [
+            x
+            for x, y in self.rev_inputs.items()
+            if y[0].startswith(f"{self.vm.vehicle_type}, ")
+        ]
+
+        # activities supplying the vehicles
+        nonzero_idx = np.setdiff1d(
+            np.concatenate([A.column_entries(j)[0] for j in idx_cars + idx_car_trspt]),
+            idx_cars + idx_car_trspt,
+        )
+        is_biosphere = np.array(
+            [isinstance(self.rev_inputs[a][1], tuple) for a in nonzero_idx], dtype=bool
+        )
+
+        # impacts per unit of each activity supplying the vehicles,
+        # of shape (activities, impact categories, years), for each setup
+        new_arrs = []
+        for B, _ in setups:
+            new_arr = np.zeros((A.shape[1], B.shape[1], n_years))
+            # biosphere flows, hence no need to calculate LCA
+            new_arr[nonzero_idx[is_biosphere]] = B[
+                ..., nonzero_idx[is_biosphere]
+            ].transpose(2, 1, 0)
+            new_arrs.append(new_arr)
+
+        # weight of each activity in each source category
+        groups = np.zeros((len(self.split_indices), A.shape[1]))
+        for g, indices in enumerate(self.split_indices):
+            np.add.at(groups[g], indices, 1)
+
+        def characterize(s, block, X, y):
+            new_arrs[s][block, :, y] = (setups[s][0][y] @ X).T
+
+        def contributions(s):
+            arr = np.zeros(
+                (
+                    new_arrs[s].shape[1],
+                    self.iterations,
+                    len(self.split_indices),
+                    len(idx_car_trspt),
+                    n_years,
+                )
             )
-            / 17
-        )
-        idx = self.find_input_indices(
-            ("two-wheeler, ", "Human", "Bicycle <25"), excludes=("transport",)
-        )
 
-        self.A[:, self.find_input_indices(("treatment of used bicycle",)), idx] = (
-            self.array.sel(
-                parameter="curb mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(
-                        x in d
-                        for x in [
-                            "Bicycle <25",
-                            "Human",
-                        ]
+            for k, (car, trspt) in enumerate(zip(idx_cars, idx_car_trspt)):
+                # direct inputs of the transport activity
+                r_trspt, a_trspt = A.column_entries(trspt)
+                # inputs of the vehicle, per unit of transport
+                r_car, a_car = A.column_entries(car)
+                use = A[:, car, trspt]
+
+                for r, a in ((r_trspt, a_trspt * -1), (r_car, a_car * use)):
+                    arr[..., k, :] += np.einsum(
+                        "riy,gr,rcy->cigy", a, groups[:, r], new_arrs[s][r]
                     )
-                ],
+
+            return arr
+
+        products = nonzero_idx[~is_biosphere]
+        with ThreadPoolExecutor(max_workers=threads or len(setups)) as pool:
+            with profile_stage(self.profiler, "solve"):
+                for y in range(n_years):
+                    for start in range(0, len(products), SOLVE_BLOCK_SIZE):
+                        block = products[start : start + SOLVE_BLOCK_SIZE]
+                        f_vectors = np.zeros((A.shape[1], len(block)))
+                        f_vectors[block, np.arange(len(block))] = 1
+
+                        X = A.solve(f_vectors, 0, y)
+                        for future in [
+                            pool.submit(characterize, s, block, X, y)
+                            for s in range(len(setups))
+                        ]:
+                            future.result()
+
+            with profile_stage(self.profiler, "contributions"):
+                arrs = list(pool.map(contributions, range(len(setups))))
+
+        # vehicles of the results table, of which those of `array` have activities
+        position = {
+            label: i
+            for i, label in enumerate(
+                f"{size} - {powertrain}"
+                for size in self.scope["size"]
+                for powertrain in self.scope["powertrain"]
             )
-            / 17
-        )
+        }
+        columns = [position[d] for d in self.array.coords["combined_dim"].values]
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Bicycle", "BEV"), excludes=("transport",)
-        )
+        load_factor = self.get_load_factor()
 
-        self.A[
-            :, self.find_input_indices(("treatment of used electric bicycle",)), idx
-        ] = (
-            self.array.sel(
-                parameter="curb mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if all(x in d for x in ["Bicycle", "BEV"])
-                ],
-            )
-            / 24
-        )
+        results = []
+        for (_, table), arr in zip(setups, arrs):
+            if isinstance(load_factor, np.ndarray):
+                arr = arr / load_factor.reshape((1, 1, 1, -1, n_years))
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Scooter", "BEV"), excludes=("transport",)
-        )
-        idx.extend(
-            self.find_input_indices(
-                contains=("two-wheeler, ", "Scooter", "ICEV"), excludes=("transport",)
+            full = np.zeros(arr.shape[:3] + (n_sizes * n_powertrains, n_years))
+            full[..., columns, :] = arr
+            arr = full.reshape(arr.shape[:3] + (n_sizes, n_powertrains, n_years))
+
+            # reshape the array to match the dimensions of the results table
+            arr = arr.transpose(0, 3, 4, 5, 2, 1)
+
+            if sensitivity:
+                table[...] = arr.sum(axis=-2)
+                table /= table.sel(value="reference")
+            else:
+                table[...] = arr
+
+            results.append(table)
+
+        return results
+
+    def get_B_matrix_per_year(self) -> np.ndarray:
+        """
+        Return the B matrix for each year of the scope, of shape (years, impact categories, activities).
+        Years outside the range of the B matrix take its first or last year.
+        """
+        if self.scenario == "static":
+            return np.repeat(self.B.values, len(self.scope["year"]), axis=0)
+
+        years = self.B.year.values
+        return np.array(
+            [
+                self.B.interp(
+                    year=np.clip(year, years.min(), years.max()),
+                    method="linear",
+                    kwargs={"fill_value": "extrapolate"},
+                ).values
+                for year in self.scope["year"]
+            ]
+        )
+
+    def compile_components_mapping(self, mapping: list = None) -> dict:
+        """
+        Resolve the entries of the mapping of the vehicle components
+        (see `data/A_matrix_components.yaml`) into the positions of the cells of the A matrix
+        they write and the factors they apply, so that all cells can be written at once.
+        If several entries write the same cell, the last one is kept.
+
+        :param mapping: list of entries, read from `A_matrix_components.yaml` by default
+        :return: dictionary of arrays, with one value per cell: `rows` and `columns` of the A matrix,
+            `combined_dim` (position of the vehicle in :attr:`array`), `parameters` (positions
+            of the parameters multiplied, -1 for none), `only_if` (position of the parameter, -1 for none),
+            `per`, `factor` and `sign`
+        """
+        if mapping is None:
+            mapping = load_data_file(COMPONENTS_FILE)
+
+        parameters = {
+            p: i for i, p in enumerate(self.array.coords["parameter"].values.tolist())
+        }
+        combined_dim = {
+            d: i
+            for i, d in enumerate(self.array.coords["combined_dim"].values.tolist())
+        }
+        vehicles = {
+            name: i
+            for (name, *_), i in self.inputs.items()
+            if name.startswith(f"{self.vm.vehicle_type}, ")
+        }
+
+        n_factors = max(len(entry.get("parameters", [])) for entry in mapping)
+        cells = {}
+
+        for entry in mapping:
+            rows = self.find_input_indices(
+                contains=(entry["input"],),
+                excludes=tuple(entry.get("excludes", ())),
             )
+            selector = entry.get("vehicles", {})
+            params = [parameters[p] for p in entry.get("parameters", [])]
+            only_if = parameters[entry["only_if"]] if "only_if" in entry else -1
+
+            for label in self.select_combined_dim(
+                contains=tuple(selector.get("contains", ())),
+                excludes=tuple(selector.get("excludes", ())),
+                any_of=tuple(tuple(group) for group in selector.get("any_of", ())),
+            ):
+                size, powertrain = label.split(" - ")
+                column = vehicles.get(f"{self.vm.vehicle_type}, {powertrain}, {size}")
+                if column is None:
+                    continue
+
+                for row in rows:
+                    cells[(row, column)] = (
+                        combined_dim[label],
+                        params + [-1] * (n_factors - len(params)),
+                        only_if,
+                        entry.get("per", 1),
+                        entry.get("factor", 1),
+                        entry.get("sign", -1),
+                    )
+
+        keys, values = list(cells.keys()), list(cells.values())
+
+        return {
+            "rows": np.array([row for row, _ in keys], dtype=int),
+            "columns": np.array([column for _, column in keys], dtype=int),
+            "combined_dim": np.array([v[0] for v in values], dtype=int),
+            "parameters": np.array([v[1] for v in values], dtype=int).reshape(
+                -1, n_factors
+            ),
+            "only_if": np.array([v[2] for v in values], dtype=int),
+            "per": np.array([v[3] for v in values], dtype=float),
+            "factor": np.array([v[4] for v in values], dtype=float),
+            "sign": np.array([v[5] for v in values], dtype=float),
+        }
+
+    def component_exchanges(self, mapping: dict) -> np.ndarray:
+        """
+        Calculate the exchanges of the cells of a compiled mapping of the vehicle components,
+        in one gather from :attr:`array`, for all values and years.
+
+        :param mapping: mapping compiled by :meth:`compile_components_mapping`
+        :return: array of shape (values, cells, years)
+        """
+        # shape (values, parameters, combined_dim, years)
+        array = self.array.values
+        dims = mapping["combined_dim"]
+        params = mapping["parameters"]
+
+        # product of the parameters of each cell
+        exchanges = np.where(
+            (params >= 0)[None, :, :, None],
+            array[:, np.clip(params, 0, None), dims[:, None], :],
+            1,
+        ).prod(axis=2)
+
+        only_if = mapping["only_if"]
+        exchanges *= np.where(
+            (only_if >= 0)[None, :, None],
+            array[:, np.clip(only_if, 0, None), dims, :] > 0,
+            True,
         )
-        idx.extend(
-            self.find_input_indices(
-                contains=("two-wheeler, ", "Motorcycle", "ICEV"),
-                excludes=("transport",),
-            )
+
+        per, factor, sign = (
+            mapping[f][None, :, None].astype(array.dtype)
+            for f in ("per", "factor", "sign")
         )
-        idx.extend(
-            self.find_input_indices(
-                contains=("two-wheeler, ", "Motorcycle", "BEV"), excludes=("transport",)
-            )
+
+        return exchanges / per * factor * sign
+
+    def fill_in_components(self, mapping: dict = None):
+        """
+        Write the exchanges between the vehicles and their components,
+        maintenance, end-of-life and transport to market in the A matrix,
+        in one scatter, for all values and years. Modifies in place.
+        The compiled mapping is kept in :attr:`components_mapping`.
+
+        :param mapping: mapping compiled by :meth:`compile_components_mapping`, compiled if not given
+        """
+        if mapping is None:
+            mapping = self.compile_components_mapping()
+
+        self.components_mapping = mapping
+
+        if len(mapping["rows"]) == 0:
+            return
+
+        self.A[:, mapping["rows"], mapping["columns"], :] = self.component_exchanges(
+            mapping
         )
-        idx = list(set(idx))
 
+    def add_battery(self):
+        """
+        Add the production of the batteries, and of their replacements, to the vehicles,
+        from the battery production activity of the chemistry of each vehicle
+        (see :attr:`TwoWheelerModel.battery_chemistry`), and their end-of-life.
+        The vehicles of each chemistry are written at once. Modifies in place.
+        """
+        logger.info("Important background parameters:")
+        logger.info("The functional unit is: %s.", self.func_unit)
+        logger.info("The background prospective scenario is: %s.", self.scenario)
+        logger.info("The country of use is: %s.", self.vm.country)
+
+        battery_chemistry = self.vm.battery_chemistry.sel(year=self.scope["year"])
+        battery_tech = list(set(battery_chemistry.values.ravel().tolist()))
+        battery_origin = self.vm.energy_storage.get("origin", "CN")
+
+        logger.info(
+            "Power and energy batteries produced in %s using %s chemistry/ies",
+            battery_origin,
+            battery_tech,
+        )
+
+        vehicles = {
+            name: i
+            for (name, *_), i in self.inputs.items()
+            if name.startswith(f"{self.vm.vehicle_type}, ")
+        }
+        labels = self.array.coords["combined_dim"].values.tolist()
+        columns = np.array(
+            [
+                vehicles.get(
+                    "{}, {}, {}".format(
+                        self.vm.vehicle_type, *reversed(label.split(" - "))
+                    ),
+                    -1,
+                )
+                for label in labels
+            ]
+        )
+
+        # chemistry of each vehicle, of shape (combined_dim, year)
+        chemistry = np.array(
+            [
+                battery_chemistry.sel(
+                    size=label.split(" - ")[0], powertrain=label.split(" - ")[1]
+                ).values
+                for label in labels
+            ]
+        ).reshape(len(labels), len(self.scope["year"]))
+
+        # shape (value, combined_dim, year)
+        battery_mass = (
+            self.array.sel(parameter="energy battery mass")
+            * (1 + self.array.sel(parameter="battery lifetime replacements"))
+        ).values
+
+        for tech in battery_tech:
+            rows = self.find_input_indices((BATTERY_ACTIVITIES[tech],))
+            is_tech = (chemistry == tech) & (columns >= 0)[:, None]
+            vehicle = np.flatnonzero(is_tech.any(axis=1))
+
+            # the vehicles of another chemistry in a given year do not use this battery
+            exchanges = np.where(is_tech[vehicle], battery_mass[:, vehicle], 0) * -1
+            for row in rows:
+                self.A[:, row, columns[vehicle]] = exchanges
+
+        # Battery EoL
         self.A[
             :,
-            self.find_input_indices(("manual dismantling of used electric scooter",)),
-            idx,
-        ] = (
-            self.array.sel(
-                parameter="curb mass",
-                combined_dim=[
-                    d
-                    for d in self.array.coords["combined_dim"].values
-                    if any(
-                        x in d
-                        for x in [
-                            "Scooter",
-                            "Motorcycle",
-                        ]
-                    )
-                    and any(x in d for x in ["BEV", "ICEV-p"])
-                ],
-            )
-            * -1
+            self.find_input_indices(("market for used Li-ion battery",)),
+            list(vehicles.values()),
+        ] = self.array.sel(parameter="energy battery mass") * (
+            1 + self.array.sel(parameter="battery lifetime replacements")
         )
 
-        # Energy storage
-        self.add_battery()
+    def fill_in_A_matrix(self):
+        """
+        Fill-in the A matrix. Does not return anything. Modifies in place.
+        Shape of the A matrix (values, products, activities).
 
-        self.A[
-            :,
-            self.find_input_indices(
-                contains=("polyethylene production, high density, granulate",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (
-            self.array.sel(parameter="fuel tank mass")
-            * (self.array.sel(parameter="combustion power") > 0)
-            * -1
-        )
+        :param array: :attr:`array` from :class:`CarModel` class
+        """
 
-        # Chargers
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Kick-scooter", "BEV"), excludes=("transport",)
-        )
-        self.A[:, self.find_input_indices(("charging station, 100W",)), idx] = -1
+        with profile_stage(self.profiler, "fill_in_A_matrix"):
+            self._fill_in_blocks()
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Bicycle", "BEV"), excludes=("transport",)
-        )
-        self.A[:, self.find_input_indices(("charging station, 500W",)), idx] = -1
+        if isinstance(self.A, StackedSparseBuilder):
+            with profile_stage(self.profiler, "sparse A matrix"):
+                self.A = self.A.assemble()
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Scooter", "BEV"), excludes=("transport",)
-        )
-        self.A[:, self.find_input_indices(("charging station, 3kW",)), idx] = -1
+    def remove_non_compliant_vehicles(self):
+        """
+        Remove the vehicles which do not have a TtW energy superior to 0 from the A matrix,
+        as :meth:`carculator_utils.inventory.Inventory.remove_non_compliant_vehicles` does,
+        by scaling the entries of their columns in a sparse A matrix.
+        Entries which are zero for all values and years are then left out of it.
+        """
+        if not isinstance(self.A, StackedSparseMatrix):
+            super().remove_non_compliant_vehicles()
+            return
+
+        np.nan_to_num(self.A.data, copy=False)
+        compliant = (self.array.sel(parameter="TtW energy") > 0).values
+
+        for idx in (
+            [
+                i
+                for i, activity in self.rev_inputs.items()
+                if activity[0].startswith(f"{self.vm.vehicle_type}, ")
+            ],
+            self.find_input_indices((f"transport, {self.vm.vehicle_type}, ",)),
+        ):
+            self.A.scale_columns(idx, compliant)
+            self.A.set_entries(idx, idx, 1)
+
+        self.A.eliminate_zeros()
+
+    def _fill_in_blocks(self):
+        """Fill in the blocks of the A matrix, each one recorded as a stage of :attr:`profiler`."""
+        _ = lambda block: profile_stage(self.profiler, block)
+
+        # Vehicle components, maintenance, end-of-life and transport to market
+        with _("fill_in_components"):
+            self.fill_in_components()
+
+        # parameters of :attr:`array` on which the blocks rewritten by `update` depend
+        used = np.concatenate(
+            [
+                self.components_mapping["parameters"].ravel(),
+                self.components_mapping["only_if"],
+            ]
+        )
+        self.dependencies = {
+            "components": set(
+                self.array.coords["parameter"].values[used[used >= 0]].tolist()
+            ),
+            "vehicle to transport": {"lifetime kilometers"},
+        }
 
-        idx = self.find_input_indices(
-            contains=("two-wheeler, ", "Motorcycle", "BEV"), excludes=("transport",)
-        )
-        self.A[:, self.find_input_indices(("charging station, 3kW",)), idx] = -1
+        # Energy storage
+        with _("add_battery"):
+            self.add_battery()
 
         # END of vehicle building
 
         # Add vehicle dataset to transport dataset
-        self.add_vehicle_to_transport_dataset()
+        with _("add_vehicle_to_transport_dataset"):
+            self.add_vehicle_to_transport_dataset()
 
         self.display_renewable_rate_in_mix()
 
-        self.add_electricity_to_electric_vehicles()
+        with _("add_electricity_to_electric_vehicles"):
+            self.add_electricity_to_electric_vehicles()
 
-        self.add_fuel_to_vehicles("petrol", ["ICEV-p"], "EV-p")
+        with _("add_fuel_to_vehicles"):
+            self.add_fuel_to_vehicles("petrol", ["ICEV-p"], "EV-p")
 
-        self.add_abrasion_emissions()
+        with _("add_abrasion_emissions"):
+            self.add_abrasion_emissions()
 
-        self.add_road_construction()
+        with _("add_road_construction"):
+            self.add_road_construction()
 
-        self.add_road_maintenance()
+        with _("add_road_maintenance"):
+            self.add_road_maintenance()
 
-        # reduce the burden from road maintenance
-        # for bicycles and kick-scooter by half
+            # reduce the burden from road maintenance
+            # for bicycles and kick-scooter by half
 
-        self.A[
-            :,
-            self.find_input_indices(("market for road maintenance",)),
-            self.find_input_indices((f"transport, two-wheeler, ", "Kick-scooter")),
-        ] *= 0.25
+            self.A[
+                :,
+                self.find_input_indices(("market for road maintenance",)),
+                self.find_input_indices((f"transport, two-wheeler, ", "Kick-scooter")),
+            ] *= 0.25
 
-        self.A[
-            :,
-            self.find_input_indices(("market for road maintenance",)),
-            self.find_input_indices((f"transport, two-wheeler, ", "Bicycle")),
-        ] *= 0.5
+            self.A[
+                :,
+                self.find_input_indices(("market for road maintenance",)),
+                self.find_input_indices((f"transport, two-wheeler, ", "Bicycle")),
+            ] *= 0.5
 
-        self.add_exhaust_emissions()
+        with _("add_exhaust_emissions"):
+            self.add_exhaust_emissions()
 
-        self.add_noise_emissions()
+        with _("add_noise_emissions"):
+            self.add_noise_emissions()
 
-        # Transport to market from China
-        # 15'900 km by ship
-        self.A[
-            :,
-            self.find_input_indices(
-                ("market for transport, freight, sea, container ship",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (self.array.sel(parameter="curb mass") / 1000 * 15900) * -1
+    def export_lci_to_parquet(self, directory, **kwargs) -> dict:
+        """
+        Stream the exchanges of the inventory to Parquet files in `directory`, with,
+        in stochastic mode, the amounts of each iteration in memory-mapped presample files.
+        See :func:`carculator_two_wheeler.export.export_to_parquet` for the arguments.
 
-        # 1'000 km by truck
-        self.A[
-            :,
-            self.find_input_indices(
-                ("market group for transport, freight, lorry, unspecified",)
-            ),
-            [j for i, j in self.inputs.items() if i[0].startswith("two-wheeler, ")],
-        ] = (self.array.sel(parameter="curb mass") / 1000 * 1000) * -1
+        :return: a dictionary with the paths of the files written
+        """
+        from .export import export_to_parquet
+
+        return export_to_parquet(self, directory, **kwargs)
+
+    def export_lci_to_sqlite(self, filepath, **kwargs):
+        """
+        Export the exchanges of the inventory to the SQLite file `filepath`, in bulk.
+        See :func:`carculator_two_wheeler.export.export_to_sqlite` for the arguments.
+
+        :return: the path of the SQLite file
+        """
+        from .export import export_to_sqlite
+
+        return export_to_sqlite(self, filepath, **kwargs)
+
+    def update(self, parameters: list):
+        """
+        Update the inventory after `parameters` of the vehicle model (:attr:`vm`) changed,
+        e.g., ``ic.update(["lifetime kilometers"])``. Only the cells of the A matrix
+        depending on these parameters (see :attr:`dependencies`) are rewritten, and the next
+        call to :meth:`calculate_impacts` solves the patched A matrix.
+        If a parameter is used elsewhere in the inventory, or changes
+        the electricity mix, the whole inventory is rebuilt. Modifies in place.
+
+        :param parameters: names of the parameters changed in :attr:`vm`
+        """
+        parameters = [parameters] if isinstance(parameters, str) else list(parameters)
+
+        self.array.loc[dict(parameter=parameters)] = (
+            format_array(self.vm.array.sel(parameter=parameters))
+            .sel(combined_dim=self.array.coords["combined_dim"])
+            .values
+        )
+
+        if not set(parameters) <= set().union(*self.dependencies.values()):
+            self._rebuild()
+            return
+
+        if "lifetime kilometers" in parameters and not np.allclose(
+            self.define_electricity_mix_for_fuel_prep(), self.mix
+        ):
+            self._rebuild()
+            return
+
+        vehicles = self.input_index.find(startswith=f"{self.vm.vehicle_type}, ")
+        transport = self.input_index.find(
+            startswith=f"transport, {self.vm.vehicle_type}, "
+        )
+
+        # cells of the components depending on the parameters
+        mapping = self.components_mapping
+        positions = np.flatnonzero(
+            np.isin(self.array.coords["parameter"].values, parameters)
+        )
+        cells = np.isin(mapping["parameters"], positions).any(axis=1) | np.isin(
+            mapping["only_if"], positions
+        )
+        mapping = {k: v[cells] for k, v in mapping.items()}
+
+        rows, columns = [mapping["rows"]], [mapping["columns"]]
+        exchanges = [self.component_exchanges(mapping)]
+
+        if self.dependencies["vehicle to transport"] & set(parameters):
+            # as in `add_vehicle_to_transport_dataset`
+            rows.append(vehicles)
+            columns.append(transport)
+            exchanges.append(
+                -1 / self.array.sel(parameter="lifetime kilometers").values
+            )
+
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+
+        # as in `remove_non_compliant_vehicles`, vehicles
+        # which do not have a TtW energy superior to 0 are removed
+        position = {c: k for k, c in enumerate(vehicles)}
+        position.update({c: k for k, c in enumerate(transport)})
+        compliant = self.array.sel(parameter="TtW energy").values > 0
+        exchanges = (
+            np.nan_to_num(np.concatenate(exchanges, axis=1))
+            * compliant[:, [position[c] for c in columns]]
+        )
+
+        if isinstance(self.A, StackedSparseMatrix):
+            self.A.set_entries(rows, columns, exchanges)
+        else:
+            self.A[:, rows, columns, :] = exchanges
 
-        print("*********************************************************************")
+    def _rebuild(self):
+        args, kwargs = self._init_arguments
+        self.__init__(*args, **kwargs)
@@ -0,0 +1,148 @@
+"""
+label_index.py contains LabelIndex, which finds labels (e.g., of the activities of the inventory)
+by the substrings or the tokens they contain, without scanning all the labels for each query.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+
+
+def _as_tuple(items) -> tuple:
+    if isinstance(items, tuple):
+        return items
+    if isinstance(items, str):
+        return (items,)
+    return tuple(items)
+
+
+class LabelIndex:
+    """
+    Index of a list of labels, which are strings or tuples of strings (e.g., the keys of
+    :attr:`Inventory.inputs`, of which the first item is the name of the activity).
+
+    Each substring looked for is searched in all the labels once, and the result
+    is kept, as is the result of each query, so that repeated lookups are dictionary hits.
+    Labels are also split in tokens, on ", ", for exact lookups, e.g., by size and powertrain.
+
+    :ivar labels: list of labels, in the order of their positions
+    """
+
+    SEPARATOR = ", "
+
+    def __init__(self, labels):
+        self.labels = list(labels)
+        self._fields = {}
+        self._matches = {}
+        self._queries = {}
+        self._tokens = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def field(self, position: int = None) -> np.ndarray:
+        """
+        Return the labels, or their item at `position` if labels are tuples
+        (the first item by default), as an array of strings.
+        """
+        if position is None and self._is_tuple:
+            position = 0
+        if position not in self._fields:
+            values = (
+                self.labels
+                if position is None
+                else [label[position] for label in self.labels]
+            )
+            self._fields[position] = np.array([str(v) for v in values], dtype=str)
+        return self._fields[position]
+
+    def _match(self, substring: str, position: int = None, prefix: bool = False):
+        if position is None and self._is_tuple:
+            position = 0
+        key = (substring, position, prefix)
+        if key not in self._matches:
+            field = self.field(position)
+            if prefix:
+                self._matches[key] = np.char.startswith(field, substring)
+            else:
+                self._matches[key] = np.char.find(field, substring) >= 0
+        return self._matches[key]
+
+    def mask(
+        self,
+        contains=(),
+        excludes=(),
+        any_of=(),
+        startswith: str = None,
+        position: int = None,
+        excludes_in: int = None,
+    ) -> np.ndarray:
+        """
+        Return a boolean array telling which labels match the query.
+
+        :param contains: substrings that must all be in the label
+        :param excludes: substrings that must not be in the label
+        :param any_of: groups of substrings, of which at least one per group must be in the label
+        :param startswith: prefix of the label
+        :param position: item of the labels to search in, if labels are tuples (the first one by default)
+        :param excludes_in: item of the labels in which `excludes` are searched, `position` by default
+        :return: boolean array, one value per label
+        """
+        contains, excludes = _as_tuple(contains), _as_tuple(excludes)
+        any_of = tuple(_as_tuple(group) for group in any_of)
+        excludes_in = position if excludes_in is None else excludes_in
+
+        key = (contains, excludes, any_of, startswith, position, excludes_in)
+        if key not in self._queries:
+            mask = np.ones(len(self.labels), dtype=bool)
+            if startswith is not None:
+                mask &= self._match(startswith, position, prefix=True)
+            for c in contains:
+                mask &= self._match(c, position)
+            for e in excludes:
+                mask &= ~self._match(e, excludes_in)
+            for group in any_of:
+                mask &= np.any([self._match(g, position) for g in group], axis=0)
+            self._queries[key] = mask
+        return self._queries[key]
+
+    def find(self, *args, **kwargs) -> list:
+        """
+        Return the positions of the labels matching the query (see :meth:`mask`).
+        """
+        return np.flatnonzero(self.mask(*args, **kwargs)).tolist()
+
+    def select(self, *args, **kwargs) -> list:
+        """
+        Return the labels matching the query (see :meth:`mask`), in their order.
+        """
+        return [self.labels[i] for i in self.find(*args, **kwargs)]
+
+    @property
+    def tokens(self) -> dict:
+        """
+        Dictionary of token: positions of the labels containing this token,
+        tokens being the parts of the labels separated by ", ".
+        """
+        if self._tokens is None:
+            tokens = defaultdict(list)
+            for i, label in enumerate(self.field()):
+                for token in set(label.split(self.SEPARATOR)):
+                    tokens[token].append(i)
+            self._tokens = {k: np.array(v) for k, v in tokens.items()}
+        return self._tokens
+
+    @property
+    def _is_tuple(self) -> bool:
+        return bool(self.labels) and isinstance(self.labels[0], tuple)
+
+    def lookup(self, *tokens) -> list:
+        """
+        Return the positions of the labels containing all `tokens`,
+        e.g., ``lookup("two-wheeler", "BEV", "Bicycle <25")``.
+        """
+        positions = None
+        for token in tokens:
+            found = self.tokens.get(token, np.array([], dtype=int))
+            positions = found if positions is None else np.intersect1d(positions, found)
+        return [] if positions is None else np.sort(positions).tolist()
@@ -1,16 +1,460 @@
+import copy
+import warnings
+from contextlib import contextmanager
 from itertools import product
 from pathlib import Path
 
 import numexpr as ne
 import numpy as np
+import pandas as pd
 import xarray as xr
-import yaml
 from carculator_utils.energy_consumption import EnergyConsumptionModel
 from carculator_utils.model import VehicleModel
 
+from . import DATA_DIR
+from .cache import MemoCache, hash_inputs, load_data_file, package_versions
+from .profiling import Profiler, logger, profile_stage
+from .rng import COSTS, iteration_streams
+
+VEHICLE_DIMS = ("size", "powertrain", "year", "value")
+
+# memo caches shared by all model instances. Their `directory` attribute
+# can be set, e.g., to `get_cache_dir() / "energy"`, to keep a copy on disk.
+ENERGY_MODELS = MemoCache(maxsize=8)
+ENERGY_RESULTS = MemoCache(maxsize=16, max_bytes=2**27)
+
+# number of seconds of the driving cycle processed at once
+# when only the sums over the cycle are kept
+ENERGY_BLOCK_SIZE = 300
+
+# attributes of the energy model holding one value per second of the driving cycle
+PER_SECOND_ATTRIBUTES = (
+    "cycle",
+    "gradient",
+    "velocity",
+    "acceleration",
+    "driving_time",
+)
+
+# battery chemistry of the vehicles of each year, see `TwoWheelerModel.set_battery_chemistry`
+DEFAULT_BATTERY_CHEMISTRIES = {
+    2000: "NMC-111",
+    2005: "NMC-111",
+    2010: "NMC-111",
+    2015: "NMC-111",
+    2020: "NMC-622",
+    2025: "NMC-811",
+    2030: "NMC-955",
+}
+
+# user-provided values which can differ from one scenario to another,
+# see `TwoWheelerModel.override_scenarios`
+SCENARIO_OVERRIDES = ("capacity", "target_mass", "target_range", "energy_consumption")
+
+# (size, powertrain, year) combinations which do not exist, see `get_availability`
+UNAVAILABLE_VEHICLES_FILE = DATA_DIR / "unavailable_vehicles.yaml"
+
+# stages of `set_all` and the parameters they read and write, see `recompute`
+STAGES_FILE = DATA_DIR / "model_stages.yaml"
+
+# energy terms kept for each second of the driving cycle
+# when only the sums over the cycle are kept, as used by the emission models
+PER_SECOND_ENERGY = [
+    "motive energy",
+    "auxiliary energy",
+    "recuperated energy",
+    "velocity",
+]
+
+
+def load_model_stages() -> dict:
+    """
+    Return the stages of :meth:`TwoWheelerModel.set_all`, in the order they run,
+    with the sets of parameters they read and write, from `model_stages.yaml`.
+
+    :return: dictionary of stage name (i.e., the method run): {"reads": set, "writes": set}
+    """
+    stages = load_data_file(STAGES_FILE)
+
+    return {
+        name: {"reads": frozenset(stage["reads"]), "writes": frozenset(stage["writes"])}
+        for name, stage in stages.items()
+    }
+
+
+def load_unavailable_vehicles() -> tuple:
+    """
+    Return the rules defining the two-wheelers which do not exist,
+    from `unavailable_vehicles.yaml`.
+
+    :return: tuple of dictionaries, with a "powertrain", and optionally "sizes" and "until" (a year)
+    """
+    return load_data_file(UNAVAILABLE_VEHICLES_FILE)
+
+
+def get_availability(array: xr.DataArray) -> xr.DataArray:
+    """
+    Tell which vehicles of `array` exist, according to the rules of :func:`load_unavailable_vehicles`.
+
+    :param array: array with ``size``, ``powertrain`` and ``year`` dimensions
+    :return: boolean array with dimensions ``size``, ``powertrain`` and ``year``
+    """
+    sizes = array.coords["size"]
+    powertrains = array.coords["powertrain"]
+    years = array.coords["year"]
+
+    available = xr.DataArray(
+        np.ones((len(sizes), len(powertrains), len(years)), dtype=bool),
+        coords={"size": sizes, "powertrain": powertrains, "year": years},
+        dims=("size", "powertrain", "year"),
+    )
+
+    for rule in load_unavailable_vehicles():
+        unavailable = powertrains == rule["powertrain"]
+        if "sizes" in rule:
+            unavailable = unavailable & sizes.isin(rule["sizes"])
+        if "until" in rule:
+            unavailable = unavailable & (years <= rule["until"])
+        available = available & ~unavailable
+
+    return available.transpose("size", "powertrain", "year")
+
+
+def select_scope(array: xr.DataArray, scope: dict) -> xr.DataArray:
+    """
+    Select the sizes, powertrains and years of `scope` in `array`, in the order of `array`.
+
+    :param array: array with ``size``, ``powertrain`` and ``year`` dimensions
+    :param scope: dictionary with the lists of "size", "powertrain" and/or "year" to keep
+    :return: the selection of `array`
+    """
+    selection = {}
+    for dim in ("size", "powertrain", "year"):
+        if dim not in scope:
+            continue
+
+        unknown = [v for v in scope[dim] if v not in array.coords[dim].values]
+        if unknown:
+            raise ValueError(f"Unknown {dim}(s) in the scope: {unknown}.")
+
+        selection[dim] = array.coords[dim].isin(scope[dim])
+
+    return array.sel(selection)
+
+
+def drop_unavailable_vehicles(array: xr.DataArray) -> xr.DataArray:
+    """
+    Drop the sizes, powertrains and years of `array` for which no vehicle is available
+    (see :func:`get_availability`), so that they are neither calculated nor added to the inventory.
+
+    :param array: array with ``size``, ``powertrain`` and ``year`` dimensions
+    :return: `array`, without the sizes, powertrains and years holding no available vehicle
+    """
+    available = get_availability(array)
+
+    if not available.any():
+        raise ValueError("None of the vehicles of the array are available.")
+
+    return array.sel(
+        size=available.any(dim=("powertrain", "year")),
+        powertrain=available.any(dim=("size", "year")),
+        year=available.any(dim=("size", "powertrain")),
+    )
+
+
+class MassLoopReport:
+    """
+    Outcome of the mass/power fixed-point loop run by :meth:`TwoWheelerModel.solve_mass_loop`.
+
+    :ivar iterations: number of passes each vehicle needed to converge,
+        with dimensions ``size``, ``powertrain``, ``year`` and ``value``
+    :ivar converged: boolean array, with the same dimensions, telling which vehicles converged
+    :ivar residuals: largest relative change in driving mass among the vehicles
+        still iterating, for each pass
+    :ivar acceleration: update scheme used (None or "aitken")
+    :ivar tolerance: relative tolerance on the driving mass
+
+    """
+
+    def __init__(self, iterations, converged, residuals, acceleration, tolerance):
+        self.iterations = iterations
+        self.converged = converged
+        self.residuals = residuals
+        self.acceleration = acceleration
+        self.tolerance = tolerance
+
+    @property
+    def n_iterations(self) -> int:
+        """Number of passes of the loop, i.e., those needed by the slowest vehicle."""
+        return len(self.residuals)
+
+    @property
+    def all_converged(self) -> bool:
+        return bool(self.converged.all())
+
+    def __repr__(self):
+        return (
+            f"MassLoopReport({self.n_iterations} passes, "
+            f"{int(self.converged.sum())}/{self.converged.size} vehicles converged, "
+            f"acceleration={self.acceleration})"
+        )
+
 
 class TwoWheelerModel(VehicleModel):
-    def set_all(self):
+    """
+    Two-wheeler model. See :class:`carculator_utils.model.VehicleModel` for the arguments.
+
+    :param seed: seed of the stochastic run. If given, the cost factor in :meth:`adjust_cost`
+        is drawn from the random number stream of each iteration, the labels
+        of the ``value`` coordinate being used as iteration indices.
+    :param keep_energy_per_second: if True, :attr:`energy` holds all the energy terms for each second
+        of the driving cycle (e.g., to plot them). Otherwise, their sums over the driving cycle are kept
+        in :attr:`energy_totals`, and :attr:`energy` only holds the terms needed by the emission models
+        (see :meth:`calculate_ttw_energy`).
+    :param scenarios: list of dictionaries of user-provided values, with keys among :data:`SCENARIO_OVERRIDES`
+        (e.g., ``{"capacity": {("BEV", "Scooter <4kW", 2020): 3}}``), all evaluated in one pass of :meth:`set_all`.
+        The ``value`` dimension of :attr:`array` is repeated once per scenario, and the values
+        given to the model itself (`energy_storage["capacity"]`, `target_mass`, ...) are used
+        by the scenarios which do not set them. See :meth:`split_scenarios` to get the results per scenario.
+        Values given to the model itself are applied as those of a scenario (see :meth:`override_scenarios`),
+        so that each scenario gives the results of a separate model given its values.
+    :param scope: dictionary with the lists of "size", "powertrain" and "year" to calculate,
+        e.g., ``{"size": ["Scooter <4kW"], "year": [2020]}``. The rest of `array` is dropped
+        before anything is calculated. Missing keys keep all their values.
+    :param drop_unavailable: if True (default), the sizes, powertrains and years of `array`
+        without any available vehicle (see `data/unavailable_vehicles.yaml`) are dropped.
+        :attr:`available` tells which of the remaining vehicles exist. The others are
+        not calculated by the mass loop, the energy model, the emission models and
+        :meth:`set_costs`, their costs are zero, and the sizes and powertrains available
+        in no year have no activities in the inventory built from the model.
+    :param profiler: a :class:`carculator_two_wheeler.profiling.Profiler`, or True for a new one,
+        to record the wall time and memory of each stage of :meth:`set_all` and of each pass
+        of the mass loop. The inventory built from the model records its stages in the same profiler.
+    :param dtype: floating-point type of :attr:`array`, of the energy terms kept for each second
+        and of the A matrix of the inventory built from the model. By default, that of `array`
+        (see :func:`carculator_two_wheeler.array.fill_xarray_from_input_parameters`).
+        Sums over the driving cycle are calculated in float64 whatever the dtype.
+    """
+
+    def __init__(
+        self,
+        array,
+        *args,
+        seed: int = None,
+        keep_energy_per_second: bool = False,
+        scenarios: list = None,
+        scope: dict = None,
+        drop_unavailable: bool = True,
+        profiler: Profiler = None,
+        dtype=None,
+        **kwargs,
+    ):
+        if scope is not None:
+            array = select_scope(array, scope)
+
+        if dtype is not None:
+            array = array.astype(dtype, copy=False)
+
+        if drop_unavailable:
+            array = drop_unavailable_vehicles(array)
+
+        self.available = get_availability(array)
+        self.profiler = Profiler() if profiler is True else profiler or None
+        self.dtype = array.dtype
+        self.seed = seed
+        self.keep_energy_per_second = keep_energy_per_second
+        self.energy_totals = None
+        self.scenarios = scenarios
+        self.iteration_labels = array.coords["value"].values
+        self.scenario_overrides = {}
+
+        if scenarios:
+            for scenario in scenarios:
+                unknown = set(scenario) - set(SCENARIO_OVERRIDES)
+                if unknown:
+                    raise ValueError(
+                        f"Unknown scenario override(s): {sorted(unknown)}. "
+                        f"Must be among {SCENARIO_OVERRIDES}."
+                    )
+
+            n_values = array.sizes["value"]
+            array = array.isel(
+                value=np.tile(np.arange(n_values), len(scenarios))
+            ).assign_coords(value=np.arange(n_values * len(scenarios)))
+
+        super().__init__(array, *args, **kwargs)
+
+        given = (
+            self.energy_storage.get("capacity"),
+            self.target_mass,
+            self.target_range,
+            self.energy_consumption,
+        )
+        if scenarios or any(given):
+            self.scenario_overrides = self._fill_scenario_overrides()
+
+    def _fill_scenario_overrides(self) -> dict:
+        """
+        Gather the values set by each scenario into one array per override, with dimensions
+        ``size``, ``powertrain``, ``year`` and ``value``, holding NaN where nothing is set.
+        The values given to the model itself are moved to the scenarios which do not set them,
+        or, without scenarios, to the only one the model runs.
+
+        :return: dictionary of override name: array, for the overrides set by at least one scenario
+        """
+        defaults = {
+            "capacity": self.energy_storage.pop("capacity", None),
+            "target_mass": self.target_mass,
+            "target_range": self.target_range,
+            "energy_consumption": self.energy_consumption,
+        }
+        self.target_mass = self.target_range = self.energy_consumption = None
+
+        positions = {
+            d: {k: i for i, k in enumerate(self.array.coords[d].values.tolist())}
+            for d in ("size", "powertrain", "year")
+        }
+        n_values = len(self.iteration_labels)
+        overrides = {}
+
+        for name in SCENARIO_OVERRIDES:
+            values = np.full(tuple(self.array.sizes[d] for d in VEHICLE_DIMS), np.nan)
+
+            for s, scenario in enumerate(self.scenarios or [{}]):
+                for (pwt, size, year), val in (
+                    scenario.get(name, defaults[name]) or {}
+                ).items():
+                    if (
+                        not val
+                        or pwt not in positions["powertrain"]
+                        or size not in positions["size"]
+                        or year not in positions["year"]
+                        # as in `override_range`, only the range of BEVs is set
+                        or (name == "target_range" and pwt != "BEV")
+                    ):
+                        continue
+
+                    values[
+                        positions["size"][size],
+                        positions["powertrain"][pwt],
+                        positions["year"][year],
+                        s * n_values : (s + 1) * n_values,
+                    ] = val
+
+            if not np.isnan(values).all():
+                overrides[name] = xr.DataArray(
+                    values,
+                    dims=VEHICLE_DIMS,
+                    coords={d: self.array.coords[d] for d in VEHICLE_DIMS},
+                )
+
+        return overrides
+
+    def override_scenarios(self, name: str) -> None:
+        """
+        Apply the values of the override `name` (see :data:`SCENARIO_OVERRIDES`) set by the scenarios,
+        at once for all of them. Vehicles for which no value is set keep theirs.
+        Does nothing if no scenario sets `name`.
+
+        The values given to the model itself (`target_mass`, `energy_consumption`, ...) are applied
+        here too, rather than by :meth:`override_vehicle_mass`, :meth:`override_ttw_energy`,
+        :meth:`override_range` and :meth:`override_battery_capacity`:
+
+        - a target mass does not stop the curb mass from being calculated from the components
+          in the mass loop: the glider base mass is adjusted in each pass so that
+          the curb mass reaches the target, and the driving mass follows;
+        - a given energy consumption replaces the ``TtW energy`` of the vehicle, but not the energy
+          terms of :attr:`energy` used by the emission models.
+
+        :param name: "capacity", "target_mass", "target_range" or "energy_consumption"
+        """
+        if name not in self.scenario_overrides:
+            return
+
+        target = self.scenario_overrides[name].sel(
+            {d: self.array.coords[d] for d in VEHICLE_DIMS}
+        )
+        given = target.notnull()
+
+        if name == "target_mass":
+            self["glider base mass"] = xr.where(
+                given,
+                self["glider base mass"]
+                + (target - self["curb mass"]) / (1 - self["lightweighting"]),
+                self["glider base mass"],
+            )
+            self["curb mass"] = xr.where(given, target, self["curb mass"])
+            self["driving mass"] = self["curb mass"] + self["total cargo mass"]
+
+        elif name == "capacity":
+            self["electric energy stored"] = xr.where(
+                given, target, self["electric energy stored"]
+            )
+            self["energy battery mass"] = xr.where(
+                given,
+                target
+                / self["battery cell energy density"]
+                / self["battery cell mass share"],
+                self["energy battery mass"],
+            )
+            self.set_battery_properties()
+
+        elif name == "target_range":
+            self["energy battery mass"] = xr.where(
+                given,
+                target
+                * self["TtW energy"]
+                / self["battery DoD"]
+                / 3600
+                / self["battery cell energy density"]
+                / self["battery cell mass share"],
+                self["energy battery mass"],
+            )
+            self.set_battery_properties()
+            self.set_energy_stored_properties()
+            self.set_range()
+
+        elif name == "energy_consumption":
+            # as in `override_ttw_energy`, vehicles heavier than their gross mass are flagged
+            if "gross mass" in self.array.coords["parameter"].values:
+                target = target.where(self["driving mass"] <= self["gross mass"], 0)
+
+            self["TtW energy"] = xr.where(given, target, self["TtW energy"])
+            self["TtW energy, combustion mode"] = self["TtW energy"] * (
+                self["combustion power share"] > 0
+            )
+            self["TtW energy, electric mode"] = self["TtW energy"] * (
+                self["combustion power share"] == 0
+            )
+
+    def split_scenarios(self, data: xr.DataArray) -> xr.DataArray:
+        """
+        Split the ``value`` dimension of `data` (e.g., :attr:`array`, or the results
+        of :meth:`calculate_cost_impacts` or of the inventory) into a ``scenario`` dimension,
+        in the order of :attr:`scenarios`, and a ``value`` dimension, with the original labels.
+
+        :param data: array with a ``value`` dimension, repeated once per scenario
+        :return: array with an additional ``scenario`` dimension
+        """
+        n_values = len(self.iteration_labels)
+
+        return xr.concat(
+            [
+                data.isel(value=slice(s * n_values, (s + 1) * n_values)).assign_coords(
+                    value=self.iteration_labels
+                )
+                for s in range(len(self.scenarios))
+            ],
+            dim=pd.Index(range(len(self.scenarios)), name="scenario"),
+        )
+
+    def set_all(
+        self,
+        tolerance=0.001,
+        max_iterations=50,
+        acceleration=None,
+        track_changes=False,
+    ):
         """
         This method runs a series of other methods to obtain the tank-to-wheel energy requirement, efficiency
         of the car, costs, etc.
@@ -18,17 +462,140 @@ class TwoWheelerModel(VehicleModel):
         :meth:`set_component_masses()`, :meth:`set_car_masses()` and :meth:`set_power_parameters()` are interdependent.
         `powertrain_mass` depends on `power`, `curb_mass` is affected by changes in `powertrain_mass`,
         `combustion engine mass` and `electric engine mass`, and `power` is a function of `curb_mass`.
-        The current solution is to loop through the methods until the increment in driving mass is
-        inferior to 0.1%.
+        These methods are looped through by :meth:`solve_mass_loop` until the relative change in driving mass
+        of each vehicle is inferior to `tolerance` (0.1% by default). The iteration report is stored
+        in :attr:`mass_loop_report`.
+
+        The stages run, and the parameters they read and write, are listed in `data/model_stages.yaml`
+        (see :meth:`recompute`).
+
+        :param tolerance: relative tolerance on the driving mass of each vehicle
+        :param max_iterations: maximum number of passes through the mass loop
+        :param acceleration: None, or "aitken" to extrapolate the curb mass with Aitken's delta-squared method
+        :param track_changes: if True, the values of the parameters each stage reads are kept,
+            before it runs, in :attr:`stage_inputs`, so that :meth:`recompute` can be called.
+            This takes about 40% more memory than :attr:`array` alone.
+        :returns: Does not return anything. Modifies ``self.array`` in place.
 
+        """
 
-        :returns: Does not return anything. Modifies ``self.array`` in place.
+        logger.info("Building two-wheelers...")
 
+        with profile_stage(self.profiler, "set_all"):
+            with profile_stage(self.profiler, "get_energy_model"):
+                self.ecm = self.get_energy_model()
+            self.mass_loop_arguments = dict(
+                tolerance=tolerance,
+                max_iterations=max_iterations,
+                acceleration=acceleration,
+            )
+
+            self.stage_inputs = {} if track_changes else None
+            for stage in load_model_stages():
+                self._run_stage(stage)
+
+        logger.info("Done!")
+
+    def recompute(self, changed_parameters: list) -> list:
         """
+        Update the model after parameters of :attr:`array` were changed, once :meth:`set_all` has run,
+        e.g., ``model.recompute(["interest rate"])``. Only the stages of :meth:`set_all` invalidated
+        by the change are run again, in the same order: those which read a changed parameter,
+        or a parameter written by a stage run before (see :func:`load_model_stages`).
+        A cost input, for example, only runs :meth:`set_costs` again.
+        :meth:`set_all` must have been run with ``track_changes=True``.
+
+        :param changed_parameters: names of the parameters changed
+        :return: the names of the stages run
+        """
+        if getattr(self, "stage_inputs", None) is None:
+            raise ValueError(
+                "The inputs of the stages were not kept. "
+                "Run `set_all(track_changes=True)` before `recompute`."
+            )
 
-        print("Building two-wheelers...")
+        if isinstance(changed_parameters, str):
+            changed_parameters = [changed_parameters]
+
+        changed = set(changed_parameters)
+        stages = []
+
+        for stage, dependencies in load_model_stages().items():
+            if changed & dependencies["reads"]:
+                # the stage runs on the values it read in `set_all`,
+                # except for the parameters changed since
+                previous = self.stage_inputs[stage]
+                kept = [
+                    p
+                    for p in previous.coords["parameter"].values.tolist()
+                    if p not in changed
+                ]
+                current = self.array.loc[dict(parameter=kept)].copy()
+                self.array.loc[dict(parameter=kept)] = previous.loc[
+                    dict(parameter=kept)
+                ]
+
+                self._run_stage(stage)
+
+                # parameters modified by the stages run after it in `set_all` are put back
+                kept = [p for p in kept if p not in dependencies["writes"]]
+                self.array.loc[dict(parameter=kept)] = current.loc[dict(parameter=kept)]
+
+                changed |= dependencies["writes"]
+                stages.append(stage)
+
+        return stages
+
+    def _run_stage(self, stage: str) -> None:
+        # keep the values of the parameters the stage reads, before it runs
+        if self.stage_inputs is not None:
+            reads = load_model_stages()[stage]["reads"]
+            self.stage_inputs[stage] = self.array.loc[
+                dict(
+                    parameter=[
+                        p
+                        for p in self.array.coords["parameter"].values.tolist()
+                        if p in reads
+                    ]
+                )
+            ].copy()
+
+        with profile_stage(self.profiler, stage):
+            getattr(self, stage)()
+
+    def set_masses(self) -> None:
+        """
+        Run the mass loop (see :meth:`solve_mass_loop`), with the arguments
+        given to :meth:`set_all`, and store its report in :attr:`mass_loop_report`.
+        """
+        self.mass_loop_report = self.solve_mass_loop(**self.mass_loop_arguments)
+
+    def set_ttw_energy(self) -> None:
+        """
+        Calculate the tank-to-wheel energy, unless it is provided by the user.
+        """
+        self.calculate_ttw_energy()
+        self.override_scenarios("energy_consumption")
+
+    def set_target_range(self) -> None:
+        """
+        Size the energy storage of the available vehicles to reach the range
+        provided by the user, if any.
+        """
+        if "target_range" in self.scenario_overrides:
+            self._run_on_available_vehicles(
+                lambda: self.override_scenarios("target_range")
+            )
+
+    def get_energy_model(self) -> EnergyConsumptionModel:
+        """
+        Return the energy consumption model for the driving cycle, gradient, country,
+        sizes and powertrains of the model. Energy models are memoized in :data:`ENERGY_MODELS`,
+        so that the driving cycle and gradient are only loaded once for all model instances.
 
-        self.ecm = EnergyConsumptionModel(
+        :return: an :class:`EnergyConsumptionModel`
+        """
+        args = dict(
             vehicle_type="two-wheeler",
             vehicle_size=list(self.array.coords["size"].values),
             powertrains=list(self.array.coords["powertrain"].values),
@@ -36,89 +603,338 @@ class TwoWheelerModel(VehicleModel):
             gradient=self.gradient,
             country=self.country,
         )
+        self._energy_model_key = hash_inputs(args, package_versions())
 
-        diff = 1.0
-        while diff > 0.001:
-            old_driving_mass = self["driving mass"].sum().values
+        ecm = ENERGY_MODELS.get(self._energy_model_key)
+        if ecm is None:
+            ecm = EnergyConsumptionModel(**args)
+            ENERGY_MODELS.set(self._energy_model_key, ecm)
 
-            if self.target_mass:
-                self.override_vehicle_mass()
-            else:
+        return ecm
+
+    def solve_mass_loop(
+        self, tolerance=0.001, max_iterations=50, acceleration=None
+    ) -> MassLoopReport:
+        """
+        Loop through the interdependent mass, power and battery methods
+        until the driving mass of each vehicle (i.e., each size, powertrain,
+        year and iteration) changes by less than `tolerance`, relatively.
+
+        Convergence is tracked per vehicle: once a vehicle has converged, its values
+        are frozen and only the sizes and powertrains that still hold unconverged vehicles
+        are recomputed in the following passes. Unavailable vehicles (see :attr:`available`)
+        are not iterated: they keep their values, and are reported as converged in 0 passes.
+
+        With `acceleration="aitken"`, the curb mass of the vehicles still iterating
+        is extrapolated every third pass with Aitken's delta-squared method, which
+        cuts the number of passes needed for the slowly converging vehicles.
+        It only pays off when component masses feed back into the curb mass through the power:
+        with the default parameters, engine masses are part of the powertrain mass shares
+        and the loop converges in a few passes either way.
+
+        :param tolerance: relative tolerance on the driving mass
+        :param max_iterations: maximum number of passes
+        :param acceleration: None or "aitken"
+        :return: a :class:`MassLoopReport`
+        """
+
+        if acceleration not in (None, "aitken"):
+            raise ValueError(
+                f"Unknown acceleration scheme: {acceleration}. Must be None or 'aitken'."
+            )
+
+        shape = tuple(self.array.sizes[d] for d in VEHICLE_DIMS)
+        active = np.broadcast_to(self._availability()[..., None], shape).copy()
+        iterations = np.zeros(shape, dtype=int)
+        residuals = []
+        history = []
+
+        previous = self._vehicle_values("driving mass")
+        curb_mass = self._vehicle_values("curb mass")
+
+        for i in range(1, max_iterations + 1):
+            if not active.any():
+                break
+
+            s_idx = np.flatnonzero(active.any(axis=(1, 2, 3)))
+            p_idx = np.flatnonzero(active.any(axis=(0, 2, 3)))
+            box = np.ix_(s_idx, p_idx)
+
+            with profile_stage(
+                self.profiler, f"mass loop, pass {i}"
+            ), self._restrict_to_vehicles(s_idx, p_idx, active[box]):
                 self.set_vehicle_masses()
+                self.override_scenarios("target_mass")
+
+                if acceleration == "aitken":
+                    curb_mass = curb_mass.copy()
+                    curb_mass[box] = self._vehicle_values("curb mass")
+                    history.append(curb_mass)
+
+                    if len(history) == 3:
+                        self._aitken_update(history, box)
+                        history = []
+
+                self.set_power_parameters()
+                self.set_component_masses()
+                self.set_battery_properties()
+                self.set_energy_stored_properties()
+                self.set_recuperation()
+                self.set_battery_preferences()
+
+                # if user-provided values are passed,
+                # they override the default values
+                self.override_scenarios("capacity")
+
+            current = self._vehicle_values("driving mass")
+
+            _ = lambda x: np.where(x == 0, 1, x)
+            change = np.abs(current - previous) / _(np.abs(previous))
+            residuals.append(float(change[active].max()))
+
+            iterations[active] = i
+            active &= change > tolerance
+            previous = current
+
+        if active.any():
+            warnings.warn(
+                f"The mass loop did not converge for {int(active.sum())} vehicle(s) "
+                f"after {max_iterations} iterations."
+            )
 
-            self.set_power_parameters()
-            self.set_component_masses()
-            self.set_battery_properties()
-            self.set_energy_stored_properties()
-            self.set_recuperation()
-            self.set_battery_preferences()
+        coords = {d: self.array.coords[d].values for d in VEHICLE_DIMS}
 
-            # if user-provided values are passed,
-            # they override the default values
-            if "capacity" in self.energy_storage:
-                self.override_battery_capacity()
+        return MassLoopReport(
+            iterations=xr.DataArray(iterations, coords=coords, dims=VEHICLE_DIMS),
+            converged=xr.DataArray(~active, coords=coords, dims=VEHICLE_DIMS),
+            residuals=residuals,
+            acceleration=acceleration,
+            tolerance=tolerance,
+        )
 
-            diff = (self["driving mass"].sum().values - old_driving_mass) / self[
-                "driving mass"
-            ].sum()
+    def _availability(self) -> np.ndarray:
+        """Return :attr:`available` as a numpy array of shape (size, powertrain, year)."""
+        return (
+            self.available.sel({d: self.array.coords[d] for d in VEHICLE_DIMS[:-1]})
+            .transpose(*VEHICLE_DIMS[:-1])
+            .values
+        )
 
-        if self.energy_consumption:
-            self.override_ttw_energy()
-        else:
-            self.calculate_ttw_energy()
-        self.set_ttw_efficiency()
-        self.set_range()
+    def _available_boxes(self):
+        """
+        Yield, for each powertrain, the positions of the sizes holding at least one
+        available vehicle of the powertrain, the position of the powertrain, and which vehicles
+        of this box are available, as an array of shape (size, powertrain, year, value),
+        i.e., the arguments of :meth:`_restrict_to_vehicles`.
+        """
+        available = self._availability()
+        n_values = self.array.sizes["value"]
 
-        if self.target_range:
-            self.override_range()
-            self.set_energy_stored_properties()
+        for p in range(available.shape[1]):
+            s_idx = np.flatnonzero(available[:, p].any(axis=1))
+            if len(s_idx) == 0:
+                continue
 
-        self.set_share_recuperated_energy()
-        self.set_battery_fuel_cell_replacements()
-        self.adjust_cost()
+            mask = available[s_idx, p : p + 1, :, None]
+            yield s_idx, np.array([p]), np.broadcast_to(
+                mask, mask.shape[:-1] + (n_values,)
+            )
+
+    def _run_on_available_vehicles(self, method) -> None:
+        """
+        Run `method` on the available vehicles only, one powertrain at a time,
+        with :attr:`array`, :attr:`energy` and :attr:`energy_totals` narrowed down
+        to the sizes holding available vehicles. Unavailable vehicles keep their values.
+        """
+        energy, energy_totals = self.energy, self.energy_totals
+
+        try:
+            for s_idx, p_idx, mask in self._available_boxes():
+                box = dict(size=s_idx, powertrain=p_idx)
+                if energy is not None:
+                    self.energy = energy.isel(box)
+                if energy_totals is not None:
+                    self.energy_totals = energy_totals.isel(box)
+
+                with self._restrict_to_vehicles(s_idx, p_idx, mask):
+                    method()
+        finally:
+            self.energy, self.energy_totals = energy, energy_totals
+
+    def _vehicle_values(self, parameter) -> np.ndarray:
+        """Return the values of `parameter` as a numpy array of shape (size, powertrain, year, value)."""
+        return self[parameter].transpose(*VEHICLE_DIMS).values.copy()
+
+    def _aitken_update(self, history, box):
+        """
+        Replace the curb mass of the vehicles in `box` by its Aitken extrapolation
+        from the last three iterates in `history`, where it is well-defined.
+        """
+        x0, x1, x2 = (h[box] for h in history)
+        denominator = x2 - 2 * x1 + x0
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            extrapolated = x2 - (x2 - x1) ** 2 / denominator
+
+        valid = (
+            (np.abs(denominator) > 1e-9 * np.abs(x2))
+            & np.isfinite(extrapolated)
+            & (extrapolated > 0)
+        )
+
+        curb_mass = np.where(valid, extrapolated, x2)
+        dims = self["curb mass"].dims
+
+        self["curb mass"] = xr.DataArray(
+            curb_mass,
+            dims=VEHICLE_DIMS,
+            coords={d: self.array.coords[d] for d in VEHICLE_DIMS},
+        ).transpose(*dims)
+        self["driving mass"] = self["curb mass"] + self["total cargo mass"]
+
+    @contextmanager
+    def _restrict_to_vehicles(self, size_idx, powertrain_idx, mask):
+        """
+        Temporarily narrow :attr:`array` down to the sizes and powertrains given by their
+        indices. On exit, only the vehicles flagged in `mask` (of shape size, powertrain, year, value)
+        are written back into the full array, so that converged vehicles keep their values.
+        """
 
-        self.set_electricity_consumption()
-        self.set_costs()
-        self.set_hot_emissions()
-        self.set_particulates_emission()
-        self.set_noise_emissions()
+        if (
+            mask.all()
+            and len(size_idx) == self.array.sizes["size"]
+            and len(powertrain_idx) == self.array.sizes["powertrain"]
+        ):
+            yield
+            return
 
-        self.remove_energy_consumption_from_unavailable_vehicles()
+        full_array = self.array
+        sizes = full_array.coords["size"].values[size_idx].tolist()
+        powertrains = full_array.coords["powertrain"].values[powertrain_idx].tolist()
 
-        print("Done!")
+        in_box = lambda d: {
+            k: v for k, v in (d or {}).items() if k[0] in powertrains and k[1] in sizes
+        }
+        power = self.power
+
+        self.array = full_array.loc[dict(size=sizes, powertrain=powertrains)].copy()
+        self.power = in_box(power) or None
+
+        try:
+            yield
+        finally:
+            subset = self.array
+            self.array = full_array
+            self.power = power
+
+        mask = xr.DataArray(
+            mask,
+            dims=VEHICLE_DIMS,
+            coords={
+                "size": sizes,
+                "powertrain": powertrains,
+                "year": full_array.coords["year"],
+                "value": full_array.coords["value"],
+            },
+        )
+        self.array.loc[dict(size=sizes, powertrain=powertrains)] = xr.where(
+            mask, subset, full_array.loc[dict(size=sizes, powertrain=powertrains)]
+        ).transpose(*full_array.dims)
 
     def set_battery_chemistry(self):
-        # override default values for batteries
-        # if provided by the user
+        """
+        Assign a battery chemistry to each vehicle, in :attr:`battery_chemistry`, an array of strings
+        with dimensions ``size``, ``powertrain`` and ``year``. Each year takes the chemistry of the latest
+        year of :data:`DEFAULT_BATTERY_CHEMISTRIES` it is not earlier than (or the earliest chemistry,
+        before the first year). Chemistries provided by the user in `energy_storage["electric"]`,
+        for (powertrain, size, year) keys, override the default ones.
+
+        `energy_storage["electric"]` is then filled in with the chemistry of each vehicle,
+        for :mod:`carculator_utils`.
+        """
         if "electric" not in self.energy_storage:
             self.energy_storage["electric"] = {}
 
-        default_chemistries = {
-            2000: "NMC-111",
-            2005: "NMC-111",
-            2010: "NMC-111",
-            2015: "NMC-111",
-            2020: "NMC-622",
-            2025: "NMC-811",
-            2030: "NMC-955",
-        }
+        years = sorted(DEFAULT_BATTERY_CHEMISTRIES)
+        chemistries = np.array(
+            [DEFAULT_BATTERY_CHEMISTRIES[y] for y in years], dtype=object
+        )
+        position = np.searchsorted(
+            years, self.array.coords["year"].values, side="right"
+        )
 
-        for x in product(
-            self.array.coords["powertrain"].values,
-            self.array.coords["size"].values,
-            self.array.year.values,
-        ):
-            if x not in self.energy_storage["electric"]:
-                if x[-1] in default_chemistries:
-                    self.energy_storage["electric"][x] = default_chemistries[x[-1]]
-                elif x[-1] < min(default_chemistries.keys()):
-                    self.energy_storage["electric"][x] = "NMC-111"
-                else:
-                    self.energy_storage["electric"][x] = "NMC-955"
+        self.battery_chemistry = xr.DataArray(
+            np.broadcast_to(
+                chemistries[np.clip(position - 1, 0, None)],
+                (
+                    self.array.sizes["size"],
+                    self.array.sizes["powertrain"],
+                    len(position),
+                ),
+            ).copy(),
+            coords={d: self.array.coords[d] for d in ("size", "powertrain", "year")},
+            dims=("size", "powertrain", "year"),
+        )
+
+        for (pwt, size, year), chemistry in self.energy_storage["electric"].items():
+            if (
+                chemistry is not None
+                and pwt in self.array.coords["powertrain"].values
+                and size in self.array.coords["size"].values
+                and year in self.array.coords["year"].values
+            ):
+                self.battery_chemistry.loc[
+                    dict(powertrain=pwt, size=size, year=year)
+                ] = chemistry
+
+        self.energy_storage["electric"] = {
+            (pwt, size, year): chemistry
+            for (size, pwt, year), chemistry in zip(
+                product(
+                    self.array.coords["size"].values.tolist(),
+                    self.array.coords["powertrain"].values.tolist(),
+                    self.array.coords["year"].values.tolist(),
+                ),
+                self.battery_chemistry.values.ravel().tolist(),
+            )
+        }
 
         if "origin" not in self.energy_storage:
             self.energy_storage.update({"origin": "CN"})
 
+    def set_battery_preferences(self):
+        """
+        Set the battery cell energy density, mass share, cycle life and cost of each vehicle
+        to those of its chemistry (see :attr:`battery_chemistry`), i.e., the parameters
+        suffixed with the name of the chemistry, for all vehicles of a chemistry at once.
+        """
+        parameters = self.array.coords["parameter"].values.tolist()
+        l_parameters = [
+            p
+            for p in [
+                "battery cell energy density",
+                "battery cell mass share",
+                "battery cycle life",
+                "energy battery cost per kWh",
+            ]
+            if p in parameters
+        ]
+
+        if not l_parameters:
+            return
+
+        battery_chemistry = self.battery_chemistry.sel(
+            {d: self.array.coords[d] for d in ("size", "powertrain", "year")}
+        )
+
+        for chemistry in np.unique(battery_chemistry.values).tolist():
+            if any(f"{p}, {chemistry}" not in parameters for p in l_parameters):
+                continue
+
+            is_chemistry = battery_chemistry == chemistry
+            for p in l_parameters:
+                self[p] = xr.where(is_chemistry, self[f"{p}, {chemistry}"], self[p])
+
     def adjust_cost(self):
         """
         This method adjusts costs of energy storage over time, to correct for the overly optimistic linear
@@ -126,7 +942,10 @@ class TwoWheelerModel(VehicleModel):
 
         """
 
-        n_iterations = self.array.shape[-1]
+        # with scenarios, the same cost factors are used for each of them
+        iterations = self.iteration_labels
+        n_iterations = len(iterations)
+        n_scenarios = len(self.scenarios) if self.scenarios else 1
         n_year = len(self.array.year.values)
 
         # If uncertainty is not considered, the cost factor equals 1.
@@ -135,8 +954,15 @@ class TwoWheelerModel(VehicleModel):
         if n_iterations == 1:
             cost_factor = 1
         else:
-            if "reference" in self.array.value.values.tolist():
+            if "reference" in iterations.tolist():
                 cost_factor = np.ones((n_iterations, 1))
+            elif self.seed is not None:
+                cost_factor = np.array(
+                    [
+                        stream.triangular(0.7, 1, 1.3)
+                        for stream in iteration_streams(self.seed, iterations, COSTS)
+                    ]
+                ).reshape((n_iterations, 1))
             else:
                 cost_factor = np.random.triangular(0.7, 1, 1.3, (n_iterations, 1))
 
@@ -148,9 +974,15 @@ class TwoWheelerModel(VehicleModel):
             :,
             :,
         ] = np.reshape(
-            (2.75e86 * np.exp(-9.61e-2 * self.array.year.values) + 5.059e1)
-            * cost_factor,
-            (1, 1, n_year, n_iterations),
+            np.tile(
+                np.reshape(
+                    (2.75e86 * np.exp(-9.61e-2 * self.array.year.values) + 5.059e1)
+                    * cost_factor,
+                    (n_year, n_iterations),
+                ),
+                (1, n_scenarios),
+            ),
+            (1, 1, n_year, n_iterations * n_scenarios),
         )
 
         # Correction of power battery system cost, per kW
@@ -167,19 +999,40 @@ class TwoWheelerModel(VehicleModel):
             :,
             :,
         ] = np.reshape(
-            (8.337e40 * np.exp(-4.49e-2 * self.array.year.values) + 11.17)
-            * cost_factor,
-            (1, 1, n_year, n_iterations),
+            np.tile(
+                np.reshape(
+                    (8.337e40 * np.exp(-4.49e-2 * self.array.year.values) + 11.17)
+                    * cost_factor,
+                    (n_year, n_iterations),
+                ),
+                (1, n_scenarios),
+            ),
+            (1, 1, n_year, n_iterations * n_scenarios),
         )
 
-    def calculate_ttw_energy(self) -> None:
+    def calculate_ttw_energy(self, block_size: int = ENERGY_BLOCK_SIZE) -> None:
         """
         This method calculates the energy required to operate auxiliary services as well
         as to move the car. The sum is stored under the parameter label "TtW energy" in :attr:`self.array`.
 
+        Unless :attr:`keep_energy_per_second` is True, the driving cycle is processed `block_size` seconds
+        at a time and the energy terms are summed over the cycle as they are calculated, in :attr:`energy_totals`,
+        so that they are never all held for every second of the cycle at once. :attr:`energy` then only holds,
+        for each second, the terms listed in :data:`PER_SECOND_ENERGY`, which the emission models need.
+
+        Results of static runs (i.e., of a single iteration) are memoized in :data:`ENERGY_RESULTS`,
+        under a hash of the energy model and of the physical inputs, so that identical vehicles
+        are only calculated once. The arrays stored in :attr:`energy` and :attr:`energy_totals`
+        are then read-only, as they can be shared by other model instances.
+        Stochastic inputs never repeat, hence their results are not memoized.
+
+        Only the available vehicles are driven through the cycle (see :meth:`_calculate_energy`):
+        the energy terms and ``TtW energy`` of the other vehicles are zero.
+
+        :param block_size: number of seconds of the driving cycle processed at once
         """
 
-        self.energy = self.ecm.motive_energy_per_km(
+        inputs = dict(
             driving_mass=self["driving mass"],
             rr_coef=self["rolling resistance coefficient"],
             drag_coef=self["aerodynamic drag coefficient"],
@@ -194,23 +1047,36 @@ class TwoWheelerModel(VehicleModel):
             battery_discharge_eff=self["battery discharge efficiency"],
         )
 
-        self.energy = self.energy.assign_coords(
-            {
-                "powertrain": self.array.powertrain,
-                "year": self.array.year,
-                "size": self.array.coords["size"],
-            }
-        )
+        memoize = len(self.iteration_labels) == 1
+        cached = None
 
-        distance = self.energy.sel(parameter="velocity").sum(dim="second") / 1000
+        if memoize:
+            key = hash_inputs(
+                self._energy_model_key, inputs, self.keep_energy_per_second
+            )
+            cached = ENERGY_RESULTS.get(key)
+
+        if cached is None:
+            cached = self._calculate_energy(inputs, block_size)
+
+            if memoize:
+                for array in cached:
+                    array.data.setflags(write=False)
+                ENERGY_RESULTS.set(key, cached)
+
+        self.energy_totals, self.energy = cached
+
+        # unavailable vehicles do not drive the cycle
+        _ = lambda x: xr.where(x == 0, 1, x)
+        distance = _(self.energy_totals.sel(parameter="velocity") / 1000)
 
         self["TtW energy"] = (
-            self.energy.sel(
+            self.energy_totals.sel(
                 parameter=[
                     "motive energy",
                     "auxiliary energy",
                 ]
-            ).sum(dim=["second", "parameter"])
+            ).sum(dim="parameter")
             / distance
         ).T
 
@@ -222,9 +1088,159 @@ class TwoWheelerModel(VehicleModel):
         )
 
         self["auxiliary energy"] = (
-            self.energy.sel(parameter="auxiliary energy").sum(dim="second") / distance
+            self.energy_totals.sel(parameter="auxiliary energy") / distance
         ).T
 
+    def _calculate_energy(self, inputs: dict, block_size: int) -> tuple:
+        """
+        Calculate the energy terms of the available vehicles (see :attr:`available`),
+        one powertrain at a time, over the sizes holding available vehicles of the powertrain.
+        The terms of the other vehicles are zero.
+
+        :return: the sums over the driving cycle, in float64, and the terms kept for each second,
+            in :attr:`dtype` (see :meth:`calculate_ttw_energy`)
+        """
+        totals, per_second = None, None
+
+        for s_idx, p_idx, _ in self._available_boxes():
+            box = dict(size=s_idx, powertrain=p_idx)
+            ecm = self._energy_model_for_sizes(s_idx)
+            box_inputs = {k: v.isel(box) for k, v in inputs.items()}
+
+            if self.keep_energy_per_second:
+                energy = ecm.motive_energy_per_km(**box_inputs)
+                # summed before being stored in `dtype`
+                box_totals = energy.sum(dim="second", dtype=np.float64)
+                box_per_second = energy.astype(self.dtype, copy=False)
+            else:
+                box_totals, box_per_second = self._sum_energy_over_cycle(
+                    box_inputs, block_size, ecm
+                )
+
+            if totals is None:
+                totals = self._empty_energy(box_totals, np.float64)
+                per_second = self._empty_energy(box_per_second, self.dtype)
+
+            totals[box] = box_totals.values
+            per_second[box] = box_per_second.values
+
+        return self._label_energy(totals), self._label_energy(per_second)
+
+    def _energy_model_for_sizes(self, size_idx) -> EnergyConsumptionModel:
+        """Return a copy of :attr:`ecm` restricted to the sizes at positions `size_idx`."""
+        n_sizes = self.array.sizes["size"]
+        if len(size_idx) == n_sizes:
+            return self.ecm
+
+        ecm = copy.copy(self.ecm)
+        for attr in PER_SECOND_ATTRIBUTES:
+            array = getattr(self.ecm, attr)
+            # sizes are along the second axis of the cycle and gradient,
+            # and along the last axis of the other terms
+            axis = 1 if array.ndim == 2 else -1
+            if array.ndim > 1 and array.shape[axis] == n_sizes:
+                setattr(ecm, attr, np.take(array, size_idx, axis=axis))
+
+        ecm.vehicle_size = [self.ecm.vehicle_size[i] for i in size_idx]
+        return ecm
+
+    def _empty_energy(self, energy: xr.DataArray, dtype) -> xr.DataArray:
+        """Return an array of zeros shaped as `energy`, for all the vehicles of :attr:`array`."""
+        shape = tuple(
+            self.array.sizes[d] if d in VEHICLE_DIMS else n
+            for d, n in zip(energy.dims, energy.shape)
+        )
+        return xr.DataArray(
+            np.zeros(shape, dtype=dtype),
+            dims=energy.dims,
+            coords={d: c for d, c in energy.coords.items() if d not in VEHICLE_DIMS},
+        )
+
+    def _label_energy(self, energy: xr.DataArray) -> xr.DataArray:
+        return energy.assign_coords(
+            {
+                "powertrain": self.array.powertrain,
+                "year": self.array.year,
+                "size": self.array.coords["size"],
+                "value": self.array.coords["value"],
+            }
+        )
+
+    def _sum_energy_over_cycle(
+        self, inputs: dict, block_size: int, ecm: EnergyConsumptionModel = None
+    ) -> tuple:
+        """
+        Sum the energy terms calculated by :meth:`EnergyConsumptionModel.motive_energy_per_km`
+        over the driving cycle, one block of `block_size` seconds at a time.
+        All terms are calculated second by second, hence the sums are those of the whole cycle.
+
+        :param ecm: energy model, :attr:`ecm` by default
+        :return: the sums over the driving cycle, in float64, and the terms of :data:`PER_SECOND_ENERGY`
+            for each second, in :attr:`dtype`
+        """
+        full_ecm = ecm if ecm is not None else self.ecm
+        n_seconds = full_ecm.velocity.shape[0]
+        totals, per_second = None, None
+
+        for start in range(0, n_seconds, block_size):
+            block = slice(start, start + block_size)
+
+            ecm = copy.copy(full_ecm)
+            for attr in PER_SECOND_ATTRIBUTES:
+                setattr(ecm, attr, getattr(full_ecm, attr)[block])
+
+            # the energy model may modify efficiency arrays in place
+            energy = ecm.motive_energy_per_km(
+                **{k: v.copy() for k, v in inputs.items()}
+            )
+            kept = energy.sel(parameter=PER_SECOND_ENERGY)
+
+            if per_second is None:
+                totals = energy.sum(dim="second", dtype=np.float64)
+                per_second = xr.DataArray(
+                    np.empty((n_seconds,) + kept.shape[1:], dtype=self.dtype),
+                    dims=kept.dims,
+                    coords={**kept.coords, "second": range(n_seconds)},
+                )
+            else:
+                totals += energy.sum(dim="second", dtype=np.float64)
+
+            per_second[block] = kept.values
+
+        return totals, per_second
+
+    def set_ttw_efficiency(self) -> None:
+        """
+        Fill in the tank-to-wheel efficiency, from the sums over the driving cycle
+        of the motive energy at wheels and of the negative motive energy.
+        """
+
+        _ = lambda x: xr.where(x == 0, 1, x)
+
+        distance = _(self.energy_totals.sel(parameter="velocity") / 1000)
+        self["TtW efficiency"] = (
+            self.energy_totals.sel(
+                parameter=["motive energy at wheels", "negative motive energy"],
+                size=self.array.coords["size"].values,
+                powertrain=self.array.coords["powertrain"].values,
+            ).sum(dim="parameter")
+            / distance
+        ) / _(self["TtW energy"])
+
+    def set_share_recuperated_energy(self) -> None:
+        """
+        Calculate the share of recuperated energy,
+        over the total negative motive energy.
+        """
+
+        _ = lambda x: np.where(x == 0, 1, x)
+
+        self["share recuperated energy"] = (
+            self.energy_totals.sel(parameter="recuperated energy")
+            / _(self.energy_totals.sel(parameter="negative motive energy"))
+        ).values.T
+        self["share recuperated energy"] *= self["combustion power share"] < 1
+
     def set_vehicle_masses(self):
         """
         Define ``curb mass``, ``driving mass``, and ``total cargo mass``.
@@ -315,7 +1331,14 @@ class TwoWheelerModel(VehicleModel):
             3,
         ) * (self["charger mass"] > 0)
 
-    def set_costs(self):
+    def set_costs(self) -> None:
+        """
+        Calculate the costs of the available vehicles (see :attr:`available`).
+        Unavailable vehicles keep the values of their input parameters.
+        """
+        self._run_on_available_vehicles(self._calculate_costs)
+
+    def _calculate_costs(self) -> None:
         self["glider cost"] = (
             self["glider base mass"] * self["glider cost slope"]
             + self["glider cost intercept"]
@@ -351,8 +1374,9 @@ class TwoWheelerModel(VehicleModel):
             self["energy battery cost"] * self["battery lifetime replacements"]
         )
 
-        with open(self.DATA_DIR / "purchase_cost_params.yaml", "r") as stream:
-            to_markup = yaml.safe_load(stream)["markup"]
+        to_markup = load_data_file(self.DATA_DIR / "purchase_cost_params.yaml")[
+            "markup"
+        ]
 
         to_markup = [m for m in to_markup if m in self.array.coords["parameter"].values]
 
@@ -367,8 +1391,9 @@ class TwoWheelerModel(VehicleModel):
             )
         )
 
-        with open(self.DATA_DIR / "purchase_cost_params.yaml", "r") as stream:
-            purchase_cost_list = yaml.safe_load(stream)["purchase"]
+        purchase_cost_list = load_data_file(
+            self.DATA_DIR / "purchase_cost_params.yaml"
+        )["purchase"]
 
         purchase_cost_list = [
             m for m in purchase_cost_list if m in self.array.coords["parameter"].values
@@ -420,6 +1445,8 @@ class TwoWheelerModel(VehicleModel):
             * Energy
             * Total cost of ownership
 
+        Costs of unavailable vehicles (see :attr:`available`) are zero.
+
         :return: A xarray array with cost information per vehicle-km
         :rtype: xarray.core.dataarray.DataArray
         """
@@ -478,78 +1505,52 @@ class TwoWheelerModel(VehicleModel):
             ],
         ).values
 
+        # costs of unavailable vehicles are not reported
+        response = response.where(
+            self.available.sel(
+                size=scope["size"], powertrain=scope["powertrain"], year=scope["year"]
+            ),
+            0,
+        )
+
         if not sensitivity:
             return response
         else:
             return response / response.sel(value="reference")
 
-    def remove_energy_consumption_from_unavailable_vehicles(self):
+    def set_range(self) -> None:
         """
-        This method sets the energy consumption of vehicles that are not available to zero.
-        """
-
-        if "Human" in self.array.coords["powertrain"].values:
-            sizes = [
-                s
-                for s in [
-                    "Kick-scooter",
-                    "Bicycle <45",
-                    "Bicycle cargo",
-                    "Moped <4kW",
-                    "Scooter <4kW",
-                    "Scooter 4-11kW",
-                    "Motorcycle 4-11kW",
-                    "Motorcycle 11-35kW",
-                    "Motorcycle >35kW",
-                ]
-                if s in self.array.coords["size"].values
-            ]
+        Calculate the range autonomy of the available vehicles
+        (see :meth:`carculator_utils.model.VehicleModel.set_range`).
+        """
+        self._run_on_available_vehicles(super().set_range)
 
-            self.array.loc[
-                dict(
-                    powertrain="Human",
-                    size=sizes,
-                    parameter="TtW energy",
-                )
-            ] = 0
-
-        if "BEV" in self.array.coords["powertrain"].values:
-            if "Moped <4kW" in self.array.coords["size"].values:
-                self.array.loc[
-                    dict(
-                        powertrain="BEV",
-                        size=[
-                            "Moped <4kW",
-                        ],
-                        parameter="TtW energy",
-                    )
-                ] = 0
-
-        if "ICEV-p" in self.array.coords["powertrain"].values:
-            sizes = [
-                s
-                for s in [
-                    "Kick-scooter",
-                    "Bicycle <25",
-                    "Bicycle <45",
-                    "Bicycle cargo",
-                ]
-                if s in self.array.coords["size"].values
-            ]
+    def set_hot_emissions(self) -> None:
+        """
+        Calculate the hot pollutant emissions of the available vehicles, from their energy
+        consumption over the driving cycle
+        (see :meth:`carculator_utils.model.VehicleModel.set_hot_emissions`).
+        """
+        self._run_on_available_vehicles(super().set_hot_emissions)
 
-            self.array.loc[
-                dict(
-                    powertrain="ICEV-p",
-                    size=sizes,
-                    parameter="TtW energy",
-                )
-            ] = 0
+    def set_particulates_emission(self) -> None:
+        """
+        Calculate the abrasion emissions of the available vehicles
+        (see :meth:`carculator_utils.model.VehicleModel.set_particulates_emission`).
+        """
+        self._run_on_available_vehicles(super().set_particulates_emission)
 
-        # set the `TtW energy` of BEV vehicles before 2010 to zero
-        self.array.loc[
-            dict(
-                powertrain="BEV",
-                year=slice(None, 2010),
-                parameter="TtW energy",
-            )
-        ] = 0
+    def set_noise_emissions(self) -> None:
+        """
+        Calculate the noise emissions of the available vehicles
+        (see :meth:`carculator_utils.model.VehicleModel.set_noise_emissions`).
+        """
+        self._run_on_available_vehicles(super().set_noise_emissions)
+
+    def remove_energy_consumption_from_unavailable_vehicles(self):
+        """
+        This method sets the energy consumption of vehicles that are not available to zero
+        (see `data/unavailable_vehicles.yaml`).
+        """
+
+        self["TtW energy"] = self["TtW energy"] * get_availability(self.array)
@@ -0,0 +1,162 @@
+"""
+out_of_core.py contains the functions to run stochastic analyses larger than memory:
+iterations are run one chunk at a time and their results written to memory-mapped
+files on disk, read back lazily.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from .parallel import run_iterations, split_iterations
+
+
+class DiskArray:
+    """
+    Array stored in a memory-mapped ``.npy`` file, filled in one chunk of iterations
+    (i.e., one slice of the ``value`` dimension) at a time. Dimensions and coordinates
+    are stored next to it, in a ``.json`` file. Only the pages of the file being read
+    or written are held in memory.
+
+    :ivar path: path of the ``.npy`` file
+    """
+
+    def __init__(self, path):
+        self.path = Path(path).with_suffix(".npy")
+        self._data = None
+        self._template = None
+
+    @property
+    def metadata_path(self) -> Path:
+        return self.path.with_suffix(".json")
+
+    def allocate(self, template: xr.DataArray, values) -> None:
+        """
+        Create the file, for arrays with the dimensions, coordinates and dtype of `template`,
+        with `values` as coordinates of the ``value`` dimension.
+        """
+        coords = {d: template.coords[d].values for d in template.dims}
+        coords["value"] = np.asarray(values)
+        shape = tuple(len(coords[d]) for d in template.dims)
+
+        self._data = np.lib.format.open_memmap(
+            self.path, mode="w+", dtype=template.dtype, shape=shape
+        )
+        self._template = template
+        self.metadata_path.write_text(
+            json.dumps(
+                {
+                    "dims": list(template.dims),
+                    "coords": {d: c.tolist() for d, c in coords.items()},
+                }
+            )
+        )
+
+    def write(self, chunk: xr.DataArray, start: int) -> None:
+        """
+        Write the iterations of `chunk` from position `start` along the ``value`` dimension.
+        """
+        if self._data is None:
+            raise RuntimeError("The file must be allocated before being written to.")
+
+        axis = self._template.dims.index("value")
+        index = [slice(None)] * self._data.ndim
+        index[axis] = slice(start, start + chunk.sizes["value"])
+        self._data[tuple(index)] = chunk.transpose(*self._template.dims).values
+
+    def flush(self) -> None:
+        if self._data is not None:
+            self._data.flush()
+
+    def open(self) -> xr.DataArray:
+        """
+        Return the stored array, memory-mapped read-only. Values are only read from disk
+        when used, e.g., by ``array.sel(...)`` or ``array.mean(dim="value")``.
+        """
+        metadata = json.loads(self.metadata_path.read_text())
+
+        return xr.DataArray(
+            np.load(self.path, mmap_mode="r"),
+            dims=metadata["dims"],
+            coords=metadata["coords"],
+        )
+
+
+def run_out_of_core(
+    iterations: int,
+    directory,
+    seed: int = None,
+    chunk_size: int = 100,
+    model_kwargs: dict = None,
+    inventory_kwargs: dict = None,
+    impacts: bool = True,
+    model_array: bool = True,
+) -> dict:
+    """
+    Run a stochastic analysis of `iterations` iterations, `chunk_size` iterations at a time,
+    and write the results of each chunk to `directory` (see :class:`DiskArray`).
+    Unlike :func:`carculator_two_wheeler.streaming.run_in_chunks`, all the iterations are kept,
+    but peak memory only depends on `chunk_size`. With `seed`, results are those
+    of an in-memory run with the same seed (see :func:`run_iterations`).
+
+    .. code-block:: python
+
+        results = run_out_of_core(20000, "results", seed=42, chunk_size=500)
+        results["impacts"].sel(impact_category="climate change").quantile(0.95, dim="value")
+
+    :param iterations: total number of iterations
+    :param directory: directory the results are written to. Files of a previous run are overwritten.
+    :param seed: seed of the stochastic run
+    :param chunk_size: number of iterations run at once
+    :param model_kwargs: keyword arguments passed to :class:`TwoWheelerModel`
+    :param inventory_kwargs: keyword arguments passed to :class:`InventoryTwoWheeler`
+    :param impacts: if False, only costs are calculated
+    :param model_array: if True, the array of the vehicle model is also written, as "array"
+    :return: a dictionary with the memory-mapped "costs" and, if calculated,
+        "impacts" and "array" (see :func:`open_results`)
+    """
+
+    if iterations < 2:
+        raise ValueError("A stochastic run needs at least two iterations.")
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    stores = {}
+    for start, stop in split_iterations(iterations, max(chunk_size, 2)):
+        results = run_iterations(
+            seed,
+            start,
+            stop,
+            model_kwargs=model_kwargs,
+            inventory_kwargs=inventory_kwargs,
+            impacts=impacts,
+            model_array=model_array,
+        )
+
+        for name, chunk in results.items():
+            if name not in stores:
+                stores[name] = DiskArray(directory / name)
+                stores[name].allocate(chunk, np.arange(iterations))
+            stores[name].write(chunk, start)
+
+        del results
+
+    for store in stores.values():
+        store.flush()
+
+    return {name: store.open() for name, store in stores.items()}
+
+
+def open_results(directory) -> dict:
+    """
+    Open the results written by :func:`run_out_of_core` to `directory`, memory-mapped read-only.
+
+    :return: a dictionary of name: :class:`xarray.DataArray`
+    """
+    return {
+        path.stem: DiskArray(path).open()
+        for path in sorted(Path(directory).glob("*.npy"))
+    }
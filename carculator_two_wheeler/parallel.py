@@ -0,0 +1,124 @@
+"""
+parallel.py contains the function to spread the iterations of a stochastic run
+over a pool of processes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+
+from .array import fill_xarray_from_input_parameters
+from .inventory import InventoryTwoWheeler
+from .model import TwoWheelerModel
+from .two_wheelers_input_parameters import TwoWheelerInputParameters
+
+
+def run_iterations(
+    seed: int,
+    start: int,
+    stop: int,
+    model_kwargs: dict = None,
+    inventory_kwargs: dict = None,
+    impacts: bool = True,
+    model_array: bool = False,
+) -> dict:
+    """
+    Run iterations `start` to `stop` of the stochastic run seeded with `seed`.
+
+    :return: a dictionary with the "costs", if `impacts` is True, the "impacts"
+        and, if `model_array` is True, the "array" of the vehicle model,
+        of the iterations, labelled `start` to `stop` along the ``value`` dimension
+    """
+    tip = TwoWheelerInputParameters()
+    tip.stochastic(stop - start, seed=seed, offset=start)
+    _, array = fill_xarray_from_input_parameters(tip)
+    array = array.assign_coords(value=np.arange(start, stop))
+
+    twm = TwoWheelerModel(array, seed=seed, **(model_kwargs or {}))
+    twm.set_all()
+
+    results = {"costs": twm.calculate_cost_impacts()}
+
+    if model_array:
+        results["array"] = twm.array
+
+    if impacts:
+        ic = InventoryTwoWheeler(twm, **(inventory_kwargs or {}))
+        results["impacts"] = ic.calculate_impacts().assign_coords(
+            value=np.arange(start, stop)
+        )
+
+    return results
+
+
+def _run_block(args):
+    return run_iterations(*args)
+
+
+def split_iterations(iterations: int, chunk_size: int) -> list:
+    """
+    Split `iterations` into (start, stop) blocks of `chunk_size` iterations.
+    The last block is merged into the previous one if it holds a single iteration,
+    as :meth:`TwoWheelerModel.adjust_cost` treats a single iteration as a static run.
+    """
+    starts = list(range(0, iterations, chunk_size))
+    blocks = [(s, min(s + chunk_size, iterations)) for s in starts]
+
+    if len(blocks) > 1 and blocks[-1][1] - blocks[-1][0] == 1:
+        blocks[-2:] = [(blocks[-2][0], iterations)]
+
+    return blocks
+
+
+def run_parallel(
+    iterations: int,
+    seed: int,
+    processes: int = None,
+    chunk_size: int = None,
+    model_kwargs: dict = None,
+    inventory_kwargs: dict = None,
+    impacts: bool = True,
+) -> dict:
+    """
+    Run a stochastic analysis of `iterations` iterations over a pool of processes.
+
+    Each iteration draws its input parameters and cost factor from its own random number stream,
+    derived from `seed` (see :func:`iteration_streams`). Results are therefore identical
+    to those of a single-process run with the same seed, whatever the number of processes
+    and the size of the chunks.
+
+    .. code-block:: python
+
+        results = run_parallel(5000, seed=42, processes=32)
+        results["impacts"].quantile([0.05, 0.5, 0.95], dim="value")
+
+    :param iterations: total number of iterations
+    :param seed: seed of the stochastic run
+    :param processes: number of worker processes. Defaults to the number of CPUs.
+    :param chunk_size: number of iterations per task. Defaults to an even split over the processes.
+    :param model_kwargs: keyword arguments passed to :class:`TwoWheelerModel`
+    :param inventory_kwargs: keyword arguments passed to :class:`InventoryTwoWheeler`
+    :param impacts: if False, only costs are calculated
+    :return: a dictionary with the "costs" and, if `impacts` is True, the "impacts" arrays
+    """
+
+    if iterations < 2:
+        raise ValueError("A stochastic run needs at least two iterations.")
+
+    processes = processes or os.cpu_count()
+    chunk_size = max(chunk_size or -(-iterations // processes), 2)
+
+    tasks = [
+        (seed, start, stop, model_kwargs, inventory_kwargs, impacts)
+        for start, stop in split_iterations(iterations, chunk_size)
+    ]
+
+    if processes == 1:
+        results = [_run_block(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_run_block, tasks))
+
+    return {k: xr.concat([r[k] for r in results], dim="value") for k in results[0]}
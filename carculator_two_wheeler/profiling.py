@@ -0,0 +1,200 @@
+"""
+profiling.py contains the logger of the package and the opt-in instrumentation
+of the model and of the inventory, which records the wall time, the memory allocated
+and the peak memory of each stage.
+"""
+
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# messages of the package, silent unless a handler is configured,
+# e.g., with ``logging.basicConfig(level=logging.INFO)``
+logger = logging.getLogger("carculator_two_wheeler")
+logger.addHandler(logging.NullHandler())
+
+# one DEBUG record per stage profiled, with the fields of its :class:`StageRecord` as extra attributes
+profiling_logger = logging.getLogger("carculator_two_wheeler.profiling")
+
+
+class StageRecord:
+    """
+    Measures of a stage run by a :class:`Profiler`.
+
+    :ivar name: name of the stage, e.g., "set_costs" or "mass loop, pass 2"
+    :ivar parent: name of the stage it ran in, or None
+    :ivar depth: number of stages it ran in
+    :ivar wall_time: wall time, in seconds
+    :ivar allocated: memory allocated and still held at the end of the stage, in bytes
+        (None if memory is not traced)
+    :ivar peak: peak memory reached during the stage, above the memory held at its start,
+        in bytes (None if memory is not traced)
+
+    """
+
+    def __init__(self, name, parent, depth, wall_time, allocated, peak):
+        self.name = name
+        self.parent = parent
+        self.depth = depth
+        self.wall_time = wall_time
+        self.allocated = allocated
+        self.peak = peak
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "parent": self.parent,
+            "depth": self.depth,
+            "wall_time": self.wall_time,
+            "allocated": self.allocated,
+            "peak": self.peak,
+        }
+
+    def __repr__(self):
+        memory = (
+            ""
+            if self.peak is None
+            else f", allocated={self.allocated / 1e6:.1f} MB, peak={self.peak / 1e6:.1f} MB"
+        )
+        return f"StageRecord({self.name!r}, {self.wall_time:.3f} s{memory})"
+
+
+class ProfileReport:
+    """
+    Records of the stages run by a :class:`Profiler`, in the order they ended
+    (i.e., a stage comes after the stages it ran).
+
+    :ivar records: list of :class:`StageRecord`
+    """
+
+    def __init__(self, records):
+        self.records = list(records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, name) -> list:
+        """Return the records of the stages named `name`."""
+        return [r for r in self.records if r.name == name]
+
+    @property
+    def wall_time(self) -> float:
+        """Wall time of the outermost stages, in seconds."""
+        return sum(r.wall_time for r in self.records if r.parent is None)
+
+    def slowest(self, n: int = 5) -> list:
+        """Return the `n` innermost stages that took the longest."""
+        parents = {r.parent for r in self.records}
+        leaves = [r for r in self.records if r.name not in parents]
+        return sorted(leaves, key=lambda r: r.wall_time, reverse=True)[:n]
+
+    def to_dataframe(self):
+        """
+        Return the records as a :class:`pandas.DataFrame`, with one row per stage.
+        """
+        import pandas as pd
+
+        return pd.DataFrame([r.as_dict() for r in self.records])
+
+    def __repr__(self):
+        return (
+            f"ProfileReport({len(self.records)} stages, {self.wall_time:.3f} s, "
+            f"slowest: {[r.name for r in self.slowest(3)]})"
+        )
+
+
+class Profiler:
+    """
+    Record the wall time and, if `memory` is True, the memory allocated and peak memory
+    (with :mod:`tracemalloc`) of stages, which can be nested. Memory tracing slows down
+    the code measured; it is started with the first stage and stopped with it,
+    unless it was already started.
+
+    .. code-block:: python
+
+        profiler = Profiler()
+        tm = TwoWheelerModel(array, profiler=profiler)
+        tm.set_all()
+        ic = InventoryTwoWheeler(tm)
+        ic.calculate_impacts()
+        profiler.report.to_dataframe()
+
+    :param memory: if True, memory is traced
+    """
+
+    def __init__(self, memory: bool = True):
+        self.memory = memory
+        self.records = []
+        self._stack = []
+        self._tracing = False
+
+    @property
+    def report(self) -> ProfileReport:
+        return ProfileReport(self.records)
+
+    def clear(self) -> None:
+        self.records = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measure the code run in the context as the stage `name`.
+        """
+        if self.memory and not self._stack and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+        traced = self.memory and tracemalloc.is_tracing()
+        frame = {"name": name, "start": 0, "peak": 0}
+
+        if traced:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["start"] = frame["peak"] = current
+
+        self._stack.append(frame)
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - start
+            self._stack.pop()
+
+            allocated = peak = None
+            if traced:
+                current, traced_peak = tracemalloc.get_traced_memory()
+                frame["peak"] = max(frame["peak"], traced_peak)
+                allocated = current - frame["start"]
+                peak = frame["peak"] - frame["start"]
+                if self._stack:
+                    self._stack[-1]["peak"] = max(
+                        self._stack[-1]["peak"], frame["peak"]
+                    )
+
+            record = StageRecord(
+                name,
+                self._stack[-1]["name"] if self._stack else None,
+                len(self._stack),
+                wall_time,
+                allocated,
+                peak,
+            )
+            self.records.append(record)
+            profiling_logger.debug("%r", record, extra=record.as_dict())
+
+            if self._tracing and not self._stack:
+                tracemalloc.stop()
+                self._tracing = False
+
+
+def profile_stage(profiler: Profiler, name: str):
+    """
+    Return the context of the stage `name` of `profiler`, or an empty context if `profiler` is None.
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
@@ -0,0 +1,257 @@
+"""
+result_cache.py contains the on-disk cache of complete model and inventory runs,
+stored under a hash of all their inputs, and :func:`run_cached` which serves runs from it.
+"""
+
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+from carculator_utils import DATA_DIR as UTILS_DATA_DIR
+
+from . import DATA_DIR
+from .cache import _content_hash, get_cache_dir, hash_inputs, package_versions
+from .inventory import InventoryTwoWheeler
+from .model import TwoWheelerModel
+from .out_of_core import DiskArray, open_results
+
+# arguments which do not change results, hence left out of the keys
+UNHASHED_ARGUMENTS = {"profiler"}
+
+# file touched on each read, its modification time being the last use of an entry
+LAST_USED = "last_used"
+
+_data_hashes = {}
+
+
+def data_versions() -> dict:
+    """
+    Return a hash of the content of each data file of this package and of `carculator_utils`,
+    to be included in the keys of cached results. Files are hashed once for the lifetime
+    of the process, as long as their modification times and sizes do not change.
+
+    :return: dictionary of "package/path of the file in its data directory": hash
+    """
+    versions = {}
+    for package, directory in (
+        ("carculator_two_wheeler", DATA_DIR),
+        ("carculator_utils", UTILS_DATA_DIR),
+    ):
+        for filepath in sorted(Path(directory).rglob("*")):
+            if not filepath.is_file():
+                continue
+
+            stat = filepath.stat()
+            stamp = (str(filepath), stat.st_mtime_ns, stat.st_size)
+            if stamp not in _data_hashes:
+                _data_hashes[stamp] = _content_hash(filepath)
+
+            name = filepath.relative_to(directory).as_posix()
+            versions[f"{package}/{name}"] = _data_hashes[stamp]
+
+    return versions
+
+
+class ResultCache:
+    """
+    On-disk cache of the results of complete runs, each stored in a directory named after
+    the hash of the inputs of the run (see :meth:`key`), as memory-mapped arrays
+    (see :class:`DiskArray`). Once :attr:`max_bytes` is exceeded, the least recently
+    used runs are evicted, except the run stored last. Several processes can share
+    a cache directory.
+
+    :ivar directory: directory of the cache. Defaults to the "results" directory of
+        the on-disk cache (see :func:`get_cache_dir`).
+    :ivar max_bytes: maximum size of the cache on disk
+    :ivar hits: number of runs found
+    :ivar misses: number of runs not found
+    """
+
+    def __init__(self, directory: Path = None, max_bytes: int = 2**30):
+        self.directory = Path(directory or get_cache_dir() / "results")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(array, model_kwargs: dict = None, inventory_kwargs: dict = None) -> str:
+        """
+        Return the key of the run of `array`: a hash of the content and coordinates of `array`
+        (hence of the parameter files, iterations and seed it was sampled with), of the arguments
+        of the model and of the inventory (country, cycle, gradient, overrides, etc.),
+        and of the versions of the packages and of their data files.
+        """
+        arguments = [
+            {k: v for k, v in (kwargs or {}).items() if k not in UNHASHED_ARGUMENTS}
+            for kwargs in (model_kwargs, inventory_kwargs)
+        ]
+        return hash_inputs(array, *arguments, package_versions(), data_versions())
+
+    def _path(self, key) -> Path:
+        return self.directory / key
+
+    def __contains__(self, key):
+        return (self._path(key) / LAST_USED).exists()
+
+    def __len__(self):
+        return len(self._entries())
+
+    def get(self, key, default=None):
+        """
+        Return the results stored under `key`, as a dictionary of read-only,
+        memory-mapped arrays, or `default`.
+        """
+        results = self._open(key)
+        if results is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return results
+
+    def _open(self, key):
+        path = self._path(key)
+        try:
+            os.utime(path / LAST_USED)
+            return open_results(path)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, results: dict) -> dict:
+        """
+        Store `results`, a dictionary of arrays with a ``value`` dimension, under `key`,
+        then evict the least recently used runs if the cache exceeds :attr:`max_bytes`.
+
+        :return: the results as stored, as returned by :meth:`get`
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # written aside, then moved, so that other processes never read a partial entry
+        tmp = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        tmp.mkdir()
+        for name, array in results.items():
+            store = DiskArray(tmp / name)
+            store.allocate(array, array.coords["value"].values)
+            store.write(array, 0)
+            store.flush()
+        (tmp / LAST_USED).touch()
+
+        try:
+            os.replace(tmp, self._path(key))
+        except OSError:
+            # stored by another process in the meantime
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict(keep=key)
+
+        return self._open(key)
+
+    def _entries(self) -> list:
+        return [
+            path
+            for path in self.directory.glob("*")
+            if (path / LAST_USED).exists() and not path.name.startswith(".")
+        ]
+
+    @property
+    def size(self) -> int:
+        """Size of the cache on disk, in bytes."""
+        return sum(_size(path) for path in self._entries())
+
+    def evict(self, keep: str = None) -> list:
+        """
+        Remove the least recently used runs until the cache fits in :attr:`max_bytes`.
+
+        :param keep: key of a run not to remove, e.g., that of the run just stored
+        :return: the keys of the runs removed
+        """
+        entries = []
+        for path in self._entries():
+            if path.name == keep:
+                continue
+            try:
+                entries.append(((path / LAST_USED).stat().st_mtime_ns, path))
+            except OSError:
+                pass
+
+        total = sum(_size(path) for path in self._entries())
+        removed = []
+        for _, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            total -= _size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path.name)
+
+        return removed
+
+    def invalidate(self, key: str = None) -> None:
+        """
+        Remove the run stored under `key` or, if `key` is None, all runs.
+        """
+        paths = self._entries() if key is None else [self._path(key)]
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+
+def run_cached(
+    array,
+    model_kwargs: dict = None,
+    inventory_kwargs: dict = None,
+    impacts: bool = True,
+    cache: ResultCache = None,
+) -> dict:
+    """
+    Return the array of the vehicle model built from `array`, its costs (see
+    :meth:`TwoWheelerModel.calculate_cost_impacts`) and, if `impacts` is True, its impacts
+    (see :meth:`InventoryTwoWheeler.calculate_impacts`). Results are read from `cache`
+    if the same run was stored before, and stored there otherwise. Either way, they are
+    returned as read-only, memory-mapped arrays (see :meth:`ResultCache.get`).
+
+    Only reproducible runs are cached: static runs (a single value) and stochastic runs
+    with a `seed` in `model_kwargs`, the cost factors of unseeded runs being drawn anew
+    on each run (see :meth:`TwoWheelerModel.adjust_cost`).
+
+    .. code-block:: python
+
+        tip = TwoWheelerInputParameters()
+        tip.static()
+        _, array = fill_xarray_from_input_parameters(tip)
+        results = run_cached(array, model_kwargs={"country": "FR"})
+        results["impacts"].sel(impact_category="climate change")
+
+    :param array: array of input parameters
+    :param model_kwargs: keyword arguments passed to :class:`TwoWheelerModel`
+    :param inventory_kwargs: keyword arguments passed to :class:`InventoryTwoWheeler`
+    :param impacts: if False, only the model and the costs are calculated
+    :param cache: a :class:`ResultCache`, by default in the on-disk cache directory
+    :return: a dictionary with the "array", "costs" and, if `impacts` is True, "impacts"
+    """
+    if array.sizes["value"] > 1 and (model_kwargs or {}).get("seed") is None:
+        raise ValueError(
+            "Unseeded stochastic runs are not reproducible, hence not cached. "
+            "Pass a `seed` in `model_kwargs`."
+        )
+
+    cache = ResultCache() if cache is None else cache
+    key = cache.key(array, model_kwargs, inventory_kwargs if impacts else None)
+    key = hash_inputs(key, impacts)
+
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    twm = TwoWheelerModel(array, **(model_kwargs or {}))
+    twm.set_all()
+    results = {"array": twm.array, "costs": twm.calculate_cost_impacts()}
+
+    if impacts:
+        ic = InventoryTwoWheeler(twm, **(inventory_kwargs or {}))
+        results["impacts"] = ic.calculate_impacts()
+
+    return cache.set(key, results)
@@ -0,0 +1,32 @@
+"""
+rng.py contains the function that derives independent random number streams
+for each Monte Carlo iteration, so that stochastic results only depend on the seed
+and not on how the iterations are split across chunks or processes.
+"""
+
+from typing import Iterable
+
+import numpy as np
+
+# purposes for which random numbers are drawn in each iteration
+INPUTS = 0
+COSTS = 1
+
+
+def iteration_streams(seed: int, iterations: Iterable[int], purpose: int = INPUTS):
+    """
+    Yield one random number generator per iteration.
+
+    The generator of iteration `i` is seeded with the `i`-th child of
+    the :class:`numpy.random.SeedSequence` of `seed`, so that
+    it is the same whether the iteration is run alone, in a chunk,
+    or in another process.
+
+    :param seed: seed of the stochastic run
+    :param iterations: indices of the iterations, e.g., ``range(100, 200)``
+    :param purpose: ``INPUTS`` for the sampling of input parameters, ``COSTS`` for the cost factor
+    :return: a generator of :class:`numpy.random.RandomState`
+    """
+    for i in iterations:
+        sequence = np.random.SeedSequence(seed, spawn_key=(int(i), purpose))
+        yield np.random.RandomState(np.random.MT19937(sequence))
@@ -0,0 +1,547 @@
+"""
+sparse_matrix.py contains StackedSparseMatrix, which stores a stack of sparse matrices,
+one per iteration (`value`), such as the A matrix of the inventory.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+
+class StackedSparseMatrix:
+    """
+    Stack of sparse matrices of shape (values, rows, columns, \\*others), all sharing the same sparsity pattern,
+    such as the A matrix of the inventory, of shape (values, products, activities, years).
+
+    The pattern is stored once, in compressed sparse column (CSC) form, by :attr:`indptr` and :attr:`indices`.
+    :attr:`data` holds the values of the non-zero entries, of shape (entries, values, \\*others).
+    The stack can be read with numpy indexing (e.g., ``A[:, rows, cols]``), which returns dense arrays,
+    and :meth:`matrix` returns the :class:`scipy.sparse.csc_matrix` of a given position in the stack.
+
+    :ivar data: array of shape (number of non-zero entries, values, \\*others)
+    :ivar indices: row index of each non-zero entry
+    :ivar indptr: position in :attr:`indices` of the first non-zero entry of each column
+    :ivar shape: shape of the stack, (values, rows, columns, \\*others)
+    """
+
+    def __init__(self, data, indices, indptr, shape):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = tuple(shape)
+        self._factorized = {}
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape) -> "StackedSparseMatrix":
+        """
+        Assemble a stack from coordinates. Values of duplicate coordinates are summed.
+
+        :param rows: row index of each entry
+        :param cols: column index of each entry
+        :param values: array of shape (values, entries, \\*others), broadcast if needed,
+            or (entries,) if all positions in the stack are equal
+        :param shape: shape of the stack, (values, rows, columns, \\*others)
+        :return: a :class:`StackedSparseMatrix`
+        """
+        n_values, n_rows, n_cols, *others = shape
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values)
+        if values.ndim < 2:
+            values = values.reshape(1, -1)
+        values = np.broadcast_to(
+            values.reshape(values.shape + (1,) * (2 + len(others) - values.ndim)),
+            (n_values, len(rows), *others),
+        )
+
+        # sort by column, then by row, and sum duplicates
+        position = cols * n_rows + rows
+        unique, inverse = np.unique(position, return_inverse=True)
+        # floating-point values keep their precision
+        dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else float
+        data = np.zeros((len(unique), n_values, *others), dtype=dtype)
+        if len(unique) == len(position):
+            data[inverse] = np.moveaxis(values, 1, 0)
+        else:
+            np.add.at(data, inverse, np.moveaxis(values, 1, 0))
+
+        indices = (unique % n_rows).astype(np.int32)
+        indptr = np.searchsorted(unique // n_rows, np.arange(n_cols + 1)).astype(
+            np.int32
+        )
+
+        return cls(data, indices, indptr, shape)
+
+    @classmethod
+    def from_dense(cls, array: np.ndarray) -> "StackedSparseMatrix":
+        """
+        Convert a dense array of shape (values, rows, columns, \\*others). The sparsity pattern
+        is made of the entries which are not zero for at least one position in the stack.
+
+        :param array: dense array
+        :return: a :class:`StackedSparseMatrix`
+        """
+        stacked = (0,) + tuple(range(3, array.ndim))
+        rows, cols = np.nonzero((array != 0).any(axis=stacked))
+        return cls.from_coo(rows, cols, array[:, rows, cols], array.shape)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nnz(self) -> int:
+        """Number of entries of the sparsity pattern."""
+        return len(self.indices)
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.indices.nbytes + self.indptr.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return (
+            f"StackedSparseMatrix(shape={self.shape}, nnz={self.nnz}, "
+            f"dtype={self.dtype})"
+        )
+
+    def _stack_index(self, index) -> tuple:
+        # position in the stack, (value, *others), missing positions being 0
+        return tuple(index) + (0,) * (self.ndim - 2 - len(index))
+
+    def matrix(self, *index) -> sparse.csc_matrix:
+        """
+        Return the matrix at a given position in the stack,
+        e.g., ``A.matrix(0, 2)`` for the first value and the third year.
+
+        :param index: position along the `value` dimension and the other stacked dimensions (0 by default)
+        :return: a :class:`scipy.sparse.csc_matrix`
+        """
+        return sparse.csc_matrix(
+            (
+                self.data[(slice(None),) + self._stack_index(index)],
+                self.indices,
+                self.indptr,
+            ),
+            shape=self.shape[1:3],
+        )
+
+    def column_entries(self, column: int):
+        """
+        Return the row indices and the values, of shape (entries, values, \\*others), of the entries of a column.
+        """
+        start, end = self.indptr[column], self.indptr[column + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def columns(self, cols) -> np.ndarray:
+        """
+        Return the dense block of columns `cols`, of shape (values, rows, len(cols), \\*others).
+        """
+        cols = np.asarray(cols, dtype=np.int64)
+        block = np.zeros(
+            (self.shape[0], self.shape[1], len(cols)) + self.shape[3:],
+            dtype=self.dtype,
+        )
+
+        positions, column = self._column_positions(cols)
+        block[:, self.indices[positions], column] = np.moveaxis(
+            self.data[positions], 0, 1
+        )
+
+        return block
+
+    def __getitem__(self, key) -> np.ndarray:
+        # only the selected columns are made dense,
+        # then the key is applied as on a dense array
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1 :]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        values, rows, cols, *others = key
+
+        ids = np.arange(self.shape[2])[cols]
+
+        if isinstance(cols, slice):
+            return self.columns(ids)[(values, rows, slice(None), *others)]
+
+        unique, inverse = np.unique(ids, return_inverse=True)
+        block = self.columns(unique)
+
+        if np.ndim(ids) == 0:
+            return block[(values, rows, int(inverse[0]), *others)]
+
+        return block[(values, rows, inverse.reshape(np.shape(ids)), *others)]
+
+    def __setitem__(self, key, value):
+        raise TypeError(
+            "StackedSparseMatrix does not support item assignment. "
+            "Use `set_entries()` to overwrite entries, or `toarray()` to get a dense copy."
+        )
+
+    def set_entries(self, rows, cols, values):
+        """
+        Overwrite the entries at coordinates (`rows`, `cols`), for all positions in the stack.
+        Entries outside the sparsity pattern are added to it, unless they are zero.
+        Factorizations computed so far are discarded. Modifies in place.
+
+        :param rows: row index of each entry
+        :param cols: column index of each entry
+        :param values: array of shape (values, entries, \\*others), broadcast if needed
+        """
+        n_values, n_rows, n_cols, *others = self.shape
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.broadcast_to(values, (n_values, len(rows), *others))
+
+        # entries are sorted by column, then by row
+        pattern = (
+            np.repeat(np.arange(n_cols), np.diff(self.indptr)) * n_rows + self.indices
+        )
+        position = cols * n_rows + rows
+        found = np.searchsorted(pattern, position).clip(max=max(len(pattern) - 1, 0))
+        in_pattern = (pattern[found] == position) if len(pattern) else position < 0
+
+        self.data[found[in_pattern]] = np.moveaxis(values[:, in_pattern], 1, 0)
+
+        new = ~in_pattern & (values != 0).any(axis=(0,) + tuple(range(2, values.ndim)))
+        if new.any():
+            updated = self.from_coo(
+                np.concatenate([self.indices, rows[new]]),
+                np.concatenate([pattern // n_rows, cols[new]]),
+                np.concatenate(
+                    [np.moveaxis(self.data, 0, 1), values[:, new].astype(self.dtype)],
+                    axis=1,
+                ),
+                self.shape,
+            )
+            self.data, self.indices, self.indptr = (
+                updated.data,
+                updated.indices,
+                updated.indptr,
+            )
+
+        self._factorized = {}
+
+    def _column_positions(self, cols) -> tuple:
+        # positions in `data` of the entries of columns `cols`, and the column of each
+        cols = np.asarray(cols, dtype=np.int64)
+        counts = self.indptr[cols + 1] - self.indptr[cols]
+        positions = np.concatenate(
+            [np.arange(self.indptr[c], self.indptr[c + 1]) for c in cols] or [[]]
+        ).astype(np.int64)
+        return positions, np.repeat(np.arange(len(cols)), counts)
+
+    def scale_columns(self, cols, factors):
+        """
+        Multiply the entries of columns `cols` by `factors`, for all positions in the stack.
+        Factorizations computed so far are discarded. Modifies in place.
+
+        :param cols: column indices
+        :param factors: array of shape (values, len(cols), \\*others), broadcast if needed
+        """
+        n_values, _, _, *others = self.shape
+        factors = np.broadcast_to(factors, (n_values, len(cols), *others))
+        positions, column = self._column_positions(cols)
+
+        self.data[positions] *= np.moveaxis(factors, 1, 0)[column]
+        self._factorized = {}
+
+    def eliminate_zeros(self):
+        """
+        Remove from the sparsity pattern the entries which are zero for all positions in the stack,
+        as :meth:`from_dense` leaves them out. Modifies in place.
+        """
+        stacked = tuple(range(1, self.data.ndim))
+        kept = (self.data != 0).any(axis=stacked)
+        if kept.all():
+            return
+
+        columns = np.repeat(np.arange(self.shape[2]), np.diff(self.indptr))
+        self.data = self.data[kept]
+        self.indices = self.indices[kept]
+        self.indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(columns[kept], minlength=self.shape[2]))]
+        ).astype(np.int32)
+        self._factorized = {}
+
+    def toarray(self) -> np.ndarray:
+        return self.columns(np.arange(self.shape[2]))
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.toarray()
+        return array if dtype is None else array.astype(dtype)
+
+    def factorized(self, *index):
+        """
+        Return the LU factorization of the matrix at a given position in the stack, computed once,
+        in float64 whatever :attr:`dtype`.
+
+        :param index: position along the `value` dimension and the other stacked dimensions (0 by default)
+        :return: a :class:`scipy.sparse.linalg.SuperLU` object
+        """
+        index = self._stack_index(index)
+        if index not in self._factorized:
+            self._factorized[index] = splu(self.matrix(*index).astype(np.float64))
+        return self._factorized[index]
+
+    def solve(self, rhs: np.ndarray, *index) -> np.ndarray:
+        """
+        Solve ``A x = rhs`` for the matrix at a given position in the stack, `rhs` being a vector
+        or an array with one right-hand side per column. The factorization is reused between calls.
+
+        :param rhs: array of shape (rows,) or (rows, number of right-hand sides)
+        :param index: position along the `value` dimension and the other stacked dimensions (0 by default)
+        :return: solution, of the same shape as `rhs`
+        """
+        return self.factorized(*index).solve(np.asarray(rhs, dtype=float))
+
+
+def _selects_all(key) -> bool:
+    return isinstance(key, slice) and key == slice(None)
+
+
+class StackedSparseBuilder:
+    """
+    Collect the entries of a :class:`StackedSparseMatrix` as coordinates (COO triplets),
+    written with numpy indexing as in a dense stack of shape (values, rows, columns, \\*others),
+    e.g., ``A[:, rows, cols] = values`` or ``A[np.ix_(np.arange(n_values), rows, cols)] = values``,
+    without ever allocating the dense stack. The whole `value` dimension is written at once.
+    A cell written several times keeps the last values written, and cells never written are zero.
+    Reading cells (e.g., ``A[:, rows, cols] *= 0.5``) only looks up the cells read.
+    :meth:`assemble` builds the :class:`StackedSparseMatrix`, with :meth:`StackedSparseMatrix.from_coo`.
+
+    :ivar shape: shape of the stack, (values, rows, columns, \\*others)
+    :ivar dtype: type in which values are stored
+    """
+
+    def __init__(self, shape, dtype=np.float64):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        # one chunk per write: positions (column * rows + row) and values,
+        # of shape (values, entries, *others)
+        self._positions = []
+        self._values = []
+        self._sorted = []
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return (
+            f"StackedSparseBuilder(shape={self.shape}, "
+            f"entries written={sum(len(p) for p in self._positions)}, dtype={self.dtype})"
+        )
+
+    def add(self, rows, cols, values):
+        """
+        Write the entries at coordinates (`rows`, `cols`), for all positions in the stack.
+
+        :param rows: row index of each entry
+        :param cols: column index of each entry
+        :param values: array of shape (values, entries, \\*others), broadcast if needed
+        """
+        n_values, n_rows, _, *others = self.shape
+        rows = np.asarray(rows, dtype=np.int64).ravel()
+        cols = np.asarray(cols, dtype=np.int64).ravel()
+
+        self._positions.append(cols * n_rows + rows)
+        self._values.append(
+            np.broadcast_to(
+                np.array(values, dtype=self.dtype), (n_values, len(rows), *others)
+            )
+        )
+        self._sorted.append(None)
+
+    def entries(self, rows, cols) -> np.ndarray:
+        """
+        Return the values of the cells at coordinates (`rows`, `cols`),
+        of shape (values, entries, \\*others), as last written.
+        """
+        n_values, n_rows, _, *others = self.shape
+        positions = (
+            np.asarray(cols, dtype=np.int64).ravel() * n_rows
+            + np.asarray(rows, dtype=np.int64).ravel()
+        )
+        values = np.zeros((n_values, len(positions), *others), dtype=self.dtype)
+        pending = np.arange(len(positions))
+
+        for c in reversed(range(len(self._positions))):
+            if len(pending) == 0:
+                break
+
+            order, ordered = self._sorted_chunk(c)
+            # the last entry of the chunk written at each position
+            found = np.searchsorted(ordered, positions[pending], side="right") - 1
+            hit = found >= 0
+            hit[hit] = ordered[found[hit]] == positions[pending[hit]]
+
+            values[:, pending[hit]] = self._values[c][:, order[found[hit]]]
+            pending = pending[~hit]
+
+        return values
+
+    def _sorted_chunk(self, c: int) -> tuple:
+        if self._sorted[c] is None:
+            order = np.argsort(self._positions[c], kind="stable")
+            self._sorted[c] = (order, self._positions[c][order])
+        return self._sorted[c]
+
+    def _cells(self, key) -> tuple:
+        """
+        Resolve a numpy index of the stack into the rows and columns of the cells it selects,
+        the positions along the other dimensions selected for each cell (None if all are),
+        and the shape of the selection.
+        """
+        n_values, n_rows, n_cols, *others = self.shape
+
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) < 3 or any(k is Ellipsis for k in key):
+            raise TypeError(
+                "StackedSparseBuilder is indexed by (values, rows, columns, ...)."
+            )
+
+        values, rows, cols, *stacked = key
+
+        if isinstance(values, np.ndarray):
+            # outer indexing, as given by np.ix_
+            if not np.array_equal(values.ravel(), np.arange(n_values)):
+                raise TypeError(
+                    "StackedSparseBuilder only writes all the values at once."
+                )
+            rows, cols = np.asarray(rows)[0], np.asarray(cols)[0]
+        elif not _selects_all(values):
+            raise TypeError("StackedSparseBuilder only writes all the values at once.")
+
+        stacked = list(stacked) + [slice(None)] * (len(others) - len(stacked))
+        if all(_selects_all(k) for k in stacked):
+            rows, cols = np.broadcast_arrays(
+                np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+            )
+            return rows.ravel(), cols.ravel(), None, (n_values, *rows.shape, *others)
+
+        if len(others) != 1:
+            raise TypeError(
+                "StackedSparseBuilder selects positions along one other dimension only."
+            )
+
+        rows, cols, positions = np.broadcast_arrays(
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(cols, dtype=np.int64),
+            np.arange(others[0])[stacked[0]],
+        )
+        return rows.ravel(), cols.ravel(), positions.ravel(), (n_values, *rows.shape)
+
+    def __getitem__(self, key) -> np.ndarray:
+        rows, cols, positions, shape = self._cells(key)
+        values = self.entries(rows, cols)
+
+        if positions is not None:
+            values = values[:, np.arange(len(rows)), positions]
+
+        return values.reshape(shape)
+
+    def __setitem__(self, key, value):
+        n_values, n_rows, _, *others = self.shape
+        rows, cols, positions, shape = self._cells(key)
+
+        value = np.asarray(value, dtype=self.dtype)
+        # leading dimensions of length one are dropped, as numpy does
+        while value.ndim > len(shape) and value.shape[0] == 1:
+            value = value[0]
+        value = np.broadcast_to(value, shape)
+
+        if len(rows) == 0:
+            return
+
+        value = value.reshape((n_values, len(rows), -1))
+
+        if positions is None:
+            self.add(rows, cols, value.reshape((n_values, len(rows), *others)))
+            return
+
+        # the other positions of the cells keep their values
+        cells, inverse = np.unique(cols * n_rows + rows, return_inverse=True)
+        values = self.entries(cells % n_rows, cells // n_rows)
+        values[:, inverse, positions] = value[..., 0]
+        self.add(cells % n_rows, cells // n_rows, values)
+
+    def _last_written(self) -> tuple:
+        # chunk and position in the chunk of the last entry written in each cell,
+        # sorted by column, then by row
+        positions = np.concatenate(self._positions or [np.empty(0, dtype=np.int64)])
+        chunk = np.repeat(
+            np.arange(len(self._positions)), [len(p) for p in self._positions]
+        )
+        offset = np.concatenate([[0], np.cumsum([len(p) for p in self._positions])])
+
+        cells, last = np.unique(positions[::-1], return_index=True)
+        last = len(positions) - 1 - last
+
+        return cells, chunk[last], last - offset[chunk[last]]
+
+    def _gather(self, chunk, index, stack_index=None) -> np.ndarray:
+        # values of the entries `index` of chunks `chunk`, for all positions in the stack
+        # (shape (values, entries, *others)) or at `stack_index` (shape (entries,))
+        n_values, _, _, *others = self.shape
+
+        if stack_index is None:
+            values = np.empty((n_values, len(index), *others), dtype=self.dtype)
+        else:
+            values = np.empty(len(index), dtype=self.dtype)
+
+        for c in np.unique(chunk):
+            in_chunk = chunk == c
+            if stack_index is None:
+                values[:, in_chunk] = self._values[c][:, index[in_chunk]]
+            else:
+                value, *stacked = stack_index
+                values[in_chunk] = self._values[c][(value, index[in_chunk], *stacked)]
+
+        return values
+
+    def matrix(self, *index) -> sparse.csc_matrix:
+        """
+        Return the matrix at a given position in the stack, as last written,
+        e.g., ``A.matrix(0, 2)`` for the first value and the third year.
+
+        :param index: position along the `value` dimension and the other stacked dimensions (0 by default)
+        :return: a :class:`scipy.sparse.csc_matrix`
+        """
+        index = tuple(index) + (0,) * (self.ndim - 2 - len(index))
+        cells, chunk, position = self._last_written()
+        n_rows = self.shape[1]
+
+        return sparse.csc_matrix(
+            (self._gather(chunk, position, index), (cells % n_rows, cells // n_rows)),
+            shape=self.shape[1:3],
+        )
+
+    def assemble(self) -> StackedSparseMatrix:
+        """
+        Build the :class:`StackedSparseMatrix` of the entries written, keeping
+        the last values written in each cell.
+
+        :return: a :class:`StackedSparseMatrix`
+        """
+        cells, chunk, position = self._last_written()
+        n_rows = self.shape[1]
+
+        return StackedSparseMatrix.from_coo(
+            cells % n_rows,
+            cells // n_rows,
+            self._gather(chunk, position),
+            self.shape,
+        )
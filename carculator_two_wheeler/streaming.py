@@ -0,0 +1,253 @@
+"""
+streaming.py contains functions and classes to run Monte Carlo analyses
+in fixed-size chunks of iterations, while only keeping summary statistics
+(mean, variance and quantiles) across chunks.
+"""
+
+import numpy as np
+import xarray as xr
+
+from .parallel import run_iterations, split_iterations
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch, built on a hierarchy of compactors
+    (as in the KLL sketch of Karnin, Lang and Liberty, 2016).
+
+    Every cell of the summarized array receives exactly one sample per iteration,
+    hence all cells share the same compaction schedule and the buffers of each level
+    are stored as one array, of shape (\\*cells, items), sorted along the last axis.
+    An item held at level `h` stands for `2**h` samples.
+
+    :ivar k: capacity of each level. The rank error is of the order of 1/k.
+    :ivar levels: list of buffers, one per level
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.levels = []
+        self._offsets = []
+
+    @property
+    def count(self) -> int:
+        """Number of samples summarized by the sketch."""
+        return sum(lvl.shape[-1] * 2**h for h, lvl in enumerate(self.levels))
+
+    def update(self, samples: np.ndarray) -> None:
+        """
+        Add samples to the sketch.
+
+        :param samples: array of shape (\\*cells, n), with `n` the number of new samples per cell
+        """
+        self._add_to_level(0, np.asarray(samples, dtype=float))
+        self._compress()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        Merge another sketch, built on arrays of the same shape, into this one.
+
+        :param other: another :class:`QuantileSketch`
+        """
+        for h, lvl in enumerate(other.levels):
+            self._add_to_level(h, lvl)
+        self._compress()
+
+    def _add_to_level(self, h, items):
+        while len(self.levels) <= h:
+            self.levels.append(np.empty(items.shape[:-1] + (0,)))
+            self._offsets.append(0)
+        self.levels[h] = np.concatenate([self.levels[h], items], axis=-1)
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            lvl = self.levels[h]
+            if lvl.shape[-1] > self.k:
+                lvl = np.sort(lvl, axis=-1)
+                # an odd item stays at the current level
+                n_even = lvl.shape[-1] - lvl.shape[-1] % 2
+                # alternate the kept half to avoid biasing the estimate
+                promoted = lvl[..., self._offsets[h] : n_even : 2]
+                self._offsets[h] = 1 - self._offsets[h]
+                self.levels[h] = lvl[..., n_even:]
+                self._add_to_level(h + 1, promoted)
+            h += 1
+
+    def quantile(self, q) -> np.ndarray:
+        """
+        Return the estimated quantile(s) `q` for each cell.
+
+        :param q: quantile or sequence of quantiles, between 0 and 1
+        :return: array of shape (\\*cells,) or (\\*cells, len(q))
+        """
+        values = np.concatenate(self.levels, axis=-1)
+        weights = np.concatenate(
+            [np.full(lvl.shape[-1], 2.0**h) for h, lvl in enumerate(self.levels)]
+        )
+
+        order = np.argsort(values, axis=-1)
+        values = np.take_along_axis(values, order, axis=-1)
+        cumulated = np.cumsum(weights[order], axis=-1)
+
+        q = np.asarray(q, dtype=float)
+        targets = np.atleast_1d(q) * cumulated[..., -1:]
+
+        pos = np.clip(
+            (cumulated[..., None, :] < targets[..., :, None]).sum(axis=-1),
+            0,
+            values.shape[-1] - 1,
+        )
+        result = np.take_along_axis(values, pos, axis=-1)
+
+        return result if q.ndim else result[..., 0]
+
+
+class OnlineSummary:
+    """
+    Running summary of a result array along its `value` dimension.
+
+    Mean and variance are updated with the pairwise algorithm of Chan et al. (1979),
+    quantiles with a :class:`QuantileSketch`. Summaries of disjoint sets of iterations
+    can be merged with :meth:`merge`.
+
+    :ivar template: an empty array, with the dimensions and coordinates of the results, without `value`
+    :ivar count: number of iterations summarized
+    """
+
+    def __init__(self, sketch_size: int = 200):
+        self.sketch = QuantileSketch(k=sketch_size)
+        self.template = None
+        self.count = 0
+        self._mean = None
+        self._m2 = None
+
+    def update(self, array: xr.DataArray) -> None:
+        """
+        Add the iterations contained in `array` to the summary.
+
+        :param array: results array, with a `value` dimension
+        """
+        array = array.transpose(..., "value")
+        values = array.values.astype(float)
+
+        if self.template is None:
+            self.template = xr.zeros_like(array.isel(value=0, drop=True), dtype=float)
+
+        n = values.shape[-1]
+        mean = values.mean(axis=-1)
+        m2 = ((values - mean[..., None]) ** 2).sum(axis=-1)
+
+        self._combine(n, mean, m2)
+        self.sketch.update(values)
+
+    def merge(self, other: "OnlineSummary") -> None:
+        """
+        Merge the summary of another set of iterations into this one.
+
+        :param other: another :class:`OnlineSummary`
+        """
+        if other.count == 0:
+            return
+        if self.template is None:
+            self.template = other.template
+        self._combine(other.count, other._mean, other._m2)
+        self.sketch.merge(other.sketch)
+
+    def _combine(self, n, mean, m2):
+        if self.count == 0:
+            self.count, self._mean, self._m2 = n, mean, m2
+            return
+
+        total = self.count + n
+        delta = mean - self._mean
+        self._mean = self._mean + delta * n / total
+        self._m2 = self._m2 + m2 + delta**2 * self.count * n / total
+        self.count = total
+
+    def _wrap(self, values):
+        return self.template.copy(data=values)
+
+    def mean(self) -> xr.DataArray:
+        return self._wrap(self._mean)
+
+    def variance(self, ddof: int = 1) -> xr.DataArray:
+        return self._wrap(self._m2 / max(self.count - ddof, 1))
+
+    def std(self, ddof: int = 1) -> xr.DataArray:
+        return np.sqrt(self.variance(ddof=ddof))
+
+    def quantile(self, q) -> xr.DataArray:
+        """
+        Estimated quantile(s) of the results.
+
+        :param q: quantile or list of quantiles, between 0 and 1
+        :return: an array with the dimensions of the results, plus `quantile` if `q` is a list
+        """
+        values = self.sketch.quantile(q)
+        if np.ndim(q) == 0:
+            return self._wrap(values)
+
+        return xr.DataArray(
+            values,
+            dims=self.template.dims + ("quantile",),
+            coords={**self.template.coords, "quantile": list(q)},
+        )
+
+
+def run_in_chunks(
+    iterations: int,
+    chunk_size: int = 100,
+    model_kwargs: dict = None,
+    inventory_kwargs: dict = None,
+    impacts: bool = True,
+    sketch_size: int = 200,
+    seed: int = None,
+) -> dict:
+    """
+    Run a Monte Carlo analysis of `iterations` iterations, `chunk_size` iterations at a time.
+
+    Each chunk is run by :func:`carculator_two_wheeler.parallel.run_iterations`. Only
+    the summary statistics of the costs and impacts are kept in between chunks,
+    so that peak memory does not depend on the number of iterations requested.
+
+    .. code-block:: python
+
+        summaries = run_in_chunks(5000, chunk_size=250)
+        summaries["impacts"].quantile([0.05, 0.5, 0.95])
+
+    :param iterations: total number of iterations
+    :param chunk_size: number of iterations run at once
+    :param model_kwargs: keyword arguments passed to :class:`TwoWheelerModel`
+    :param inventory_kwargs: keyword arguments passed to :class:`InventoryTwoWheeler`
+    :param impacts: if False, only costs are calculated
+    :param sketch_size: capacity of the quantile sketches
+    :param seed: seed of the stochastic run, for reproducible results (see :func:`iteration_streams`)
+    :return: a dictionary with an :class:`OnlineSummary` for "costs" and, if calculated, for "impacts"
+    """
+
+    if iterations < 2:
+        raise ValueError("A stochastic run needs at least two iterations.")
+    if chunk_size < 2:
+        raise ValueError("`chunk_size` must be at least 2 for a stochastic run.")
+
+    summaries = {"costs": OnlineSummary(sketch_size)}
+    if impacts:
+        summaries["impacts"] = OnlineSummary(sketch_size)
+
+    for start, stop in split_iterations(iterations, chunk_size):
+        results = run_iterations(
+            seed,
+            start,
+            stop,
+            model_kwargs=model_kwargs,
+            inventory_kwargs=inventory_kwargs,
+            impacts=impacts,
+        )
+
+        for name, chunk in results.items():
+            summaries[name].update(chunk)
+
+        del results
+
+    return summaries
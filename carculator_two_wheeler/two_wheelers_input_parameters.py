@@ -2,7 +2,13 @@ import json
 from pathlib import Path
 from typing import Union
 
+import numpy as np
+import stats_arrays as sa
 from carculator_utils.vehicle_input_parameters import VehicleInputParameters
+from klausen import NamedParameters
+
+from .cache import load_compiled_parameters
+from .rng import INPUTS, iteration_streams
 
 
 def load_parameters(obj):
@@ -14,6 +20,24 @@ def load_parameters(obj):
         return obj
 
 
+def in_scope(fields: dict, scope: dict) -> bool:
+    """
+    Tell whether a parameter entry applies to at least one size, powertrain and year of `scope`.
+
+    :param fields: fields of the entry, with its "sizes", "powertrain" and "year"
+    :param scope: dictionary with the lists of "size", "powertrain" and "year" kept
+    """
+    for field, dim in (
+        ("sizes", "size"),
+        ("powertrain", "powertrain"),
+        ("year", "year"),
+    ):
+        values = fields[field] if isinstance(fields[field], list) else [fields[field]]
+        if not set(values) & set(scope[dim]):
+            return False
+    return True
+
+
 class TwoWheelerInputParameters(VehicleInputParameters):
     """ """
 
@@ -24,6 +48,218 @@ class TwoWheelerInputParameters(VehicleInputParameters):
         self,
         parameters: Union[str, Path, list] = None,
         extra: Union[str, Path, list] = None,
+        scope: dict = None,
     ) -> None:
-        """Create a `klausen <https://github.com/cmutel/klausen>`__ model with the car input parameters."""
-        super().__init__(None)
+        """
+        Create a `klausen <https://github.com/cmutel/klausen>`__ model with the two-wheeler input parameters.
+
+        Default parameters are loaded from their compiled form (see :func:`load_compiled_parameters`),
+        which is built on first use and saved in the cache directory. They are kept in :attr:`compiled`,
+        from which :meth:`static`, :meth:`stochastic` and :func:`fill_xarray_from_input_parameters`
+        read the columns they need. The `klausen` dictionaries :attr:`data` and :attr:`metadata`
+        are only built when first accessed, after which :attr:`compiled` is None.
+
+        With `scope`, e.g., ``{"size": ["Scooter <4kW"], "year": [2020]}``, the entries which do not apply
+        to any of its sizes, powertrains and years are dropped, and :attr:`sizes`, :attr:`powertrains`
+        and :attr:`years` are narrowed down to it, so that only this slice is sampled and
+        filled in by :func:`fill_xarray_from_input_parameters`. Missing keys keep all their values.
+
+        :param scope: dictionary with the lists of "size", "powertrain" and "year" to keep
+        """
+        self.compiled = None
+        self.compiled_rows = None
+
+        if parameters is not None or extra is not None:
+            parameters = load_parameters(
+                self.DEFAULT if parameters is None else parameters
+            )
+            if scope is not None:
+                scope = self._check_scope(
+                    scope,
+                    sizes={s for o in parameters.values() for s in o.get("sizes", [])},
+                    powertrains={
+                        p for o in parameters.values() for p in o.get("powertrain", [])
+                    },
+                    years={o["year"] for o in parameters.values()},
+                )
+                parameters = {k: v for k, v in parameters.items() if in_scope(v, scope)}
+
+            super().__init__(parameters, extra)
+            self._narrow_to_scope(scope)
+            return
+
+        NamedParameters.__init__(self, None)
+
+        compiled = load_compiled_parameters(self.DEFAULT, self.EXTRA)
+        self.sizes = list(compiled.summary["sizes"])
+        self.powertrains = list(compiled.summary["powertrains"])
+        self.parameters = list(compiled.summary["parameters"])
+
+        # keep a list of input parameters, for sensitivity purpose
+        self.input_parameters = list(compiled.summary["input_parameters"])
+
+        self.years = list(compiled.summary["years"])
+        rows = np.arange(len(compiled.keys))
+
+        if scope is not None:
+            scope = self._check_scope(scope, self.sizes, self.powertrains, self.years)
+            rows = rows[
+                [
+                    in_scope({"sizes": s, "powertrain": p, "year": y}, scope)
+                    for s, p, y in zip(
+                        compiled.decode("sizes"),
+                        compiled.decode("powertrain"),
+                        compiled.decode("year"),
+                    )
+                ]
+            ]
+
+        self.compiled = compiled
+        self.compiled_rows = rows
+        self._narrow_to_scope(scope)
+
+    # `data` and `metadata` are decoded from :attr:`compiled` on first access
+    @property
+    def data(self) -> dict:
+        self._decode_compiled()
+        return self._data
+
+    @data.setter
+    def data(self, value: dict) -> None:
+        self._data = value
+
+    @property
+    def metadata(self) -> dict:
+        self._decode_compiled()
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value: dict) -> None:
+        self._metadata = value
+
+    def _decode_compiled(self) -> None:
+        compiled = self.__dict__.get("compiled")
+        if compiled is None:
+            return
+
+        self.compiled = None
+        self.add_parameters(compiled.records(self.compiled_rows))
+        self.compiled_rows = None
+
+    def __len__(self):
+        if self.compiled is not None:
+            return len(self.compiled_rows)
+        return super().__len__()
+
+    def _sampled_keys(self) -> list:
+        """Keys of the parameters drawn from a distribution, sorted, as in `klausen`."""
+        if self.compiled is None:
+            return sorted(
+                key
+                for key in self.data
+                if self.data[key].get("kind") in ("distribution", None)
+            )
+
+        keys = [self.compiled.keys[i] for i in self.compiled_rows.tolist()]
+        kinds = self.compiled.decode("kind", self.compiled_rows)
+        return sorted(
+            k for k, kind in zip(keys, kinds) if kind in ("distribution", None)
+        )
+
+    def _uncertainty_array(self, keys: list) -> np.ndarray:
+        """
+        Return the `stats_arrays` parameter array of the parameters `keys`,
+        as :meth:`UncertaintyBase.from_dicts` builds it from :attr:`data`.
+        """
+        if self.compiled is None:
+            return sa.UncertaintyBase.from_dicts(*[self.data[key] for key in keys])
+
+        position = {k: i for i, k in enumerate(self.compiled.keys)}
+        rows = np.array([position[k] for k in keys], dtype=int)
+
+        params = sa.UncertaintyBase.from_dicts(*[{}] * len(keys))
+        fields = ("loc", "scale", "shape", "minimum", "maximum", "uncertainty_type")
+        for field in fields:
+            if field in self.compiled.columns:
+                values = self.compiled.numbers(field, rows)
+                given = ~np.isnan(values)
+                params[field][given] = values[given]
+
+        return params
+
+    def static(self):
+        """
+        Set the value of each input parameter to its amount (or, without amount, the median of its distribution).
+        """
+        if self.compiled is None or "amount" not in self.compiled.columns:
+            return super().static()
+
+        keys = self._sampled_keys()
+        position = {k: i for i, k in enumerate(self.compiled.keys)}
+        amounts = self.compiled.numbers("amount", [position[k] for k in keys])
+
+        if np.isnan(amounts).any():
+            return super().static()
+
+        self.values = dict(zip(keys, amounts.tolist()))
+        self.iterations = None
+
+    @staticmethod
+    def _check_scope(scope: dict, sizes, powertrains, years) -> dict:
+        """Complete `scope` with all the sizes, powertrains and years missing, and check its values."""
+        scope = {
+            "size": list(scope.get("size", sorted(sizes))),
+            "powertrain": list(scope.get("powertrain", sorted(powertrains))),
+            "year": list(scope.get("year", sorted(years))),
+        }
+
+        for dim, values in (
+            ("size", sizes),
+            ("powertrain", powertrains),
+            ("year", years),
+        ):
+            unknown = [v for v in scope[dim] if v not in values]
+            if unknown:
+                raise ValueError(f"Unknown {dim}(s) in the scope: {unknown}.")
+
+        return scope
+
+    def _narrow_to_scope(self, scope: dict) -> None:
+        self.scope = scope
+        if scope is not None:
+            self.sizes = [s for s in self.sizes if s in scope["size"]]
+            self.powertrains = [p for p in self.powertrains if p in scope["powertrain"]]
+            self.years = [y for y in self.years if y in scope["year"]]
+
+    def stochastic(self, iterations: int = 1000, seed: int = None, offset: int = 0):
+        """
+        Draw `iterations` values for each input parameter.
+
+        Without `seed`, values are drawn as `klausen` does, from an unseeded random number generator.
+        With `seed`, the values of each iteration are drawn from their own random number stream
+        (see :func:`iteration_streams`), so that iterations `offset` to `offset + iterations`
+        are identical whether they are drawn at once or in several chunks or processes.
+
+        :param iterations: number of iterations
+        :param seed: seed of the stochastic run
+        :param offset: index of the first iteration drawn
+        """
+        self.iterations = iterations
+        keys = self._sampled_keys()
+        rng = sa.MCRandomNumberGenerator(self._uncertainty_array(keys))
+
+        if seed is None:
+            self.values = {
+                key: row.reshape((-1,))
+                for key, row in zip(keys, rng.generate(iterations))
+            }
+            return
+
+        samples = np.zeros((len(keys), iterations))
+        for i, stream in enumerate(
+            iteration_streams(seed, range(offset, offset + iterations), INPUTS)
+        ):
+            rng.random = stream
+            samples[:, i] = rng.generate(1)
+
+        self.values = dict(zip(keys, samples))
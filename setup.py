@@ -47,6 +47,9 @@ setup(
     install_requires=[
         "carculator_utils",
     ],
+    extras_require={
+        "parquet": ["pyarrow"],
+    },
     url="https://github.com/romainsacchi/carculator_two_wheeler",
     description="Prospective life cycle assessment of two-wheelers vehicles made blazing fast",
     long_description_content_type="text/markdown",
@@ -0,0 +1,133 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from carculator_two_wheeler import (
+    TwoWheelerInputParameters,
+    cache,
+    fill_xarray_from_input_parameters,
+)
+from carculator_two_wheeler.cache import (
+    CompiledParameters,
+    DataFileCache,
+    MemoCache,
+    hash_inputs,
+)
+
+
+def test_compiled_parameters_round_trip(tmp_path):
+    with open(TwoWheelerInputParameters.DEFAULT) as f:
+        parameters = json.load(f)
+    with open(TwoWheelerInputParameters.EXTRA) as f:
+        extra = json.load(f)
+
+    filepath = tmp_path / "parameters.bin"
+    CompiledParameters.from_parameters(parameters, extra).save(filepath)
+    compiled = CompiledParameters.load(filepath)
+
+    records = compiled.records()
+    assert list(records) == list(parameters)
+    for key, record in records.items():
+        metadata = record.pop("metadata")
+        assert {**record, **metadata} == parameters[key]
+
+    assert compiled.summary["parameters"] == sorted(
+        {o["name"] for o in parameters.values()}.union(extra)
+    )
+
+
+def test_input_parameters_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("CARCULATOR_TWO_WHEELER_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(cache, "_compiled", {})
+
+    tip = TwoWheelerInputParameters()
+
+    assert len(list(tmp_path.glob("parameters-*.bin"))) == 1
+    assert "lifetime kilometers" in tip.input_parameters
+
+
+def test_hash_inputs():
+    a = xr.DataArray(np.arange(4.0), dims=["value"], coords={"value": range(4)})
+
+    assert hash_inputs(a, "x") == hash_inputs(a.copy(), "x")
+    assert hash_inputs(a) != hash_inputs(a + 1)
+    assert hash_inputs(a) != hash_inputs(a.assign_coords(value=range(1, 5)))
+    assert hash_inputs({"a": 1, "b": 2}) == hash_inputs({"b": 2, "a": 1})
+
+
+def test_memo_cache(tmp_path):
+    memo = MemoCache(maxsize=2, directory=tmp_path)
+    for key in "abc":
+        memo.set(key, key.upper())
+
+    assert len(memo) == 2
+    assert memo.get("c") == "C"
+    assert memo.get("z") is None
+    assert (memo.hits, memo.misses) == (1, 1)
+
+    # evicted from memory, read back from disk
+    assert memo.get("a") == "A"
+
+    memo.clear(disk=True)
+    assert "a" not in memo
+
+
+def test_memo_cache_bounded_in_bytes():
+    memo = MemoCache(maxsize=10, max_bytes=2000)
+    for key in "abc":
+        memo.set(key, (np.zeros(100), np.zeros(50)))
+
+    # 1,200 bytes each, hence only the last one is kept
+    assert list(memo._values) == ["c"]
+    assert memo.nbytes == 1200
+
+    memo.set("d", np.zeros(1000))
+    assert "d" not in memo and "c" in memo
+
+
+def test_data_file_cache(tmp_path):
+    filepath = tmp_path / "data.yaml"
+    filepath.write_text("markup: [a, b]\n")
+
+    files = DataFileCache()
+    content = files.load(filepath)
+    assert content == {"markup": ("a", "b")}
+    assert files.load(filepath) is content
+    assert (files.hits, files.misses) == (1, 1)
+
+    with pytest.raises(TypeError):
+        content["markup"] = ()
+
+    filepath.write_text("markup: [a, b, c]\n")
+    os.utime(filepath, ns=(0, 0))
+    assert files.load(filepath)["markup"] == ("a", "b", "c")
+    assert files.misses == 2
+
+
+def test_input_parameters_read_from_columns():
+    scope = {"size": ["Scooter <4kW", "Moped <4kW"], "year": [2020, 2030]}
+    compiled = TwoWheelerInputParameters(scope=scope)
+    parsed = TwoWheelerInputParameters(TwoWheelerInputParameters.DEFAULT, scope=scope)
+
+    for sample in (
+        lambda tip: tip.static(),
+        lambda tip: tip.stochastic(5, seed=42),
+    ):
+        sample(compiled)
+        sample(parsed)
+        assert compiled.values.keys() == parsed.values.keys()
+        for key, values in parsed.values.items():
+            np.testing.assert_array_equal(compiled.values[key], values)
+
+        _, array = fill_xarray_from_input_parameters(compiled)
+        _, expected = fill_xarray_from_input_parameters(parsed)
+        xr.testing.assert_equal(array, expected)
+
+    # the `klausen` dictionaries are only built when accessed
+    assert compiled.compiled is not None
+    assert len(compiled) == len(parsed.data)
+    assert compiled.metadata.keys() == parsed.metadata.keys()
+    assert compiled.compiled is None
@@ -0,0 +1,103 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from carculator_two_wheeler import *
+from carculator_two_wheeler.export import EXCHANGE_TYPES, Presamples, iter_exchanges
+
+SCOPE = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020, 2030]}
+
+
+def get_inventory(iterations=None):
+    tip = TwoWheelerInputParameters(scope=SCOPE)
+    if iterations:
+        tip.stochastic(iterations, seed=42)
+    else:
+        tip.static()
+    _, array = fill_xarray_from_input_parameters(tip)
+    model = TwoWheelerModel(array, seed=42)
+    model.set_all()
+    return InventoryTwoWheeler(model)
+
+
+def test_export_lci_to_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    ic = get_inventory()
+    paths = ic.export_lci_to_parquet(tmp_path, batch_size=1000)
+    assert "presamples" not in paths
+
+    flows = pq.read_table(paths["flows"]).to_pandas()
+    exchanges = pq.ParquetFile(paths["exchanges"])
+    assert exchanges.metadata.num_row_groups > 1
+    exchanges = exchanges.read().to_pandas()
+    assert len(flows) == len(ic.inputs)
+
+    # the vehicle, as in the A matrix
+    vehicle = ic.inputs[("two-wheeler, BEV, Scooter <4kW", "CH", "unit", "two-wheeler")]
+    selected = exchanges[
+        (exchanges["activity"] == vehicle) & (exchanges["year"] == 2030)
+    ]
+    A = ic.A.toarray()[0, :, vehicle, 1]
+    assert set(selected["flow"]) == set(np.flatnonzero(A))
+    for _, exc in selected.iterrows():
+        sign = 1 if exc["type"] == "production" else -1
+        assert exc["amount"] == pytest.approx(sign * A[exc["flow"]], rel=1e-6)
+    assert set(exchanges["type"]) <= set(EXCHANGE_TYPES)
+
+
+def test_presamples(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    ic = get_inventory(iterations=5)
+    paths = ic.export_lci_to_parquet(tmp_path, presamples_chunk_size=2)
+
+    presamples = Presamples(paths["presamples"])
+    n_exchanges = pq.ParquetFile(paths["exchanges"]).metadata.num_rows
+    assert presamples.shape == (n_exchanges, 5)
+    assert [start for start, _ in presamples.chunks()] == [0, 2, 4]
+
+    values = np.concatenate(
+        [batch["values"] for batch in iter_exchanges(ic, batch_size=100)]
+    )
+    np.testing.assert_array_equal(presamples[:, :], values)
+    assert presamples[10, 3] == values[10, 3]
+
+
+def test_export_lci_to_sqlite(tmp_path):
+    ic = get_inventory(iterations=3)
+    filepath = tmp_path / "lci.sqlite"
+    batches = list(iter_exchanges(ic, batch_size=500))
+
+    ic.export_lci_to_sqlite(filepath, database="a", presamples=True, batch_size=500)
+    # exported again, and as another database
+    ic.export_lci_to_sqlite(filepath, database="a", presamples=True)
+    ic.export_lci_to_sqlite(filepath, database="b", years=[2030])
+
+    connection = sqlite3.connect(filepath)
+    count = lambda query: connection.execute(query).fetchone()[0]
+    n_exchanges = sum(len(b["year"]) for b in batches)
+
+    assert count("SELECT COUNT(*) FROM flows") == len(ic.inputs)
+    assert count("SELECT COUNT(*) FROM exchanges WHERE database = 'a'") == n_exchanges
+    assert count("SELECT COUNT(*) FROM presamples") == n_exchanges
+    assert count("SELECT COUNT(*) FROM exchanges WHERE database = 'b'") == sum(
+        (b["year"] == 2030).sum() for b in batches
+    )
+
+    year, activity, flow, amount = (
+        batches[0][k][0] for k in ("year", "activity", "flow", "amount")
+    )
+    labels = [ic.rev_inputs[activity], ic.rev_inputs[flow]]
+    stored, dtype, amounts = connection.execute(
+        """
+        SELECT e.amount, p.dtype, p.amounts FROM exchanges e
+        JOIN presamples p USING (database, year, activity, flow)
+        JOIN flows a ON a.id = e.activity JOIN flows f ON f.id = e.flow
+        WHERE e.database = 'a' AND e.year = ? AND a.name = ? AND f.name = ?
+        """,
+        (int(year), labels[0][0], labels[1][0]),
+    ).fetchone()
+    assert stored == amount
+    np.testing.assert_array_equal(
+        np.frombuffer(amounts, dtype=dtype), batches[0]["values"][0]
+    )
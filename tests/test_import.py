@@ -0,0 +1,36 @@
+import json
+import subprocess
+import sys
+
+# generous budget, importing the package should not load any dependency
+IMPORT_TIME_BUDGET = 0.5
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import carculator_two_wheeler
+elapsed = time.perf_counter() - start
+heavy = ["numpy", "xarray", "numexpr", "yaml", "carculator_utils"]
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in heavy if m in sys.modules]}))
+"""
+
+
+def run(script):
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_import_is_lazy():
+    result = run(SCRIPT)
+
+    assert result["loaded"] == []
+    assert result["elapsed"] < IMPORT_TIME_BUDGET
+
+
+def test_lazy_attributes_resolve():
+    import carculator_two_wheeler
+
+    for name in carculator_two_wheeler.__all__:
+        assert getattr(carculator_two_wheeler, name).__name__ == name
@@ -0,0 +1,44 @@
+from carculator_two_wheeler.label_index import LabelIndex
+
+labels = [
+    ("transport, two-wheeler, BEV, Bicycle <25", "RER", "kilometer", "transport"),
+    ("two-wheeler, BEV, Bicycle <25", "RER", "unit", "vehicle"),
+    ("two-wheeler, ICEV-p, Motorcycle <4kW", "RER", "unit", "vehicle"),
+    ("market for electricity, low voltage", "CH", "kilowatt hour", "electricity"),
+    ("market for electricity, low voltage", "FR", "kilowatt hour", "electricity"),
+]
+
+
+def test_find_matches_list_comprehension():
+    index = LabelIndex(labels)
+
+    assert index.find("two-wheeler") == [0, 1, 2]
+    assert index.find(("two-wheeler", "BEV"), excludes="transport") == [1]
+    assert index.find(startswith="two-wheeler, ") == [
+        i for i, label in enumerate(labels) if label[0].startswith("two-wheeler, ")
+    ]
+    assert index.find(any_of=[("ICEV-p", "transport")]) == [0, 2]
+    assert index.find("electricity", position=1) == []
+    assert index.find("electricity", excludes="CH", excludes_in=1) == [4]
+    assert index.find("hydrogen") == []
+
+
+def test_queries_are_memoized():
+    index = LabelIndex(labels)
+
+    assert index.mask("two-wheeler") is index.mask(("two-wheeler",))
+
+
+def test_lookup_by_tokens():
+    index = LabelIndex(labels)
+
+    assert index.lookup("two-wheeler", "BEV", "Bicycle <25") == [0, 1]
+    assert index.lookup("BEV", "Motorcycle <4kW") == []
+    assert index.select(startswith="two-wheeler, BEV") == [labels[1]]
+
+
+def test_string_labels():
+    index = LabelIndex(["Bicycle <25 - BEV", "Motorcycle <4kW - ICEV-p"])
+
+    assert index.select("BEV") == ["Bicycle <25 - BEV"]
+    assert len(index) == 2
@@ -1,9 +1,13 @@
+import copy
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pytest
 
 from carculator_two_wheeler import *
+from carculator_two_wheeler.model import ENERGY_RESULTS
+from carculator_two_wheeler.sparse_matrix import StackedSparseMatrix
 
 DATA = Path(__file__, "..").resolve() / "fixtures" / "two_wheelers_values.xlsx"
 OUTPUT = Path(__file__, "..").resolve() / "fixtures" / "test_model_results.xlsx"
@@ -75,3 +79,370 @@ def test_model_results():
 def test_lcia():
     ic = InventoryTwoWheeler(twm)
     ic.calculate_impacts()
+
+
+def test_mass_loop_convergence():
+    report = twm.mass_loop_report
+    assert report.all_converged
+    assert report.residuals[-1] <= report.tolerance
+    assert report.iterations.max() == report.n_iterations
+
+
+class FeedbackModel(TwoWheelerModel):
+    """Model in which the powertrain mass grows with the power, hence the curb mass."""
+
+    def set_component_masses(self):
+        super().set_component_masses()
+        self.powertrains_calculated.append(
+            self.array.coords["powertrain"].values.tolist()
+        )
+        self["mechanical powertrain mass"] += self["combustion power"] * 15
+
+
+def run_feedback_model(acceleration=None):
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV", "ICEV-p"], "year": [2020]}
+    _, array = fill_xarray_from_input_parameters(twip)
+    model = FeedbackModel(array, scope=scope)
+    model.powertrains_calculated = []
+    model.set_all(tolerance=1e-6, acceleration=acceleration)
+    return model
+
+
+def test_mass_loop_skips_converged_vehicles():
+    model = run_feedback_model()
+    iterations = model.mass_loop_report.iterations.sel(size="Scooter <4kW", year=2020)
+
+    assert iterations.sel(powertrain="BEV").item() == 3
+    assert iterations.sel(powertrain="ICEV-p").item() > 10
+    # only the vehicles still iterating are calculated after the third pass
+    assert model.powertrains_calculated[3:] == [["ICEV-p"]] * (
+        iterations.sel(powertrain="ICEV-p").item() - 3
+    )
+    np.testing.assert_allclose(
+        model.array.sel(powertrain="BEV", parameter="driving mass").values,
+        twm.array.sel(
+            size=["Scooter <4kW"],
+            powertrain="BEV",
+            year=[2020],
+            parameter="driving mass",
+        ).values,
+        rtol=1e-6,
+    )
+
+
+def test_aitken_acceleration():
+    plain, accelerated = run_feedback_model(), run_feedback_model("aitken")
+
+    assert accelerated.mass_loop_report.all_converged
+    assert (
+        accelerated.mass_loop_report.n_iterations
+        < plain.mass_loop_report.n_iterations / 2
+    )
+    np.testing.assert_allclose(
+        accelerated.array.sel(parameter="driving mass").values,
+        plain.array.sel(parameter="driving mass").values,
+        rtol=1e-5,
+    )
+
+
+def test_energy_results_memoized_for_static_runs():
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020]}
+    ENERGY_RESULTS.clear()
+    hits = ENERGY_RESULTS.hits
+
+    tip = TwoWheelerInputParameters(scope=scope)
+    tip.stochastic(3, seed=1)
+    _, array = fill_xarray_from_input_parameters(tip)
+    TwoWheelerModel(array, seed=1).set_all()
+    assert (ENERGY_RESULTS.hits, len(ENERGY_RESULTS)) == (hits, 0)
+
+    for _ in range(2):
+        _, array = fill_xarray_from_input_parameters(twip)
+        TwoWheelerModel(array, scope=scope).set_all()
+    assert ENERGY_RESULTS.hits == hits + 1
+
+
+def test_energy_per_second_is_opt_in():
+    assert twm.energy.coords["parameter"].values.tolist() == [
+        "motive energy",
+        "auxiliary energy",
+        "recuperated energy",
+        "velocity",
+    ]
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    tm = TwoWheelerModel(array, keep_energy_per_second=True)
+    tm.set_all()
+
+    assert tm.energy.sizes["parameter"] == twm.energy_totals.sizes["parameter"]
+    np.testing.assert_allclose(
+        tm.energy_totals.values, twm.energy_totals.values, rtol=1e-9, atol=1e-8
+    )
+    np.testing.assert_allclose(
+        tm.array.sel(parameter="TtW energy").values,
+        twm.array.sel(parameter="TtW energy").values,
+        rtol=1e-9,
+    )
+
+
+def test_components_mapping():
+    ic = InventoryTwoWheeler(twm, sparse=False)
+    row = ic.find_input_indices(("motor scooter production",))[0]
+
+    for label in ic.select_combined_dim(
+        contains=("ICEV-p",), any_of=(("Scooter", "Moped", "Motorcycle"),)
+    ):
+        size, powertrain = label.split(" - ")
+        column = ic.find_input_indices(
+            (f"two-wheeler, {powertrain}, {size}",), excludes=("transport",)
+        )[0]
+        np.testing.assert_allclose(
+            ic.A[:, row, column],
+            ic.array.sel(parameter="glider base mass", combined_dim=label) / 90 * -1,
+        )
+
+    mapping = ic.compile_components_mapping()
+    assert len(set(zip(mapping["rows"], mapping["columns"]))) == len(mapping["rows"])
+
+
+def test_sparse_inventory_matches_dense():
+    ic = InventoryTwoWheeler(twm)
+    reference = InventoryTwoWheeler(twm, sparse=False)
+
+    # the sparse A matrix is assembled from its entries, never from a dense A matrix
+    np.testing.assert_array_equal(ic.A.toarray(), reference.A)
+    assert ic.A.nnz == StackedSparseMatrix.from_dense(reference.A).nnz
+    np.testing.assert_allclose(
+        ic.calculate_impacts().values, reference.calculate_impacts().values, rtol=1e-6
+    )
+
+
+def test_inventory_update():
+    model = copy.deepcopy(twm)
+    ic = InventoryTwoWheeler(model)
+    ic.calculate_impacts()
+
+    model.array.loc[dict(parameter="glider base mass")] *= 1.1
+    ic.update(["glider base mass"])
+
+    np.testing.assert_array_equal(
+        ic.calculate_impacts().values,
+        InventoryTwoWheeler(model).calculate_impacts().values,
+    )
+
+
+def test_recompute_costs_only():
+    # inputs of the stages are only kept on demand
+    assert twm.stage_inputs is None
+    with pytest.raises(ValueError):
+        copy.deepcopy(twm).recompute(["interest rate"])
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    model = TwoWheelerModel(array)
+    model.set_all(track_changes=True)
+    model.array.loc[dict(parameter="interest rate")] *= 1.5
+
+    assert model.recompute(["interest rate"]) == ["set_costs"]
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    array.loc[dict(parameter="interest rate")] *= 1.5
+    reference = TwoWheelerModel(array)
+    reference.set_all()
+
+    np.testing.assert_allclose(
+        model["total cost per km"].values, reference["total cost per km"].values
+    )
+
+
+def test_scenarios():
+    capacity = {("BEV", "Scooter <4kW", 2020): 3.0}
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    model = TwoWheelerModel(array, scenarios=[{}, {"capacity": capacity}])
+    model.set_all()
+    results = model.split_scenarios(model.array)
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    reference = TwoWheelerModel(array, energy_storage={"capacity": capacity})
+    reference.set_all()
+
+    for scenario, expected in enumerate([twm, reference]):
+        np.testing.assert_allclose(
+            results.sel(scenario=scenario).values, expected.array.values, rtol=1e-9
+        )
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [("target_mass", 120), ("target_range", 150), ("energy_consumption", 200)],
+)
+def test_scenarios_match_separate_models(name, value):
+    scope = {"powertrain": ["BEV", "ICEV-p"], "year": [2020]}
+    override = {(pwt, "Scooter <4kW", 2020): value for pwt in scope["powertrain"]}
+
+    _, array = fill_xarray_from_input_parameters(twip, scope=scope)
+    model = TwoWheelerModel(array, scenarios=[{}, {name: override}])
+    model.set_all()
+    results = model.split_scenarios(model.array)
+
+    for scenario, kwargs in enumerate([{}, {name: override}]):
+        _, array = fill_xarray_from_input_parameters(twip, scope=scope)
+        reference = TwoWheelerModel(array, **kwargs)
+        reference.set_all()
+
+        np.testing.assert_allclose(
+            results.sel(scenario=scenario).values, reference.array.values, rtol=1e-6
+        )
+
+    vehicle = dict(size="Scooter <4kW", powertrain="BEV", year=2020)
+    assert (results.sel(scenario=1, parameter="driving mass", **vehicle) > 0).all()
+
+
+def test_unavailable_vehicles():
+    assert not twm.available.sel(powertrain="ICEV-p", size="Kick-scooter").any()
+    assert not twm.available.sel(powertrain="BEV", year=slice(None, 2010)).any()
+    assert (twm.array.sel(parameter="TtW energy").where(~twm.available, 0) == 0).all()
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    model = TwoWheelerModel(
+        array.sel(powertrain=["ICEV-p"], year=[2000, 2020]),
+    )
+    assert "Kick-scooter" not in model.array.coords["size"].values
+    assert model.available.all()
+
+
+def test_unavailable_vehicles_not_calculated():
+    unavailable = dict(size="Scooter <4kW", powertrain="Human")
+    assert not twm.available.sel(unavailable).any()
+
+    report = twm.mass_loop_report
+    assert (report.iterations.sel(unavailable) == 0).all()
+    assert (report.iterations.where(twm.available, 1) > 0).all()
+
+    # neither driven through the cycle nor emitting
+    assert (twm.energy_totals.sel(unavailable) == 0).all()
+    assert (twm.energy.sel(unavailable) == 0).all()
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    parameters = [
+        "driving mass",
+        "range",
+        "Carbon monoxide direct emissions, urban",
+        "tire wear emissions",
+        "noise, octave 1, day time, urban",
+        "total cost per km",
+    ]
+    np.testing.assert_array_equal(
+        twm.array.sel(**unavailable, parameter=parameters).values,
+        array.sel(**unavailable, parameter=parameters).values,
+    )
+    assert (
+        twm.array.sel(size="Scooter <4kW", powertrain="BEV", parameter=parameters)
+        != array.sel(size="Scooter <4kW", powertrain="BEV", parameter=parameters)
+    ).any()
+
+
+def test_unavailable_vehicles_left_out_of_inventory():
+    ic = InventoryTwoWheeler(twm)
+    available = twm.available.any(dim="year")
+    n_available = int(available.sum())
+    assert n_available < available.size
+
+    # one vehicle and one transport activity per size and powertrain available in any year
+    assert len(ic.find_input_indices(("transport, two-wheeler, ",))) == n_available
+    assert ic.array.sizes["combined_dim"] == n_available
+    assert ic.A.shape[2] == len(ic.inputs)
+    assert not ic.find_input_indices(("two-wheeler, ICEV-p, Kick-scooter",))
+
+    unavailable = dict(size="Kick-scooter", powertrain="ICEV-p")
+    assert (ic.calculate_impacts().sel(unavailable) == 0).all()
+    assert (twm.calculate_cost_impacts().sel(unavailable) == 0).all()
+    available = dict(size="Scooter <4kW", powertrain="BEV", year=2020)
+    assert (twm.calculate_cost_impacts().sel(**available, cost_type="total") > 0).all()
+
+
+def test_scope():
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020]}
+
+    tip = TwoWheelerInputParameters(scope=scope)
+    tip.static()
+    _, array = fill_xarray_from_input_parameters(tip)
+    assert array.sizes["size"] == array.sizes["powertrain"] == array.sizes["year"] == 1
+    assert len(tip.data) < len(twip.data)
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    model = TwoWheelerModel(array, scope=scope)
+    model.set_all()
+
+    np.testing.assert_allclose(
+        model.array.sel(size="Scooter <4kW", powertrain="BEV", year=2020).values,
+        twm.array.sel(size="Scooter <4kW", powertrain="BEV", year=2020).values,
+        rtol=1e-6,
+    )
+
+
+def test_battery_chemistry():
+    chemistry = twm.battery_chemistry.sel(size="Scooter <4kW", powertrain="BEV")
+    assert chemistry.sel(year=[2000, 2020, 2050]).values.tolist() == [
+        "NMC-111",
+        "NMC-622",
+        "NMC-955",
+    ]
+
+    _, array = fill_xarray_from_input_parameters(twip)
+    model = TwoWheelerModel(
+        array, energy_storage={"electric": {("BEV", "Scooter <4kW", 2020): "LFP"}}
+    )
+    assert (
+        model.battery_chemistry.sel(
+            size="Scooter <4kW", powertrain="BEV", year=2020
+        ).item()
+        == "LFP"
+    )
+    assert model.energy_storage["electric"][("BEV", "Scooter <4kW", 2030)] == "NMC-955"
+
+
+def test_float32_storage():
+    ic = InventoryTwoWheeler(copy.deepcopy(twm))
+    assert twm.array.dtype == twm.energy.dtype == ic.A.dtype == np.float32
+    assert twm.energy_totals.dtype == np.float64
+
+    _, array = fill_xarray_from_input_parameters(twip, dtype=np.float64)
+    model = TwoWheelerModel(array)
+    model.set_all()
+    reference = InventoryTwoWheeler(model)
+    assert model.energy.dtype == reference.A.dtype == np.float64
+
+    np.testing.assert_allclose(
+        twm.array.values, model.array.values, rtol=1e-5, atol=1e-9
+    )
+    np.testing.assert_allclose(
+        ic.calculate_impacts().values,
+        reference.calculate_impacts().values,
+        rtol=1e-5,
+        atol=1e-12,
+    )
+
+
+def test_impacts_for_methods():
+    ic = InventoryTwoWheeler(copy.deepcopy(twm))
+    methods = [("recipe", "midpoint"), ("ef", "midpoint", "SSP2-PkBudg650")]
+    results = ic.calculate_impacts_for_methods(methods)
+
+    assert results.coords["method"].values.tolist() == [
+        "recipe, midpoint, SSP2-NPi",
+        "ef, midpoint, SSP2-PkBudg650",
+    ]
+    assert (ic.method, ic.scenario) == ("recipe", "SSP2-NPi")
+
+    for label, (method, _, *scenario) in zip(results.coords["method"].values, methods):
+        expected = InventoryTwoWheeler(
+            copy.deepcopy(twm), method=method, scenario=(scenario or ["SSP2-NPi"])[0]
+        ).calculate_impacts()
+        np.testing.assert_allclose(
+            results.sel(
+                {"method": label, "impact_category": expected.impact_category}
+            ).values,
+            expected.values,
+            rtol=1e-9,
+        )
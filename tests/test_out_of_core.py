@@ -0,0 +1,21 @@
+import numpy as np
+
+from carculator_two_wheeler.out_of_core import open_results, run_out_of_core
+from carculator_two_wheeler.parallel import run_iterations
+
+
+def test_run_out_of_core(tmp_path):
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020]}
+    kwargs = dict(model_kwargs={"scope": scope}, impacts=False, model_array=True)
+
+    results = run_out_of_core(5, tmp_path, seed=42, chunk_size=2, **kwargs)
+    reference = run_iterations(42, 0, 5, **kwargs)
+
+    assert isinstance(results["array"].data, np.memmap)
+    for name in ("array", "costs"):
+        np.testing.assert_array_equal(results[name].values, reference[name].values)
+        assert results[name].dims == reference[name].dims
+
+    reopened = open_results(tmp_path)
+    assert set(reopened) == {"array", "costs"}
+    assert reopened["costs"].identical(results["costs"])
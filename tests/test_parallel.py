@@ -0,0 +1,52 @@
+import numpy as np
+
+from carculator_two_wheeler import (
+    InventoryTwoWheeler,
+    TwoWheelerInputParameters,
+    TwoWheelerModel,
+    fill_xarray_from_input_parameters,
+)
+from carculator_two_wheeler.parallel import run_parallel, split_iterations
+
+
+def test_seeded_sampling_does_not_depend_on_chunks():
+    full = TwoWheelerInputParameters()
+    full.stochastic(6, seed=42)
+
+    chunks = []
+    for start, stop in split_iterations(6, 4):
+        tip = TwoWheelerInputParameters()
+        tip.stochastic(stop - start, seed=42, offset=start)
+        chunks.append(tip.values)
+
+    for key, values in full.values.items():
+        np.testing.assert_array_equal(values, np.concatenate([c[key] for c in chunks]))
+
+
+def test_split_iterations():
+    assert split_iterations(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    # a trailing single iteration is merged into the previous block
+    assert split_iterations(9, 4) == [(0, 4), (4, 9)]
+
+
+def test_parallel_run_matches_single_process_run():
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020]}
+    results = run_parallel(
+        6, 42, processes=2, chunk_size=3, model_kwargs={"scope": scope}
+    )
+
+    tip = TwoWheelerInputParameters()
+    tip.stochastic(6, seed=42)
+    _, array = fill_xarray_from_input_parameters(tip)
+    model = TwoWheelerModel(array, seed=42, scope=scope)
+    model.set_all()
+
+    # the battery cost factor of `adjust_cost` is drawn per iteration
+    assert model.array.sel(parameter="energy battery cost per kWh").std() > 0
+
+    np.testing.assert_array_equal(
+        results["costs"].values, model.calculate_cost_impacts().values
+    )
+    np.testing.assert_array_equal(
+        results["impacts"].values, InventoryTwoWheeler(model).calculate_impacts().values
+    )
@@ -0,0 +1,51 @@
+import logging
+
+import numpy as np
+
+from carculator_two_wheeler import *
+from carculator_two_wheeler.model import load_model_stages
+from carculator_two_wheeler.profiling import Profiler
+
+
+def test_nested_stages(caplog):
+    profiler = Profiler()
+
+    with caplog.at_level(logging.DEBUG, logger="carculator_two_wheeler.profiling"):
+        with profiler.stage("outer"):
+            with profiler.stage("inner"):
+                array = np.ones(1_000_000)
+            del array
+
+    inner, outer = profiler.report.records
+    assert (inner.name, inner.parent, inner.depth) == ("inner", "outer", 1)
+    assert (outer.name, outer.parent, outer.depth) == ("outer", None, 0)
+    assert outer.wall_time >= inner.wall_time
+    assert inner.allocated >= 8e6 and inner.peak >= 8e6
+    # the array freed in "outer" still counts in its peak
+    assert outer.peak >= 8e6 > outer.allocated
+
+    assert [r.stage for r in caplog.records] == ["inner", "outer"]
+    assert profiler.report.slowest() == [inner]
+    assert profiler.report.to_dataframe()["stage"].tolist() == ["inner", "outer"]
+
+
+def test_model_and_inventory_stages():
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020]}
+    tip = TwoWheelerInputParameters(scope=scope)
+    tip.static()
+    _, array = fill_xarray_from_input_parameters(tip)
+
+    model = TwoWheelerModel(array, profiler=Profiler(memory=False))
+    model.set_all()
+    ic = InventoryTwoWheeler(model)
+    ic.calculate_impacts()
+
+    report = model.profiler.report
+    assert ic.profiler is model.profiler
+    assert [r.name for r in report.records if r.parent == "set_all"] == [
+        "get_energy_model",
+        *load_model_stages(),
+    ]
+    assert len(report["mass loop, pass 1"]) == 1
+    assert report["add_battery"][0].parent == "fill_in_A_matrix"
+    assert report["solve"][0].allocated is None
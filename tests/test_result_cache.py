@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+
+from carculator_two_wheeler import *
+from carculator_two_wheeler import DATA_DIR
+from carculator_two_wheeler.result_cache import ResultCache, data_versions, run_cached
+
+
+def test_run_cached(tmp_path):
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020]}
+    tip = TwoWheelerInputParameters(scope=scope)
+    tip.static()
+    _, array = fill_xarray_from_input_parameters(tip)
+    cache = ResultCache(tmp_path)
+
+    results = run_cached(array, cache=cache)
+    cached = run_cached(array, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    for name in ("array", "costs", "impacts"):
+        np.testing.assert_array_equal(cached[name].values, results[name].values)
+        assert cached[name].dims == results[name].dims
+        # a stored run is returned as a cached one
+        assert type(cached[name].data) is type(results[name].data)
+        assert not results[name].data.flags.writeable
+
+    # any other input is another run
+    run_cached(array, model_kwargs={"country": "FR"}, impacts=False, cache=cache)
+    assert (cache.misses, len(cache)) == (2, 2)
+
+    # the least recently used run is evicted first
+    cache.max_bytes = cache.size - 1
+    assert len(cache.evict()) == 1
+    assert len(cache) == 1
+
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_unseeded_stochastic_runs_not_cached(tmp_path):
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020]}
+    tip = TwoWheelerInputParameters(scope=scope)
+    tip.stochastic(2, seed=1)
+    _, array = fill_xarray_from_input_parameters(tip)
+    cache = ResultCache(tmp_path)
+
+    with pytest.raises(ValueError):
+        run_cached(array, impacts=False, cache=cache)
+    assert len(cache) == 0
+
+    run_cached(array, model_kwargs={"seed": 1}, impacts=False, cache=cache)
+    run_cached(array, model_kwargs={"seed": 1}, impacts=False, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_data_versions_hash_contents():
+    versions = data_versions()
+    filepath = DATA_DIR / "unavailable_vehicles.yaml"
+    stat = filepath.stat()
+
+    # touching a data file does not change the keys
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    try:
+        assert data_versions() == versions
+    finally:
+        os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from carculator_two_wheeler.sparse_matrix import (
+    StackedSparseBuilder,
+    StackedSparseMatrix,
+)
+
+rng = np.random.default_rng(42)
+dense = np.repeat(np.identity(12)[None], 4, axis=0)
+dense[:, [1, 3, 7], [2, 5, 9]] = -rng.uniform(0, 0.5, (4, 3))
+dense[2:, 0, 11] = -0.3
+A = StackedSparseMatrix.from_dense(dense)
+
+
+def test_round_trip():
+    assert A.shape == dense.shape
+    assert A.nnz == 12 + 4
+    np.testing.assert_array_equal(A.toarray(), dense)
+    np.testing.assert_array_equal(A.matrix(3).toarray(), dense[3])
+
+
+def test_coo_duplicates_are_summed():
+    B = StackedSparseMatrix.from_coo([0, 1, 0], [1, 0, 1], [1.0, 2.0, 3.0], (2, 2, 2))
+    np.testing.assert_array_equal(B.toarray()[1], [[0, 4], [2, 0]])
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        (0,),
+        (slice(None), [1, 3], 2),
+        (slice(None), [1, 3, 7], [2, 5, 9]),
+        (slice(None), slice(None), [11, 2, 2]),
+        np.ix_(np.arange(4), [0, 1, 3], [2, 11]),
+        (1, slice(2, 8), slice(None)),
+    ],
+)
+def test_indexing(key):
+    np.testing.assert_array_equal(A[key], dense[key])
+
+
+def test_stacked_dimensions():
+    years = np.stack([dense, dense * 2], axis=-1)
+    C = StackedSparseMatrix.from_dense(years)
+
+    assert C.nnz == A.nnz
+    np.testing.assert_array_equal(C[:, [1, 3], 2], years[:, [1, 3], 2])
+    np.testing.assert_array_equal(C[0, ..., 1], years[0, ..., 1])
+    np.testing.assert_allclose(C.solve(np.ones(12), 2, 1), A.solve(np.ones(12), 2) / 2)
+
+
+def test_solve():
+    rhs = np.identity(12)[:, [0, 1, 3]]
+    for value in range(4):
+        np.testing.assert_allclose(
+            A.solve(rhs, value), np.linalg.solve(dense[value], rhs)
+        )
+
+
+def test_no_item_assignment():
+    with pytest.raises(TypeError):
+        A[:, 0, 0] = 1
+
+
+def test_set_entries():
+    B = StackedSparseMatrix.from_dense(dense)
+    B.factorized(0)
+    expected = dense.copy()
+
+    # one entry of the pattern, one outside of it, one zero outside of it
+    values = rng.uniform(0, 1, (4, 3))
+    values[:, 2] = 0
+    B.set_entries([1, 4, 6], [2, 8, 0], values)
+    expected[:, [1, 4, 6], [2, 8, 0]] = values
+
+    assert B.nnz == A.nnz + 1
+    np.testing.assert_array_equal(B.toarray(), expected)
+    np.testing.assert_allclose(
+        B.solve(np.ones(12), 0), np.linalg.solve(expected[0], np.ones(12))
+    )
+
+
+def test_builder():
+    years = np.stack([dense, dense * 2], axis=-1)
+    builder = StackedSparseBuilder(years.shape, years.dtype)
+    builder.add(np.arange(12), np.arange(12), np.ones((1, 12, 1)))
+    expected = np.zeros_like(years)
+    expected[:, np.arange(12), np.arange(12)] = 1
+
+    # the last write of a cell wins, partial writes keep the other years
+    for key, value in [
+        ((slice(None), [1, 3, 7], [2, 5, 9]), years[:, [1, 3, 7], [2, 5, 9]]),
+        ((slice(None), [0, 0], 11), years[:, [0, 0], 11]),
+        ((slice(None), 3, [5, 6], 1), -0.1),
+        (np.ix_(np.arange(4), [0, 4], [11, 2]), 0),
+    ]:
+        builder[key] = value
+        expected[key] = value
+        np.testing.assert_array_equal(builder[key], expected[key])
+
+    builder[np.ix_(np.arange(4), [4], [11])] += 0.5
+    expected[np.ix_(np.arange(4), [4], [11])] += 0.5
+
+    np.testing.assert_array_equal(builder.matrix(1, 1).toarray(), expected[1, ..., 1])
+
+    C = builder.assemble()
+    C.eliminate_zeros()
+    np.testing.assert_array_equal(C.toarray(), expected)
+    assert C.nnz == StackedSparseMatrix.from_dense(expected).nnz
@@ -0,0 +1,75 @@
+import numpy as np
+import xarray as xr
+
+from carculator_two_wheeler import (
+    TwoWheelerInputParameters,
+    TwoWheelerModel,
+    fill_xarray_from_input_parameters,
+)
+from carculator_two_wheeler.streaming import (
+    OnlineSummary,
+    QuantileSketch,
+    run_in_chunks,
+)
+
+
+def test_online_summary_matches_full_sample():
+    rng = np.random.default_rng(42)
+    data = xr.DataArray(
+        rng.triangular(0.7, 1, 1.3, (3, 4, 2000)), dims=["size", "year", "value"]
+    )
+
+    summary, other = OnlineSummary(), OnlineSummary()
+    for i in range(0, 1000, 100):
+        summary.update(data.isel(value=slice(i, i + 100)))
+        other.update(data.isel(value=slice(1000 + i, 1100 + i)))
+    summary.merge(other)
+
+    assert summary.count == 2000
+    np.testing.assert_allclose(summary.mean(), data.mean(dim="value"))
+    np.testing.assert_allclose(summary.variance(), data.var(dim="value", ddof=1))
+    np.testing.assert_allclose(
+        summary.quantile(0.5), data.quantile(0.5, dim="value"), atol=0.03
+    )
+
+
+def test_quantile_sketch_accuracy_across_levels():
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(0, 1, (2, 20000))
+
+    sketch = QuantileSketch(k=64)
+    for i in range(0, 20000, 500):
+        sketch.update(samples[:, i : i + 500])
+
+    assert len(sketch.levels) > 3
+    assert sketch.count == 20000
+
+    q = [0.05, 0.25, 0.5, 0.75, 0.95]
+    estimates = sketch.quantile(q)
+    assert estimates.shape == (2, 5)
+
+    # rank error of the order of 1/k
+    ranks = (samples[:, None, :] <= estimates[..., None]).mean(axis=-1)
+    np.testing.assert_allclose(ranks, np.broadcast_to(q, ranks.shape), atol=0.03)
+
+
+def test_chunked_run_matches_in_memory_run():
+    scope = {"size": ["Scooter <4kW"], "powertrain": ["BEV"], "year": [2020]}
+    summaries = run_in_chunks(
+        6, chunk_size=4, seed=42, impacts=False, model_kwargs={"scope": scope}
+    )
+
+    tip = TwoWheelerInputParameters()
+    tip.stochastic(6, seed=42)
+    _, array = fill_xarray_from_input_parameters(tip)
+    model = TwoWheelerModel(array, seed=42, scope=scope)
+    model.set_all()
+    costs = model.calculate_cost_impacts()
+
+    assert summaries["costs"].count == 6
+    np.testing.assert_allclose(
+        summaries["costs"].mean(), costs.mean(dim="value"), rtol=1e-6
+    )
+    np.testing.assert_allclose(
+        summaries["costs"].variance(), costs.var(dim="value", ddof=1), rtol=1e-5
+    )